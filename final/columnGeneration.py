@@ -0,0 +1,399 @@
+# Column generation for the inspection schedules: every column of the master
+# problem is a complete duty of an inspector, from the base back to the base
+
+import time
+import numpy as np
+from scipy.sparse import *
+
+from solverBackend import *
+from graph import *
+from readInspectorData import *
+from gurobi import *
+
+# smallest reduced cost of a new duty
+REDUCED_COST_EPSILON = 1e-6
+
+
+def price_duties(event_graph, adjacency, base, working_hours, arc_weights, max_duties=5,
+                 start_window=None):
+    """Find the duties from the base back to the base within the working
+    hours with the largest total arc weight (a resource-constrained longest
+    path on the time-expanded graph), at most one per start event
+
+    The working time of a duty only depends on its first and last event, so
+    every node is labelled with the weight of the longest path to it from
+    each start event at the base; the labels of all start events are kept in
+    one array and updated at once along every arc, in topological order. A
+    node only keeps the start events from which it can return to the base
+    before the end of the shift, which are consecutive in time. A start
+    window only restricts the start events; the duties may end at any event
+    at the base.
+
+    Attributes:
+        event_graph : TimeExpandedGraph
+        adjacency : (times, heads, out_ptr, out_arcs) lists of the event_graph
+        base : station of the inspectors
+        working_hours : max working hours of the inspectors
+        arc_weights : list with the weight of every arc of the event_graph
+        max_duties : maximum number of duties to return
+        start_window : (first, last) times of the start events of the duties,
+                       None for all start events
+
+    Return a list of (weight, list of arc ids) of the best duties, sorted by
+    decreasing weight
+    """
+    if not base in event_graph.stations:
+        return []
+    times, heads, out_ptr, out_arcs = adjacency
+    limit = working_hours * HOUR_TO_MINUTES
+
+    # events at the base, where duties end, and start events, by time
+    base_events = np.flatnonzero(event_graph.station == event_graph.stations.index(base))
+    base_events = base_events[np.argsort(event_graph.time[base_events], kind='stable')]
+    end_events = set(base_events.tolist())
+    starts = base_events
+    if start_window is not None:
+        starts = starts[(event_graph.time[starts] >= start_window[0]) &
+                        (event_graph.time[starts] < start_window[1])]
+    start_index = {s: j for j, s in enumerate(starts.tolist())}
+
+    # labels of node v are for the start events lo[v]:hi[v]
+    latest_departure, earliest_return = depot_time_window(event_graph, base)
+    nodes = np.flatnonzero(latest_departure + limit >= earliest_return)
+    start_times = event_graph.time[starts]
+    lo = dict(zip(nodes.tolist(), np.searchsorted(
+        start_times, earliest_return[nodes] - limit, 'left').tolist()))
+    hi = dict(zip(nodes.tolist(), np.searchsorted(
+        start_times, event_graph.time[nodes], 'right').tolist()))
+
+    weights = dict()  # weight of the longest path from every start event
+    parent_arcs = dict()  # last arc of these paths
+    best_weights = np.zeros(len(starts))  # best duty from every start event
+    best_ends = np.full(len(starts), -1)
+    for v in nodes.tolist():
+        if v in start_index:
+            if not v in weights:
+                weights[v] = np.full(hi[v] - lo[v], -np.inf)
+                parent_arcs[v] = np.full(hi[v] - lo[v], -1)
+            weights[v][start_index[v] - lo[v]] = 0.0
+
+        if v in end_events and v in weights:
+            # duties ending at v
+            better = weights[v] > best_weights[lo[v]:hi[v]]
+            best_weights[lo[v]:hi[v]][better] = weights[v][better]
+            best_ends[lo[v]:hi[v]][better] = v
+
+        if not v in weights:
+            continue
+        weight_v = weights.pop(v)
+        for a in out_arcs[out_ptr[v]:out_ptr[v + 1]]:
+            w = heads[a]
+            if not w in lo:
+                continue
+            first, last = max(lo[v], lo[w]), min(hi[v], hi[w])
+            if first >= last:
+                continue
+            if not w in weights:
+                weights[w] = np.full(hi[w] - lo[w], -np.inf)
+                parent_arcs[w] = np.full(hi[w] - lo[w], -1)
+            new_weight = weight_v[first - lo[v]:last - lo[v]] + arc_weights[a]
+            weight_w = weights[w][first - lo[w]:last - lo[w]]
+            better = new_weight > weight_w
+            weight_w[better] = new_weight[better]
+            parent_arcs[w][first - lo[w]:last - lo[w]][better] = a
+
+    duties = []
+    for j in np.flatnonzero(best_ends >= 0).tolist():
+        path = []
+        v = best_ends[j]
+        while v != starts[j]:
+            a = parent_arcs[v][j - lo[v]]
+            path.append(a)
+            v = event_graph.tail[a]
+        duties.append((best_weights[j], path[::-1]))
+
+    duties.sort(key=lambda duty: -duty[0])
+    return duties[:max_duties]
+
+
+def create_od_coverage(event_graph, path_store, OD):
+    """Share of the passengers of every OD pair inspected by one inspector on
+    every arc of its path
+
+    Attributes:
+        event_graph : TimeExpandedGraph of the timetable
+        path_store : PathStore of the OD pairs (on the passenger arcs of the
+                     event_graph)
+        OD : ODMatrix on the paths of the path_store
+
+    Return the array with the indices (in the path_store) of the OD pairs
+    with passengers, the array of their numbers of passengers, the sparse
+    coverage matrix (OD pairs x covered arcs) and the array with the
+    event_graph id of every covered arc
+    """
+    counts = np.asarray(OD.counts, dtype=float)
+    od_pairs = np.flatnonzero(counts > 0)
+    arcs = path_store.graph
+    inspected_share = KAPPA * arcs.travel_time / arcs.num_passengers
+    paths = path_store.incidence()[od_pairs]
+    coverage = (paths @ diags(inspected_share)).tocsc()
+    covered = np.flatnonzero(coverage.getnnz(axis=0))
+
+    # event_graph ids of the passenger arcs of the path_store
+    passenger_arcs = np.flatnonzero(event_graph.num_passengers > 0)
+    return od_pairs, counts[od_pairs], coverage[:, covered], passenger_arcs[covered]
+
+
+def duty_schedule_rows(event_graph, duty, k):
+    """Rows (start_station_and_time, end_station_and_time, inspector_id) of
+    the schedule of inspector k working a duty (list of arc ids)"""
+    names = event_graph.names
+    tails = [names[event_graph.tail[a]] for a in duty]
+    heads = [names[event_graph.head[a]] for a in duty]
+    starts = ["source_{}".format(k)] + tails + [heads[-1]]
+    ends = [tails[0]] + heads + ["sink_{}".format(k)]
+    return [(u, v, k) for u, v in zip(starts, ends)]
+
+
+def build_duty_master(model, od_pairs, od_counts, coverage, classes, max_num_inspectors,
+                      inspected=None):
+    """Add the rows of the master problem, without any duty, to the model
+
+    Attributes:
+        model : SolverBackend (see solverBackend.py)
+        od_pairs : array with the indices of the OD pairs
+        od_counts : array with the number of passengers of every OD pair
+        coverage : sparse matrix with the share of the passengers of every OD
+                   pair (row) inspected by one inspector on every arc (column)
+        classes : dict of inspector classes
+        max_num_inspectors : maximum number of inspectors at work
+        inspected : array with the share of the passengers of every OD pair
+                    inspected by duties outside the model, None for zeros
+
+    Return the dict of the M variables and the names of the coverage rows
+    """
+    M = model.add_vars(od_pairs, lb=0, ub=1, obj=od_counts,
+                       vtype=CONTINUOUS, name='M')
+    # number of inspectors on every arc
+    y = model.add_vars(range(coverage.shape[1]), lb=-np.inf, ub=np.inf, obj=0,
+                       vtype=CONTINUOUS, name='y')
+    model.set_maximize()
+
+    # M_od <= sum of the inspected shares along the path of od
+    if inspected is None:
+        inspected = np.zeros(len(od_pairs))
+    model.add_constrs(hstack([identity(len(od_pairs)), -coverage]),
+                      list(M.values()) + list(y.values()), LESS_EQUAL,
+                      inspected, 'minimum_constr_path')
+    # y_a = number of duties on arc a (the duties are added as columns)
+    model.add_constrs(identity(coverage.shape[1]), list(y.values()), EQUAL,
+                      np.zeros(coverage.shape[1]), 'arc_coverage')
+    for c, vals in classes.items():
+        model.add_constr([], [], LESS_EQUAL, vals['size'], 'class_{}'.format(c))
+    model.add_constr([], [], LESS_EQUAL, max_num_inspectors,
+                     'Max_Inspector_Constraint')
+
+    return M, ['arc_coverage[{}]'.format(j) for j in range(coverage.shape[1])]
+
+
+def add_duties(model, duties, classes, coverage_row, vtype):
+    """Add duties as columns of the master problem
+
+    Attributes:
+        model : SolverBackend (see solverBackend.py)
+        duties : list of (class id, list of arc ids) of the duties
+        classes : dict of inspector classes
+        coverage_row : dict of arc id and name of its coverage row
+        vtype : CONTINUOUS or INTEGER
+    """
+    columns = []
+    for c, arcs in duties:
+        rows = [coverage_row[a] for a in arcs if a in coverage_row]
+        columns.append((rows + ['class_{}'.format(c), 'Max_Inspector_Constraint'],
+                        [-1] * len(rows) + [1, 1]))
+    return model.add_vars(range(model.num_vars(), model.num_vars() + len(duties)),
+                          lb=0, ub=[classes[c]['size'] for c, arcs in duties],
+                          obj=0, vtype=vtype, name='duty', columns=columns)
+
+
+def generate_duties(event_graph, path_store, OD, classes, max_num_inspectors,
+                    solver='gurobi', max_iterations=100, duties_per_class=5,
+                    od_coverage=None, inspected=None, start_window=None):
+    """Solve the LP relaxation of the duty master problem by column
+    generation, with columns priced by price_duties for every class of
+    inspectors with the same base and working hours
+
+    Attributes:
+        event_graph : TimeExpandedGraph of the timetable
+        path_store : PathStore of the OD pairs (on the passenger arcs of the
+                     event_graph)
+        OD : origin-destination matrix
+        classes : dict of inspector classes (see create_inspector_classes)
+        max_num_inspectors : maximum number of inspectors at work
+        solver : name of the LP solver (see solverBackend.py)
+        max_iterations : maximum number of column generation iterations
+        duties_per_class : maximum number of new duties per class and iteration
+        od_coverage : result of create_od_coverage, found if None
+        inspected : share of the passengers of every OD pair inspected by
+                    other duties (see build_duty_master)
+        start_window : (first, last) times of the start of the duties (see
+                       price_duties)
+
+    Return the list of (class, list of arc ids) of the generated duties
+    """
+    if od_coverage is None:
+        od_coverage = create_od_coverage(event_graph, path_store, OD)
+    od_pairs, od_counts, coverage, passenger_arcs = od_coverage
+
+    adjacency = (event_graph.time.tolist(), event_graph.head.tolist(),
+                 event_graph.out_ptr.tolist(), event_graph.out_arcs.tolist())
+
+    model = create_backend(solver, "DUTY_MASTER_LP")
+    model.set_param('output', 0)
+    M, coverage_rows = build_duty_master(model, od_pairs, od_counts, coverage,
+                                         classes, max_num_inspectors, inspected)
+    coverage_row = dict(zip(passenger_arcs.tolist(), coverage_rows))
+    class_rows = ['class_{}'.format(c) for c in classes]
+
+    duties = []
+    known_duties = set()
+    for iteration in range(1, max_iterations + 1):
+        model.optimize()
+
+        # weight of every arc (dual value of its coverage row)
+        arc_weights = np.zeros(event_graph.number_of_arcs())
+        arc_weights[passenger_arcs] = model.get_duals(coverage_rows)
+        arc_weights = arc_weights.tolist()
+        class_duals = dict(zip(classes, model.get_duals(class_rows).tolist()))
+        max_dual = model.get_duals(['Max_Inspector_Constraint'])[0]
+
+        new_duties = []
+        for c, vals in classes.items():
+            for weight, duty in price_duties(event_graph, adjacency, vals['base'],
+                                             vals['working_hours'], arc_weights,
+                                             duties_per_class, start_window):
+                reduced_cost = weight - class_duals[c] - max_dual
+                if reduced_cost > REDUCED_COST_EPSILON and not (c, tuple(duty)) in known_duties:
+                    known_duties.add((c, tuple(duty)))
+                    new_duties.append((c, duty))
+
+        print('Iteration {}: LP bound {:.3f}, {} new duties'.format(
+            iteration, model.objective, len(new_duties)))
+        if not new_duties:
+            break
+        add_duties(model, new_duties, classes, coverage_row, CONTINUOUS)
+        duties.extend(new_duties)
+
+    return duties
+
+
+def choose_duties(classes, duties, max_num_inspectors, od_coverage,
+                  solver='gurobi', mip_gap=0, inspected=None):
+    """Choose the schedules among the given duties by solving the master
+    problem with integer duties
+
+    Attributes:
+        classes : dict of inspector classes (see create_inspector_classes)
+        duties : list of (class, list of arc ids) of the candidate duties
+        max_num_inspectors : maximum number of inspectors at work
+        od_coverage : result of create_od_coverage
+        solver : name of the MIP solver (see solverBackend.py)
+        mip_gap : relative MIP gap
+        inspected : share of the passengers of every OD pair inspected by
+                    other duties (see build_duty_master)
+
+    Return the list of (class, list of arc ids) of the chosen duties, with a
+    duty repeated for every inspector working it
+    """
+    od_pairs, od_counts, coverage, passenger_arcs = od_coverage
+
+    model = create_backend(solver, "DUTY_MASTER")
+    model.set_param('mip_gap', mip_gap)
+    M, coverage_rows = build_duty_master(model, od_pairs, od_counts, coverage,
+                                         classes, max_num_inspectors, inspected)
+    coverage_row = dict(zip(passenger_arcs.tolist(), coverage_rows))
+    duty_vars = add_duties(model, duties, classes, coverage_row, INTEGER)
+    model.optimize()
+
+    chosen = []
+    for duty, value in zip(duties, model.get_values(list(duty_vars.values())).tolist()):
+        chosen.extend([duty] * int(round(value)))
+    return chosen
+
+
+def assign_inspectors(event_graph, classes, chosen):
+    """Assign the inspectors of every class to its chosen duties
+
+    Attributes:
+        event_graph : TimeExpandedGraph of the timetable
+        classes : dict of inspector classes (see create_inspector_classes)
+        chosen : list of (class, list of arc ids) of the chosen duties
+
+    Return the rows of the schedules (see duty_schedule_rows)
+    """
+    free_inspectors = {c: list(vals['inspectors']) for c, vals in classes.items()}
+    rows = []
+    for c, duty in chosen:
+        rows.extend(duty_schedule_rows(event_graph, duty, free_inspectors[c].pop(0)))
+    return rows
+
+
+def inspected_passengers(od_coverage, chosen):
+    """Expected number of passengers inspected by the chosen duties
+
+    Attributes:
+        od_coverage : result of create_od_coverage
+        chosen : list of (class, list of arc ids) of the chosen duties, with
+                 a duty repeated for every inspector working it
+    """
+    od_pairs, od_counts, coverage, passenger_arcs = od_coverage
+    column_of = {a: j for j, a in enumerate(passenger_arcs.tolist())}
+    counts = np.bincount([column_of[a] for c, duty in chosen for a in duty if a in column_of],
+                         minlength=coverage.shape[1])
+    return (np.asarray(od_counts) * np.minimum(coverage @ counts, 1)).sum()
+
+
+def solve_by_column_generation(event_graph, path_store, OD, inspectors,
+                               max_num_inspectors, solver='gurobi', mip_gap=0,
+                               max_iterations=100, duties_per_class=5):
+    """Schedule the inspectors with a path-based master problem, whose columns
+    are complete duties, priced by price_duties for every class of inspectors
+    with the same base and working hours
+
+    The LP relaxation is solved by column generation; its final value is an
+    upper bound. The schedules are then chosen by solving the master problem
+    with integer duties over the generated columns.
+
+    Attributes:
+        event_graph : TimeExpandedGraph of the timetable
+        path_store : PathStore of the OD pairs (on the passenger arcs of the
+                     event_graph)
+        OD : origin-destination matrix
+        inspectors : dict of inspectors
+        max_num_inspectors : maximum number of inspectors at work
+        solver : name of the MIP solver (see solverBackend.py)
+        mip_gap : relative MIP gap of the final integer problem
+        max_iterations : maximum number of column generation iterations
+        duties_per_class : maximum number of new duties per class and iteration
+
+    Return the schedules in the same format as print_solution_paths
+    """
+    print("Column generation ...")
+    t1 = time.time()
+
+    classes = create_inspector_classes(inspectors)
+    duties = generate_duties(event_graph, path_store, OD, classes,
+                             max_num_inspectors, solver, max_iterations,
+                             duties_per_class)
+    od_coverage = create_od_coverage(event_graph, path_store, OD)
+    chosen = choose_duties(classes, duties, max_num_inspectors, od_coverage,
+                           solver, mip_gap)
+    rows = assign_inspectors(event_graph, classes, chosen)
+    write_schedule_csv(rows, "schedule_for_{}_inspectors.csv".format(len(inspectors)))
+
+    t2 = time.time()
+    print('Column generation finished with {} duties. Took {:.5f} seconds'.format(
+        len(duties), t2 - t1))
+    print('Schedules for {} inspectors inspect {:.3f} passengers'.format(
+        len(chosen), inspected_passengers(od_coverage, chosen)))
+    return schedule_frame(rows)
@@ -0,0 +1,288 @@
+# Decomposition of the scheduling problem into regions of depots, which are
+# solved in parallel processes and then combined and rebalanced
+
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from scipy.sparse import *
+
+from graph import *
+from readInspectorData import *
+from columnGeneration import *
+from lagrangianRelaxation import *
+
+# maximum number of rounds in which the regions are solved again with the
+# schedules of the other regions fixed
+COORDINATION_ROUNDS = 3
+
+# smallest improvement of the objective in a coordination round
+IMPROVEMENT_EPSILON = 1e-6
+
+# data shared by all regions, set once in every worker process
+_region_data = None
+
+
+def find_depot_arcs(event_graph, inspectors):
+    """Find the arcs the inspectors of every depot can use (see
+    find_reachable_arcs), with the longest working hours at the depot
+
+    Attributes:
+        event_graph : TimeExpandedGraph of the timetable
+        inspectors : dict of inspectors
+
+    Return the sorted list of depots and a sparse boolean matrix with one row
+    for every depot and one column for every arc
+    """
+    max_hours = dict()
+    for vals in inspectors.values():
+        max_hours[vals['base']] = max(max_hours.get(vals['base'], 0),
+                                      vals['working_hours'])
+
+    depots = sorted(max_hours)
+    rows = []
+    for depot in depots:
+        latest_departure, earliest_return = depot_time_window(event_graph, depot)
+        duration = earliest_return[event_graph.head] - \
+            latest_departure[event_graph.tail]
+        rows.append(csr_matrix(duration <= max_hours[depot] * HOUR_TO_MINUTES))
+    return depots, vstack(rows, format='csr', dtype=bool)
+
+
+def partition_depots(event_graph, inspectors, num_regions):
+    """Group the depots into at most num_regions regions whose reachable arc
+    sets barely overlap
+
+    Starting from one region per depot, the two regions sharing the largest
+    part of the arcs of the smaller one are merged until there are few enough
+    regions. Merges that give a region more than its share of the inspector
+    classes (the pricing work) are only made if no other merge is left.
+
+    Attributes:
+        event_graph : TimeExpandedGraph of the timetable
+        inspectors : dict of inspectors
+        num_regions : maximum number of regions
+
+    Return a list of regions, each a list of depots
+    """
+    print("Partitioning depots into regions...", end=" ")
+    t1 = time.time()
+
+    depots, depot_arcs = find_depot_arcs(event_graph, inspectors)
+    classes = create_inspector_classes(inspectors)
+    load = [sum(1 for vals in classes.values() if vals['base'] == depot)
+            for depot in depots]
+    max_load = int(np.ceil(len(classes) / max(num_regions, 1)))
+
+    regions = [[depot] for depot in depots]
+    region_arcs = [depot_arcs[i] for i in range(len(depots))]
+    shared = (depot_arcs @ depot_arcs.T).toarray().astype(float)
+    while len(regions) > max(num_regions, 1):
+        sizes = np.diag(shared)
+        overlap = shared / np.maximum(np.minimum.outer(sizes, sizes), 1)
+        combined_load = np.add.outer(load, load)
+        np.fill_diagonal(overlap, -np.inf)
+        allowed = combined_load <= max_load
+        np.fill_diagonal(allowed, False)
+        if allowed.any():
+            overlap[~allowed] = -np.inf
+        # largest overlap first, then smallest load
+        candidates = np.flatnonzero(overlap == overlap.max())
+        i, j = np.unravel_index(
+            candidates[np.argmin(combined_load.ravel()[candidates])], overlap.shape)
+
+        regions[i].extend(regions[j])
+        load[i] += load[j]
+        region_arcs[i] = region_arcs[i].maximum(region_arcs[j])
+        del regions[j], load[j], region_arcs[j]
+        shared = np.delete(np.delete(shared, j, axis=0), j, axis=1)
+        i -= j < i
+        shared[i, :] = shared[:, i] = (
+            vstack(region_arcs) @ region_arcs[i].T).toarray().ravel()
+
+    t2 = time.time()
+    print('Finished! Took {:.5f} seconds'.format(t2 - t1))
+
+    sizes = sum(arcs.nnz for arcs in region_arcs)
+    if sizes:
+        union = vstack(region_arcs).max(axis=0).nnz
+        print('{} depots in {} regions, {:.1f}% of their arcs are shared'.format(
+            len(depots), len(regions), 100 * (sizes - union) / sizes))
+    return regions
+
+
+def _init_region_worker(event_graph, path_store, OD):
+    """Keep the data shared by all regions in the worker process"""
+    global _region_data
+    _region_data = (event_graph, path_store, OD,
+                    create_od_coverage(event_graph, path_store, OD))
+
+
+def _solve_region(region_inspectors, max_num_inspectors, solver, mip_gap,
+                  max_iterations, duties_per_class, inspected=None, current=()):
+    """Generate the duties of the inspectors of one region by column
+    generation and choose the schedules of the region among them and its
+    current duties (in a worker process)
+
+    Attributes:
+        region_inspectors : dict of the inspectors of the region
+        max_num_inspectors : maximum number of inspectors of the region at work
+        inspected : share of the passengers of every OD pair inspected by
+                    the other regions, None for zeros
+        current : list of ((base, working_hours), list of arc ids) of the
+                  current duties of the region
+
+    Return two lists of ((base, working_hours), list of arc ids): the
+    generated duties and the chosen ones
+    """
+    event_graph, path_store, OD, od_coverage = _region_data
+    classes = create_inspector_classes(region_inspectors)
+    duties = generate_duties(event_graph, path_store, OD, classes,
+                             max_num_inspectors, solver, max_iterations,
+                             duties_per_class, od_coverage, inspected)
+    class_of = {(vals['base'], vals['working_hours']): c
+                for c, vals in classes.items()}
+    candidates = duties + [(class_of[key], duty) for key, duty in current
+                           if not (class_of[key], duty) in duties]
+    chosen = choose_duties(classes, candidates, max_num_inspectors, od_coverage,
+                           solver, mip_gap, inspected)
+    return ([((classes[c]['base'], classes[c]['working_hours']), duty)
+             for c, duty in duties],
+            [((classes[c]['base'], classes[c]['working_hours']), duty)
+             for c, duty in chosen])
+
+
+def solve_by_decomposition(event_graph, path_store, OD, inspectors,
+                           max_num_inspectors, num_regions, solver='gurobi',
+                           mip_gap=0, max_iterations=100, duties_per_class=5,
+                           max_rounds=COORDINATION_ROUNDS):
+    """Schedule the inspectors region by region: the depots are partitioned
+    into regions with partition_depots, and every region generates its
+    duties by column generation and chooses its schedules with its own
+    integer master problem, in a separate process
+
+    The schedules of the regions are combined by repair_schedules, which
+    drops duties while there are more than max_num_inspectors and then swaps
+    duties between the regions while that inspects more passengers (the
+    regions share a few arcs, whose passengers are only counted once). Then,
+    in every coordination round, the regions solve their problems again in
+    parallel with the passengers inspected by the other regions fixed and
+    with the inspectors the others leave, and the new schedules are
+    combined in the same way, until a round brings no improvement.
+
+    Attributes:
+        event_graph : TimeExpandedGraph of the timetable
+        path_store : PathStore of the OD pairs (on the passenger arcs of the
+                     event_graph)
+        OD : origin-destination matrix
+        inspectors : dict of inspectors
+        max_num_inspectors : maximum number of inspectors at work
+        num_regions : maximum number of regions (and of worker processes)
+        solver : name of the MIP solver (see solverBackend.py)
+        mip_gap : relative MIP gap of the region problems
+        max_iterations : maximum number of column generation iterations
+        duties_per_class : maximum number of new duties per class and iteration
+        max_rounds : maximum number of coordination rounds
+
+    Return the schedules in the same format as print_solution_paths
+    """
+    regions = partition_depots(event_graph, inspectors, num_regions)
+
+    print("Solving {} regions ...".format(len(regions)))
+    t1 = time.time()
+
+    classes = create_inspector_classes(inspectors)
+    class_of = {(vals['base'], vals['working_hours']): c
+                for c, vals in classes.items()}
+    region_of = {c: r for r, region in enumerate(regions)
+                 for c, vals in classes.items() if vals['base'] in region}
+    region_inspectors = [{k: vals for k, vals in inspectors.items()
+                          if vals['base'] in region} for region in regions]
+
+    od_pairs, od_counts, coverage, covered_arcs = create_od_coverage(
+        event_graph, path_store, OD)
+    column_of = {a: j for j, a in enumerate(covered_arcs.tolist())}
+
+    # duties of all regions, and the index of every duty in them
+    duty_pool = []
+    duty_index = dict()
+
+    def add_to_pool(duties):
+        indices = []
+        for key, duty in duties:
+            c = class_of[key]
+            if not (c, tuple(duty)) in duty_index:
+                duty_index[c, tuple(duty)] = len(duty_pool)
+                duty_pool.append((c, duty))
+            indices.append(duty_index[c, tuple(duty)])
+        return indices
+
+    def pool_key(j):
+        vals = classes[duty_pool[j][0]]
+        return vals['base'], vals['working_hours']
+
+    def duty_shares(indices):
+        """Inspected share of every OD pair by the given duties"""
+        cols = [column_of[a] for j in indices for a in duty_pool[j][1]
+                if a in column_of]
+        return coverage @ np.bincount(cols, minlength=coverage.shape[1])
+
+    num_workers = min(len(regions), os.cpu_count() or 1)
+    with ProcessPoolExecutor(num_workers, initializer=_init_region_worker,
+                             initargs=(event_graph, path_store, OD)) as pool:
+        futures = [pool.submit(_solve_region, region,
+                               min(len(region), max_num_inspectors), solver,
+                               mip_gap, max_iterations, duties_per_class)
+                   for region in region_inspectors]
+        start = []
+        for future in futures:
+            duties, chosen = future.result()
+            add_to_pool(duties)
+            start.extend(add_to_pool(chosen))
+        chosen, objective = repair_schedules(
+            duty_pool, classes, coverage, column_of, od_counts,
+            max_num_inspectors, start)
+        print('Round 0: {} duties, schedules inspect {:.3f} passengers'.format(
+            len(duty_pool), objective))
+
+        for coordination_round in range(1, max_rounds + 1):
+            inspected = duty_shares(chosen)
+            futures = []
+            for r, region in enumerate(region_inspectors):
+                own = [j for j in chosen if region_of[duty_pool[j][0]] == r]
+                others = len(chosen) - len(own)
+                futures.append(pool.submit(
+                    _solve_region, region,
+                    min(len(region), max_num_inspectors - others), solver,
+                    mip_gap, max_iterations, duties_per_class,
+                    inspected - duty_shares(own),
+                    [(pool_key(j), duty_pool[j][1]) for j in own]))
+            start = []
+            for future in futures:
+                duties, region_chosen = future.result()
+                add_to_pool(duties)
+                start.extend(add_to_pool(region_chosen))
+
+            # the new schedules of all regions, and the last ones with the
+            # new duties to swap in
+            best_chosen, best = chosen, objective
+            for schedules in (start, chosen):
+                new_chosen, new_objective = repair_schedules(
+                    duty_pool, classes, coverage, column_of, od_counts,
+                    max_num_inspectors, schedules)
+                if new_objective > best + IMPROVEMENT_EPSILON:
+                    best_chosen, best = new_chosen, new_objective
+            print('Round {}: {} duties, schedules inspect {:.3f} passengers'.format(
+                coordination_round, len(duty_pool), best))
+            if best <= objective + IMPROVEMENT_EPSILON:
+                break
+            chosen, objective = best_chosen, best
+
+    rows = assign_inspectors(event_graph, classes, [duty_pool[j] for j in chosen])
+    write_schedule_csv(rows, "schedule_for_{}_inspectors.csv".format(len(inspectors)))
+
+    t2 = time.time()
+    print('Decomposition finished. Took {:.5f} seconds'.format(t2 - t1))
+    print('Schedules for {} inspectors inspect {:.3f} passengers'.format(
+        len(chosen), objective))
+    return schedule_frame(rows)
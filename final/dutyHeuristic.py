@@ -0,0 +1,104 @@
+# Greedy construction of inspection schedules, one duty at a time, without a
+# MIP solver
+
+from heapq import heappush, heappop
+import time
+import numpy as np
+
+from graph import *
+from readInspectorData import *
+from columnGeneration import *
+
+# smallest gain of a new duty
+GAIN_EPSILON = 1e-6
+
+
+def greedy_duty_schedules(event_graph, path_store, OD, inspectors,
+                          max_num_inspectors, duties_per_class=5):
+    """Give the inspectors duties one after the other, each time the duty
+    with the largest increase of the objective (the number of inspected
+    passengers)
+
+    The candidate duties of every class of inspectors with the same base and
+    working hours are the longest paths of price_duties, with the objective
+    linearised at the current schedules as arc weights (the passengers of
+    the OD pairs not yet fully inspected). As the gains only decrease when
+    duties are added, the classes are kept in a heap by their last gain and
+    only the class on top is priced again (lazy greedy).
+
+    Attributes:
+        event_graph : TimeExpandedGraph of the timetable
+        path_store : PathStore of the OD pairs (on the passenger arcs of the
+                     event_graph)
+        OD : origin-destination matrix
+        inspectors : dict of inspectors
+        max_num_inspectors : maximum number of inspectors at work
+        duties_per_class : number of candidate duties per class and step
+
+    Return the schedules in the same format as print_solution_paths
+    """
+    print("Greedy duty heuristic ...", end=" ")
+    t1 = time.time()
+
+    classes = create_inspector_classes(inspectors)
+    od_pairs, od_counts, coverage, covered_arcs = create_od_coverage(
+        event_graph, path_store, OD)
+    od_counts = np.array(od_counts)
+    column_of = {a: j for j, a in enumerate(covered_arcs.tolist())}
+    adjacency = (event_graph.time.tolist(), event_graph.head.tolist(),
+                 event_graph.out_ptr.tolist(), event_graph.out_arcs.tolist())
+
+    # inspected share of every OD pair and objective of the schedules so far
+    inspected = np.zeros(len(od_pairs))
+    objective = 0.0
+    arc_weights = None
+
+    def best_duty(c):
+        """Duty of class c with the largest gain, its gain and the new
+        inspected shares"""
+        best = (0.0, None, None)
+        for weight, duty in price_duties(event_graph, adjacency, classes[c]['base'],
+                                         classes[c]['working_hours'], arc_weights,
+                                         duties_per_class):
+            cols = [column_of[a] for a in duty if a in column_of]
+            new_inspected = inspected + coverage[:, cols].sum(axis=1).A1
+            gain = (od_counts * np.minimum(new_inspected, 1)).sum() - objective
+            if gain > best[0]:
+                best = (gain, duty, new_inspected)
+        return best
+
+    free_inspectors = {c: list(vals['inspectors']) for c, vals in classes.items()}
+    heap = [(-np.inf, c) for c in classes]
+    rows = []
+    num_scheduled = 0
+    while heap and num_scheduled < max_num_inspectors:
+        bound, c = heappop(heap)
+        if arc_weights is None:
+            # passengers of the OD pairs not yet fully inspected, per arc
+            arc_weights = np.zeros(event_graph.number_of_arcs())
+            arc_weights[covered_arcs] = coverage.T @ (od_counts * (inspected < 1))
+            arc_weights = arc_weights.tolist()
+
+        gain, duty, new_inspected = best_duty(c)
+        if gain <= GAIN_EPSILON:
+            continue  # no gain for this class any more
+        if heap and gain < -heap[0][0]:
+            heappush(heap, (-gain, c))  # another class may gain more
+            continue
+
+        k = free_inspectors[c].pop(0)
+        rows.extend(duty_schedule_rows(event_graph, duty, k))
+        num_scheduled += 1
+        objective += gain
+        inspected = new_inspected
+        arc_weights = None
+        if free_inspectors[c]:
+            heappush(heap, (-gain, c))
+
+    write_schedule_csv(rows, "schedule_for_{}_inspectors.csv".format(len(inspectors)))
+
+    t2 = time.time()
+    print('Finished! Took {:.5f} seconds'.format(t2 - t1))
+    print('Greedy schedules for {} inspectors inspect {:.3f} passengers'.format(
+        num_scheduled, objective))
+    return schedule_frame(rows)
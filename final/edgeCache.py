@@ -0,0 +1,117 @@
+# On-disk cache of the edges extracted from the xml timetable
+#
+# Edges are stored column-wise in a NumPy .npz file, with stations and
+# timestamps replaced by indices into name tables. A cache file is keyed by
+# the content hash of the timetable, the chosen day and the parser version,
+# so a changed timetable or parser never hits a stale file.
+
+import hashlib
+import os
+import time
+
+import numpy as np
+
+from xmlParser import *
+
+CACHE_DIR = '.timetable_cache'
+
+
+def timetable_hash(timetable):
+    """SHA-1 hex digest of the content of the xml timetable file"""
+    sha = hashlib.sha1()
+    with open(timetable, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+def cache_file_name(timetable, chosen_day, cache_dir=CACHE_DIR):
+    """Name of the cache file for the timetable on the chosen day"""
+    return os.path.join(cache_dir, '{}_{}_v{}.npz'.format(
+        timetable_hash(timetable), chosen_day, PARSER_VERSION))
+
+
+def save_edges(file_name, all_edges, stations):
+    """Write the edges and the station set to a .npz cache file
+
+    Attributes:
+        file_name : name of the cache file
+        all_edges : list of 6-tuples (from, depart, to, arrival, num passengers, time)
+        stations : stations involved in the timetable
+    """
+    station_idx = {station: i for i, station in enumerate(stations)}
+    timestamp_idx = {}
+    for edge in all_edges:
+        for indx in [1, 3]:
+            timestamp_idx.setdefault(edge[indx], len(timestamp_idx))
+
+    columns = list(zip(*all_edges)) if all_edges else [()] * 6
+
+    directory = os.path.dirname(file_name)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+
+    # write to a temporary file first, so an interrupted run leaves no
+    # truncated cache behind
+    tmp_file_name = file_name + '.tmp'
+    with open(tmp_file_name, 'wb') as f:
+        np.savez(f,
+                 stations=np.array(list(station_idx), dtype=str),
+                 timestamps=np.array(list(timestamp_idx), dtype=str),
+                 from_station=np.array([station_idx[s] for s in columns[0]],
+                                       dtype=np.int32),
+                 departure=np.array([timestamp_idx[t] for t in columns[1]],
+                                    dtype=np.int32),
+                 to_station=np.array([station_idx[s] for s in columns[2]],
+                                     dtype=np.int32),
+                 arrival=np.array([timestamp_idx[t] for t in columns[3]],
+                                  dtype=np.int32),
+                 num_passengers=np.array(columns[4], dtype=np.int32),
+                 travel_time=np.array(columns[5], dtype=np.int32))
+    os.replace(tmp_file_name, file_name)
+
+
+def load_edges(file_name):
+    """Read the edges and the station set back from a .npz cache file
+
+    Return a list of 6-tuples and the list of stations
+    """
+    with np.load(file_name, allow_pickle=False) as data:
+        stations = data['stations'].tolist()
+        timestamps = data['timestamps'].tolist()
+
+        all_edges = list(zip(
+            [stations[i] for i in data['from_station'].tolist()],
+            [timestamps[i] for i in data['departure'].tolist()],
+            [stations[i] for i in data['to_station'].tolist()],
+            [timestamps[i] for i in data['arrival'].tolist()],
+            data['num_passengers'].tolist(),
+            data['travel_time'].tolist()))
+
+    return all_edges, stations
+
+
+def extract_edges_with_cache(timetable, chosen_day, cache_dir=CACHE_DIR, streaming=False):
+    """Same as extract_edges_from_timetable, but reuse the edges extracted by
+    an earlier run on the same timetable and day when they are cached
+
+    Attributes:
+        timetable : the xml timetable file
+        chosen_day : day chosen to produce inspection shedule (e.g., Mon, Tue, etc)
+        cache_dir : directory where the cache files are kept
+        streaming : read the timetable one train at a time (for large files)
+    """
+    file_name = cache_file_name(timetable, chosen_day, cache_dir)
+
+    if os.path.isfile(file_name):
+        print('Loading waiting and driving arcs from cache...', end=' ')
+        t1 = time.time()
+        all_edges, stations = load_edges(file_name)
+        t2 = time.time()
+        print('{} arcs. Took {:.5f} seconds'.format(len(all_edges), t2 - t1))
+        return all_edges, stations
+
+    all_edges, stations = extract_edges_from_timetable(
+        timetable, chosen_day, streaming)
+    save_edges(file_name, all_edges, stations)
+    return all_edges, stations
@@ -0,0 +1,46 @@
+# Event times of the time-expanded graph as integer minutes since Monday 00:00
+#
+# Timestamps in the timetable have the fixed format 'DddHH:MM:SS'
+# (e.g., 'Mon19:53:00'), so they are decoded by slicing instead of parsing.
+
+DAYS = ["Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun"]
+
+MINUTES_PER_HOUR = 60
+MINUTES_PER_DAY = 24 * MINUTES_PER_HOUR
+MINUTES_PER_WEEK = len(DAYS) * MINUTES_PER_DAY
+
+# minutes from Monday 00:00 to the start of each day
+DAY_OFFSETS = {day: i * MINUTES_PER_DAY for i, day in enumerate(DAYS)}
+
+
+def clock_to_minutes(clock):
+    """Convert a clock time 'HH:MM:SS' into minutes since midnight"""
+    return int(clock[:2]) * MINUTES_PER_HOUR + int(clock[3:5])
+
+
+def to_minutes(timestamp, first_day='Mon'):
+    """Convert a timestamp 'DddHH:MM:SS' into minutes since Monday 00:00
+
+    Days of the week before first_day belong to the following week, so that
+    the overnight spill of a Sunday schedule into Monday stays in order.
+
+    Attributes:
+        timestamp : timestamp of an event (e.g., Mon19:53:00)
+        first_day : first day of the planning horizon (e.g., Mon, Tue, etc)
+    """
+    minutes = DAY_OFFSETS[timestamp[:3]] + clock_to_minutes(timestamp[3:])
+    if minutes < DAY_OFFSETS[first_day]:
+        minutes += MINUTES_PER_WEEK
+    return minutes
+
+
+def day_of(minutes):
+    """Name of the day of the week an event time falls on"""
+    return DAYS[(minutes // MINUTES_PER_DAY) % len(DAYS)]
+
+
+def to_timestamp(minutes):
+    """Convert minutes since Monday 00:00 back into a timestamp 'DddHH:MM:SS'"""
+    clock = minutes % MINUTES_PER_DAY
+    return '{}{:02d}:{:02d}:00'.format(
+        day_of(minutes), clock // MINUTES_PER_HOUR, clock % MINUTES_PER_HOUR)
@@ -9,3 +9,13 @@ class CLArgumentsNotMatch(Exception):
 class DayNotFound(Exception):
     """Raised when a selected day is not found"""
     pass
+
+
+class ODMatrixMismatch(Exception):
+    """Raised when a saved OD matrix was estimated on a different graph"""
+    pass
+
+
+class SolverNotAvailable(Exception):
+    """Raised when the Python package of a chosen MIP solver is not installed"""
+    pass
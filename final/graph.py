@@ -2,7 +2,11 @@
 from __future__ import division
 import sys
 import networkx as nx
+import numpy as np
 import time
+from heapq import heapify, heappush, heappop
+
+from eventTime import *
 
 
 def construct_graph_from_file(input_dir, inspectors):
@@ -27,8 +31,10 @@ def construct_graph_from_file(input_dir, inspectors):
             for k in inspectors:
                 flow_var_names.append((start, end, k))
 
-            graph.add_node(start, station=line[0], time_stamp=line[1])
-            graph.add_node(end, station=line[2], time_stamp=line[3])
+            graph.add_node(start, station=line[0], time_stamp=line[1],
+                           time=to_minutes(line[1]))
+            graph.add_node(end, station=line[2], time_stamp=line[3],
+                           time=to_minutes(line[3]))
 
             # we assume a unique edge between events for now
             if not graph.has_edge(start, end):
@@ -41,11 +47,12 @@ def construct_graph_from_file(input_dir, inspectors):
     return graph, flow_var_names
 
 
-def construct_graph_from_edges(all_edges):
+def construct_graph_from_edges(all_edges, first_day='Mon'):
     """ Construct the graph from a list of edges
 
     Attribute:
         all_edges : list of 6-tuples (from, depart, to, arrival, num passengers, time)
+        first_day : day the event times are counted from (e.g., Mon, Tue, etc)
     """
     print("Building graph ...", end=" ")
     t1 = time.time()
@@ -58,8 +65,10 @@ def construct_graph_from_edges(all_edges):
         start = edge[0] + '@' + edge[1]
         end = edge[2] + '@' + edge[3]
 
-        graph.add_node(start, station=edge[0], time_stamp=edge[1])
-        graph.add_node(end, station=edge[2], time_stamp=edge[3])
+        graph.add_node(start, station=edge[0], time_stamp=edge[1],
+                       time=to_minutes(edge[1], first_day))
+        graph.add_node(end, station=edge[2], time_stamp=edge[3],
+                       time=to_minutes(edge[3], first_day))
 
         # we assume a unique edge between events for now
         if not graph.has_edge(start, end):
@@ -70,3 +79,258 @@ def construct_graph_from_edges(all_edges):
     print('Finished! Took {:.5f} seconds'.format(t2 - t1))
 
     return graph  # , flow_var_names
+
+
+def create_station_events_index(graph):
+    """Create a dictionary with stations as keys and the list of their
+    events (nodes with a time stamp), sorted by time, as values
+
+    Attribute:
+        graph : directed graph
+    """
+    index = dict()
+    for node, data in graph.nodes(data=True):
+        if data['time_stamp'] is not None:
+            index.setdefault(data['station'], []).append(node)
+
+    for events in index.values():
+        events.sort(key=lambda node: graph.nodes[node]['time'])
+    return index
+
+
+class TimeExpandedGraph:
+    """Compact time-expanded graph with integer node and arc ids
+
+    Nodes are numbered in topological order (by event time), so ids increase
+    along every arc. Arcs are grouped by tail in the order the nodes first
+    appear in the input, as in the networkx graph built from the same edges.
+
+    Attributes:
+        names : list of node names ('station@time_stamp')
+        stations : list of station names
+        station : array with the station id of every node
+        time : array with the event time of every node (see eventTime.py)
+        tail, head : arrays with the end nodes of every arc
+        num_passengers, travel_time : arrays with the data of every arc
+        out_ptr, out_arcs : arcs leaving node i are out_arcs[out_ptr[i]:out_ptr[i + 1]]
+        in_ptr, in_arcs : arcs entering node i are in_arcs[in_ptr[i]:in_ptr[i + 1]]
+    """
+
+    def __init__(self, names, stations, station, time, tail, head,
+                 num_passengers, travel_time):
+        self.names = names
+        self.stations = stations
+        self.station = station
+        self.time = time
+        self.tail = tail
+        self.head = head
+        self.num_passengers = num_passengers
+        self.travel_time = travel_time
+
+        self.node_idx = {name: i for i, name in enumerate(names)}
+        self.out_ptr, self.out_arcs = _adjacency(tail, len(names))
+        self.in_ptr, self.in_arcs = _adjacency(head, len(names))
+
+    def number_of_nodes(self):
+        return len(self.names)
+
+    def number_of_arcs(self):
+        return len(self.tail)
+
+    def arcs_out(self, i):
+        """Ids of the arcs leaving node i"""
+        return self.out_arcs[self.out_ptr[i]:self.out_ptr[i + 1]]
+
+    def arcs_in(self, i):
+        """Ids of the arcs entering node i"""
+        return self.in_arcs[self.in_ptr[i]:self.in_ptr[i + 1]]
+
+    def successors(self, i):
+        return self.head[self.arcs_out(i)]
+
+    def predecessors(self, i):
+        return self.tail[self.arcs_in(i)]
+
+    def arc_names(self, a):
+        """(u, v) node names of arc a"""
+        return self.names[self.tail[a]], self.names[self.head[a]]
+
+    def find_arc(self, i, j):
+        """Id of the arc from node i to node j, or None"""
+        for a in self.arcs_out(i).tolist():
+            if self.head[a] == j:
+                return a
+        return None
+
+    def arc_subgraph(self, mask):
+        """Graph with the same nodes and only the arcs selected by the mask"""
+        return TimeExpandedGraph(self.names, self.stations, self.station,
+                                 self.time, self.tail[mask], self.head[mask],
+                                 self.num_passengers[mask], self.travel_time[mask])
+
+    def passenger_graph(self):
+        """Graph with only the arcs carrying passengers (no waiting arcs)"""
+        return self.arc_subgraph(self.num_passengers > 0)
+
+    def to_networkx(self):
+        """Equivalent networkx DiGraph with string node names"""
+        graph = nx.DiGraph()
+        for i, name in enumerate(self.names):
+            graph.add_node(name, station=self.stations[self.station[i]],
+                           time_stamp=name.split('@')[1], time=int(self.time[i]))
+        for a in range(self.number_of_arcs()):
+            graph.add_edge(*self.arc_names(a),
+                           num_passengers=int(self.num_passengers[a]),
+                           travel_time=int(self.travel_time[a]))
+        return graph
+
+
+def _adjacency(ends, num_nodes):
+    """CSR index of the arcs grouped by one of their end nodes"""
+    indptr = np.zeros(num_nodes + 1, dtype=np.int64)
+    np.cumsum(np.bincount(ends, minlength=num_nodes), out=indptr[1:])
+    return indptr, np.argsort(ends, kind='stable').astype(np.int32)
+
+
+def _build_time_expanded_graph(names, stations, station, event_times, arcs):
+    """Renumber nodes in topological order and build a TimeExpandedGraph
+
+    Attributes:
+        names, station, event_times : node data, in order of first appearance
+        stations : list of station names
+        arcs : list of (tail, head, num passengers, travel time) with node
+               indices in order of first appearance
+    """
+    N = len(names)
+    tail, head, num_passengers, travel_time = np.array(
+        arcs, dtype=np.int64).reshape(-1, 4).T
+
+    # Kahn's algorithm, taking the earliest event whenever there is a choice
+    in_degree = np.bincount(head, minlength=N).tolist()
+    out_ptr, out_arcs = _adjacency(tail, N)
+    heap = [(event_times[i], i) for i in range(N) if in_degree[i] == 0]
+    heapify(heap)
+    order = []
+    while heap:
+        _, v = heappop(heap)
+        order.append(v)
+        for w in head[out_arcs[out_ptr[v]:out_ptr[v + 1]]].tolist():
+            in_degree[w] -= 1
+            if in_degree[w] == 0:
+                heappush(heap, (event_times[w], w))
+
+    new_id = np.empty(N, dtype=np.int32)
+    new_id[order] = np.arange(N, dtype=np.int32)
+
+    return TimeExpandedGraph([names[i] for i in order], stations,
+                             np.array(station, dtype=np.int32)[order],
+                             np.array(event_times, dtype=np.int32)[order],
+                             new_id[tail[out_arcs]], new_id[head[out_arcs]],
+                             num_passengers[out_arcs].astype(np.int32),
+                             travel_time[out_arcs].astype(np.int32))
+
+
+def construct_time_expanded_graph(all_edges, first_day='Mon'):
+    """ Construct a TimeExpandedGraph from a list of edges
+
+    Attribute:
+        all_edges : list of 6-tuples (from, depart, to, arrival, num passengers, time)
+        first_day : day the event times are counted from (e.g., Mon, Tue, etc)
+    """
+    print("Building time-expanded graph ...", end=" ")
+    t1 = time.time()
+
+    node_idx = {}
+    names = []
+    station_idx = {}
+    station = []
+    event_times = []
+    arcs = {}  # we assume a unique edge between events for now
+
+    for edge in all_edges:
+        for name_station, time_stamp in ((edge[0], edge[1]), (edge[2], edge[3])):
+            name = name_station + '@' + time_stamp
+            if name not in node_idx:
+                node_idx[name] = len(names)
+                names.append(name)
+                station.append(station_idx.setdefault(
+                    name_station, len(station_idx)))
+                event_times.append(to_minutes(time_stamp, first_day))
+
+        u = node_idx[edge[0] + '@' + edge[1]]
+        v = node_idx[edge[2] + '@' + edge[3]]
+        if (u, v) not in arcs:
+            arcs[u, v] = (u, v, int(edge[4]), int(edge[5]))
+
+    graph = _build_time_expanded_graph(names, list(station_idx), station,
+                                       event_times, list(arcs.values()))
+
+    t2 = time.time()
+    print('Finished! Took {:.5f} seconds'.format(t2 - t1))
+
+    return graph
+
+
+def depot_time_window(graph, station):
+    """ Latest departure from and earliest return to a station, for every
+    event of a TimeExpandedGraph
+
+    Return two arrays over the nodes: the latest time of an event at the
+    station from which the node can be reached (-inf if none), and the
+    earliest time of an event at the station that can be reached from the
+    node (+inf if none)
+
+    Attribute:
+        graph : TimeExpandedGraph
+        station : name of the station (e.g., a depot)
+    """
+    if station in graph.stations:
+        at_station = graph.station == graph.stations.index(station)
+    else:
+        at_station = np.zeros(graph.number_of_nodes(), dtype=bool)
+    times = graph.time.astype(float)
+    latest_departure = np.where(at_station, times, -np.inf).tolist()
+    earliest_return = np.where(at_station, times, np.inf).tolist()
+
+    tail = graph.tail.tolist()
+    head = graph.head.tolist()
+
+    # node ids are in topological order, so the arcs are swept by increasing
+    # tail forwards and by decreasing head backwards
+    for a in graph.out_arcs.tolist():
+        if latest_departure[tail[a]] > latest_departure[head[a]]:
+            latest_departure[head[a]] = latest_departure[tail[a]]
+    for a in reversed(graph.in_arcs.tolist()):
+        if earliest_return[head[a]] < earliest_return[tail[a]]:
+            earliest_return[tail[a]] = earliest_return[head[a]]
+
+    return np.array(latest_departure), np.array(earliest_return)
+
+
+def time_expanded_graph_from_networkx(graph):
+    """ Construct a TimeExpandedGraph from the events of a networkx graph
+    (sinks and sources, without time stamp, are left out)
+
+    Attribute:
+        graph : directed graph built by construct_graph_from_edges
+    """
+    node_idx = {}
+    names = []
+    station_idx = {}
+    station = []
+    event_times = []
+
+    for node, data in graph.nodes(data=True):
+        if data['time'] is not None:
+            node_idx[node] = len(names)
+            names.append(node)
+            station.append(station_idx.setdefault(
+                data['station'], len(station_idx)))
+            event_times.append(data['time'])
+
+    arcs = [(node_idx[u], node_idx[v], data['num_passengers'], data['travel_time'])
+            for u, v, data in graph.edges(data=True)
+            if u in node_idx and v in node_idx]
+
+    return _build_time_expanded_graph(names, list(station_idx), station,
+                                      event_times, arcs)
@@ -5,10 +5,10 @@
 # @author: Ruby Abrams, Hai Nguyen, Nate May
 
 from __future__ import division
-from gurobipy import *
 from scipy import *
 from scipy.sparse import *
 import sys
+import csv
 
 import networkx as nx
 import time
@@ -16,14 +16,13 @@ import re
 import numpy as np
 # import json
 
-from datetime import datetime, timedelta
-from dateutil.parser import parse
 import matplotlib.pyplot as plt
 import pandas as pd
 from copy import deepcopy
 
 from odMatrix import *
 from xmlParser import *
+from solverBackend import *
 
 # inspection rate (#people inspected per minute)
 KAPPA = 12
@@ -32,278 +31,586 @@ HOUR_TO_SECONDS = 3600
 HOUR_TO_MINUTES = 60
 MINUTE_TO_SECONDS = 60
 
+# columns of the schedule files
+SCHEDULE_COLUMNS = ['start_station_and_time', 'end_station_and_time', 'inspector_id']
+
+
+# end nodes of the arcs from the source and to the sink of an inspector
+SOURCE = -1
+SINK = -2
 
-def construct_variable_names(all_edges, inspectors):
-    flow_var_names = []
-    for edge in all_edges:
-        start = edge[0] + '@' + edge[1]
-        end = edge[2] + '@' + edge[3]
-        flow_var_names.extend([(start, end, k) for k in inspectors])
-    return flow_var_names
 
+class InspectionArcs:
+    """Arcs of the flow model of the inspectors, with integer ids over a
+    TimeExpandedGraph: the arcs of the graph keep their ids 0 to E - 1, the
+    arc from the source of an inspector to node n has id E + n, and the arc
+    from node n to the sink of an inspector has id E + N + n. Every inspector
+    has their own source and sink, so the flow variables are keyed by
+    (arc id, inspector_id).
+
+    Attributes:
+        event_graph : TimeExpandedGraph of the timetable
+        tail, head : arrays with the end nodes of every arc, SOURCE and SINK
+                     for the source and the sink of the inspector
+    """
 
-def add_sinks_and_sources_to_graph(graph, inspectors, flow_var_names):
-    """Add sinks/sources (for each inspector) to the graph
+    def __init__(self, event_graph):
+        self.event_graph = event_graph
+        nodes = np.arange(event_graph.number_of_nodes(), dtype=np.int64)
+        self.tail = np.concatenate([event_graph.tail.astype(np.int64),
+                                    np.full(len(nodes), SOURCE), nodes])
+        self.head = np.concatenate([event_graph.head.astype(np.int64),
+                                    nodes, np.full(len(nodes), SINK)])
+
+    def number_of_arcs(self):
+        return len(self.tail)
+
+    def source_arc(self, n):
+        """Id of the arc from the source to node n"""
+        return self.event_graph.number_of_arcs() + n
+
+    def sink_arc(self, n):
+        """Id of the arc from node n to the sink"""
+        return self.event_graph.number_of_arcs() + self.event_graph.number_of_nodes() + n
+
+    def is_event_arc(self, a):
+        return a < self.event_graph.number_of_arcs()
+
+    def is_source_arc(self, a):
+        return self.tail[a] == SOURCE
+
+    def is_sink_arc(self, a):
+        return self.head[a] == SINK
+
+    def base_events(self, base):
+        """Node ids of the events at the base, in order of time"""
+        event_graph = self.event_graph
+        if not base in event_graph.stations:
+            return np.zeros(0, dtype=np.int64)
+        nodes = np.flatnonzero(event_graph.station == event_graph.stations.index(base))
+        return nodes[np.argsort(event_graph.time[nodes], kind='stable')]
+
+    def node_name(self, n, k):
+        """Name of node n for inspector k ('source_k' and 'sink_k' for the
+        source and the sink)"""
+        if n == SOURCE:
+            return "source_{}".format(k)
+        if n == SINK:
+            return "sink_{}".format(k)
+        return self.event_graph.names[n]
+
+    def arc_names(self, a, k):
+        """(u, v) node names of arc a of inspector k"""
+        return self.node_name(self.tail[a], k), self.node_name(self.head[a], k)
+
+    def find_arc(self, u, v):
+        """Id of the arc between the nodes named u and v (see node_name), or
+        None"""
+        node_idx = self.event_graph.node_idx
+        if u.startswith('source_'):
+            return self.source_arc(node_idx[v]) if v in node_idx else None
+        if v.startswith('sink_'):
+            return self.sink_arc(node_idx[u]) if u in node_idx else None
+        if not u in node_idx or not v in node_idx:
+            return None
+        return self.event_graph.find_arc(node_idx[u], node_idx[v])
+
+
+def construct_variable_names(arcs, inspectors, reachable_arcs=None):
+    """List the (arc id, inspector) keys of the flow variables: the arcs of
+    the timetable, then the arcs from the source and to the sink at every
+    event at the base of each inspector
 
     Attributes:
-        graph : directed graph
+        arcs : InspectionArcs of the timetable
         inspectors : dict of inspectors
-        flow_var_names : list of all variables
+        reachable_arcs : dict of inspector_id and boolean array over the arcs
+                         of the timetable the inspector can use (see
+                         find_reachable_arcs), or None to give every
+                         inspector every arc
     """
-    print("Adding Sinks/Sources...", end=" ")
-    t1 = time.time()
+    num_event_arcs = arcs.event_graph.number_of_arcs()
+    flow_var_names = []
+    if reachable_arcs is None:
+        for a in range(num_event_arcs):
+            flow_var_names.extend([(a, k) for k in inspectors])
+    else:
+        reachable = np.array([reachable_arcs[k] for k in inspectors],
+                             dtype=bool).reshape(len(inspectors), num_event_arcs)
+        keys = list(inspectors)
+        for a, row in enumerate(reachable.T.tolist()):
+            flow_var_names.extend([(a, k) for k, usable in zip(keys, row) if usable])
 
     for k, vals in inspectors.items():
-        source = "source_" + str(k)
-        sink = "sink_" + str(k)
-        graph.add_node(source, station=vals['base'], time_stamp=None)
-        graph.add_node(sink, station=vals['base'], time_stamp=None)
-        for node in graph.nodes():
-            if (graph.nodes[node]['station'] == vals['base']) and (
-                    graph.nodes[node]['time_stamp'] is not None):
-                # adding edge between sink and events and adding to the
-                # variable dictionary
-                graph.add_edge(source, node, num_passengers=0, travel_time=0)
-                flow_var_names.append((source, node, k))
-                graph.add_edge(node, sink, num_passengers=0, travel_time=0)
-                flow_var_names.append((node, sink, k))
+        for n in arcs.base_events(vals['base']).tolist():
+            flow_var_names.append((arcs.source_arc(n), k))
+            flow_var_names.append((arcs.sink_arc(n), k))
+    return flow_var_names
 
-    t2 = time.time()
-    print('Finished! Took {:.5f} seconds'.format(t2 - t1))
 
+def find_reachable_arcs(event_graph, inspectors):
+    """Find the arcs every inspector can use, i.e. the arcs on some path that
+    leaves the base and returns to it within the working hours
 
-def add_mass_balance_constraint(graph, model, inspectors, x):
-    """Add the flow conservation constraints
+    An arc (u, v) is usable if the latest departure from the base that reaches
+    u and the earliest return to the base from v are at most the working
+    hours apart. The arcs are shared by all inspectors with the same base and
+    working hours.
 
     Attributes:
-        graph : directed graph
-        model : Gurobi model
-        inspectors : dict of inspectors
-        x : list of (binary) decision variables
+        event_graph : TimeExpandedGraph of the timetable
+        inspectors : dict of inspectors (or inspector classes)
+
+    Return a dict of inspector_id and boolean array over the arcs
     """
-    print("Adding [Mass - Balance Constraint] ...", end=" ")
+    print("Finding reachable arcs...", end=" ")
     t1 = time.time()
 
-    for k in inspectors:
-        for node in graph.nodes():
-            if graph.nodes[node]['time_stamp']:
+    windows = dict()  # time windows of every base
+    arc_sets = dict()  # arcs of every (base, working hours)
+    reachable_arcs = dict()
+    for k, vals in inspectors.items():
+        key = (vals['base'], vals['working_hours'])
+        if key not in arc_sets:
+            if vals['base'] not in windows:
+                windows[vals['base']] = depot_time_window(
+                    event_graph, vals['base'])
+            latest_departure, earliest_return = windows[vals['base']]
+            duration = earliest_return[event_graph.head] - \
+                latest_departure[event_graph.tail]
+            arc_sets[key] = duration <= vals['working_hours'] * HOUR_TO_MINUTES
+        reachable_arcs[k] = arc_sets[key]
 
-                in_x = []  # list of in_arc variables
+    t2 = time.time()
+    print('Finished! Took {:.5f} seconds'.format(t2 - t1))
 
-                for p in graph.predecessors(node):
-                    # not a sink/source
-                    if graph.nodes[p]['time_stamp'] or p.split('_')[
-                            1] == str(k):
-                        in_x.append(x[p, node, k])
+    num_arcs = event_graph.number_of_arcs()
+    if num_arcs and reachable_arcs:
+        print('On average, an inspector can reach {:.1f}% of the arcs'.format(
+            100 * np.mean([arcs.sum() for arcs in reachable_arcs.values()]) / num_arcs))
+    return reachable_arcs
 
-                in_vals = [1] * len(in_x)
-                in_exp = LinExpr(in_vals, in_x)
 
-                out_x = []  # list of out-arc variables
+def add_mass_balance_constraint_matrix(arcs, model, inspectors, x):
+    """Add the flow conservation constraints of all inspectors at once, as
+    one sparse matrix
 
-                for p in graph.successors(node):
-                    if graph.nodes[p]['time_stamp'] or p.split('_')[
-                            1] == str(k):
-                        out_x.append(x[node, p, k])
+    The node-arc incidence matrix of the arcs (with the source and sink arcs)
+    is shared by all inspectors, so the constraint matrix is its Kronecker
+    product with the identity (one block per inspector), or a block diagonal
+    matrix of its columns with a variable for each inspector.
 
-                out_vals = [-1] * len(out_x)
-                out_exp = LinExpr(out_vals, out_x)
+    Attributes:
+        arcs : InspectionArcs of the timetable
+        model : SolverBackend (see solverBackend.py)
+        inspectors : dict of inspectors
+        x : dict of the (binary) decision variables
+    """
+    print("Adding [Mass - Balance Constraint] ...", end=" ")
+    t1 = time.time()
 
-                # combine in-arc & out-arc linear expressions
-                in_exp.add(out_exp)
-                model.addConstr(in_exp, GRB.EQUAL, 0, "mass_bal_{}_{}".format(
-                    node, str(k)))  # add constraint to model
+    # +1 for in-arcs, -1 for out-arcs (of the events, not the source or sink)
+    N = arcs.event_graph.number_of_nodes()
+    arc_range = np.arange(arcs.number_of_arcs())
+    into, out_of = arcs.head >= 0, arcs.tail >= 0
+    incidence = coo_matrix(
+        (np.r_[np.ones(into.sum()), -np.ones(out_of.sum())],
+         (np.r_[arcs.head[into], arcs.tail[out_of]],
+          np.r_[arc_range[into], arc_range[out_of]])),
+        shape=(N, arcs.number_of_arcs())).tocsc()
+
+    vars_by_inspector = group_vars_by_inspector(x)
+    columns = [[a for a, _ in vars_by_inspector.get(k, [])] for k in inspectors]
+    variables = [x[key] for k in inspectors for key in vars_by_inspector.get(k, [])]
+
+    if columns and all(cols == columns[0] for cols in columns):
+        A = kron(identity(len(columns)), incidence[:, columns[0]], format='csr')
+    else:
+        A = block_diag([incidence[:, cols] for cols in columns], format='csr')
+    # leave out the rows of events an inspector cannot reach
+    A = A[A.getnnz(axis=1) > 0]
+    model.add_constrs(A, variables, EQUAL, np.zeros(A.shape[0]), 'mass_bal')
 
     t2 = time.time()
     print('Finished! Took {:.5f} seconds'.format(t2 - t1))
 
 
-def add_sinks_and_source_constraint(graph, model, inspectors, x):
-    """Add sink/source constraint for each inspector
+def add_sinks_and_source_constraint(arcs, model, inspectors, x):
+    """Add sink/source constraint for each inspector (or inspector class,
+    whose flow is bounded by its size)
 
     Attributes:
-        graph : directed graph
-        model : Gurobi model
+        arcs : InspectionArcs of the timetable
+        model : SolverBackend (see solverBackend.py)
         inspectors : dict of inspectors
-        x : list of binary decision variables
+        x : dict of binary decision variables
     """
     print("Adding [Sink and Source Constraint]...", end=" ")
     t1 = time.time()
 
+    vars_by_inspector = group_vars_by_inspector(x)
     for k, vals in inspectors.items():
-        sink = "sink_" + str(k)
-        source = "source_" + str(k)
-
-        sink_constr = LinExpr([-1] * graph.in_degree(sink),
-                              [x[u, sink, k] for u in graph.predecessors(sink)])
-        # model.addConstr(sink_constr, GRB.EQUAL, 1,"sink_constr_{}".format(k))
-
-        source_constr = LinExpr([1] * graph.out_degree(source),
-                                [x[source, u, k] for u in graph.successors(source)])
-        sink_constr.add(source_constr)  # combine
+        keys = vars_by_inspector.get(k, [])
+        sink_vars = [x[key] for key in keys if arcs.is_sink_arc(key[0])]
+        source_vars = [x[key] for key in keys if arcs.is_source_arc(key[0])]
 
-        model.addConstr(sink_constr, GRB.EQUAL, 0,
-                        "source_constr_{}".format(k))
-        model.addConstr(source_constr, GRB.LESS_EQUAL,
-                        1, "source_constr_{}".format(k))
+        # flow into the sink equals flow out of the source
+        model.add_constr(sink_vars + source_vars,
+                         [-1] * len(sink_vars) + [1] * len(source_vars),
+                         EQUAL, 0, "sink_constr_{}".format(k))
+        model.add_constr(source_vars, [1] * len(source_vars), LESS_EQUAL,
+                         vals.get('size', 1), "source_constr_{}".format(k))
 
     t2 = time.time()
     print('Finished! Took {:.5f} seconds'.format(t2 - t1))
 
 
-def add_max_num_inspectors_constraint(graph, model, inspectors, max_num_inspectors, x):
+def add_max_num_inspectors_constraint(arcs, model, inspectors, max_num_inspectors, x):
     """Adding a maximum number of inspectors constraint
 
     Attributes:
-        graph : directed graph
-        model : Gurobi model
+        arcs : InspectionArcs of the timetable
+        model : SolverBackend (see solverBackend.py)
         inspectors : dict of inspectors
-        x : list of binary decision variables
+        max_num_inspectors : maximum number of inspectors at work
+        x : dict of binary decision variables
     """
 
     print("Adding [Max Working Inspectors Constraint]...", end=" ")
     t1 = time.time()
-    iteration = 0
 
-    for k, vals in inspectors.items():
-        iteration += 1
-        source = "source_" + str(k)
-        source_constr = LinExpr([1] * graph.out_degree(source),
-                                [x[source, u, k] for u in graph.successors(source)])
-
-        if iteration == 1:
-            maxWorking = source_constr
-        else:
-            maxWorking.add(source_constr)
-
-    model.addConstr(maxWorking, GRB.LESS_EQUAL,
-                    max_num_inspectors, name="Max_Inspector_Constraint")
+    source_vars = [col for (a, k), col in x.items()
+                   if k in inspectors and arcs.is_source_arc(a)]
+    model.add_constr(source_vars, [1] * len(source_vars), LESS_EQUAL,
+                     max_num_inspectors, "Max_Inspector_Constraint")
 
     t2 = time.time()
     print('Finished! Took {:.5f} seconds'.format(t2 - t1))
 
 
-def add_time_flow_constraint(graph, model, inspectors, x):
-    """Add time flow constraint (maximum number of working hours)
+def add_time_flow_constraint(arcs, model, inspectors, x):
+    """Add time flow constraint (maximum number of working hours): the time
+    of the last event (the tail of the sink arc) minus the time of the first
+    event (the head of the source arc)
+
+    For an inspector class, the constraint bounds the total working time of
+    its inspectors, which relaxes the limit of each of them: the paths of the
+    class flow are checked by decompose_class_flows, and classes with a path
+    over the limit are split (see split_inspector_classes).
 
     Attributes:
-        graph : directed graph
-        model : Gurobi model
+        arcs : InspectionArcs of the timetable
+        model : SolverBackend (see solverBackend.py)
         inspectors : dict of inspectors
-        x : list of binary decision variables
+        x : dict of binary decision variables
     """
     print("Adding [Time Flow Constraint]...", end=" ")
     t1 = time.time()
 
+    event_time = arcs.event_graph.time
+    vars_by_inspector = group_vars_by_inspector(x)
     for k, vals in inspectors.items():
-        source = "source_" + str(k) + ""
-        sink = "sink_" + str(k)
-
-        ind = [x[u, sink, k] for u in graph.predecessors(
-            sink)] + [x[source, v, k] for v in graph.successors(source)]
+        keys = vars_by_inspector.get(k, [])
+        sink_keys = [key for key in keys if arcs.is_sink_arc(key[0])]
+        source_keys = [key for key in keys if arcs.is_source_arc(key[0])]
 
-        val1 = [time.mktime(parse(graph.nodes[u]['time_stamp']).timetuple(
-        )) / MINUTE_TO_SECONDS for u in graph.predecessors(sink)]
-        min_val1 = min(val1)
         # normalising by subtracting the minimum
-        val1 = [t - min_val1 for t in val1]
+        val1 = event_time[arcs.tail[[a for a, _ in sink_keys]]]
+        val2 = event_time[arcs.head[[a for a, _ in source_keys]]]
+        val1 = (val1 - val1.min()).tolist() if len(val1) else []
+        val2 = (val2.min() - val2).tolist() if len(val2) else []
+
+        model.add_constr(
+            [x[key] for key in sink_keys + source_keys], val1 + val2,
+            LESS_EQUAL,
+            vals['working_hours'] *
+            HOUR_TO_MINUTES * vals.get('size', 1),
+            'time_flow_constr_{}'.format(k))
 
-        val2 = [time.mktime(parse(graph.nodes[v]['time_stamp']).timetuple(
-        )) / MINUTE_TO_SECONDS for v in graph.successors(source)]
-        min_val2 = min(val2)
-        val2 = [-(t - min_val2) for t in val2]  # again, normalising
+    t2 = time.time()
+    print("Finished! Took {:.5f} seconds".format(t2 - t1))
 
-        val = val1 + val2
 
-        time_flow = LinExpr(val, ind)
-        model.addConstr(
-            time_flow,
-            GRB.LESS_EQUAL,
-            vals['working_hours'] *
-            HOUR_TO_MINUTES,
-            'time_flow_constr_{}'.format(k))
+def passenger_arc_ids(arcs, path_store):
+    """Ids (in the InspectionArcs) of the arcs of the passenger graph of the
+    path_store, which keeps the arcs with passengers in order"""
+    return np.flatnonzero(arcs.event_graph.num_passengers > 0)
+
+
+def add_arc_coverage_vars(arcs, model, inspectors, path_store, x):
+    """Add one aggregate coverage variable y_e = sum_k x_ek for every arc on
+    the OD paths, so that the path constraints need one term per arc instead
+    of one term per arc and inspector
+
+    Attributes:
+        arcs : InspectionArcs of the timetable
+        model : SolverBackend (see solverBackend.py)
+        inspectors : dict of inspectors (or inspector classes)
+        path_store : PathStore with the paths of the OD pairs
+        x : decision variables of the inspector flows
+
+    Return the dict of arc id and y variable
+    """
+
+    print('Adding [Arc Coverage Constraint]...', end=" ")
+    t1 = time.time()
+
+    covered = passenger_arc_ids(arcs, path_store)[np.unique(path_store.arc_ids)]
+    y = model.add_vars(covered.tolist(), lb=0, ub=np.inf, obj=0,
+                       vtype=CONTINUOUS, name='y')
+
+    # row of every covered arc, and the x variables on the covered arcs
+    row_of = np.full(arcs.number_of_arcs(), -1)
+    row_of[covered] = np.arange(len(covered))
+    keys = [key for key in x if key[1] in inspectors]
+    rows = row_of[np.array([a for a, _ in keys], dtype=np.int64)]
+    on_covered = np.flatnonzero(rows >= 0)
+
+    flows = coo_matrix((-np.ones(len(on_covered)), (rows[on_covered], np.arange(len(on_covered)))),
+                       shape=(len(covered), len(on_covered)))
+    A = hstack([identity(len(covered)), flows], format='csr')
+    model.add_constrs(A, [y[a] for a in covered.tolist()] +
+                      [x[keys[i]] for i in on_covered.tolist()],
+                      EQUAL, np.zeros(len(covered)), 'arc_coverage')
 
     t2 = time.time()
     print("Finished! Took {:.5f} seconds".format(t2 - t1))
+    return y
 
 
-def minimization_constraint(graph, model, inspectors, OD, shortest_paths, M, x):
-    """Add dummy variables to get rid of 'min' operators
+def minimization_constraint(arcs, model, inspectors, OD, path_store, M, x, y=None):
+    """Add dummy variables to get rid of 'min' operators: the inspected share
+    M of the passengers of every OD pair is at most the sum of the shares
+    inspected on the arcs of its path, one row for every path
 
     Attributes:
-        graph : directed graph
-        model : Gurobi model
+        arcs : InspectionArcs of the timetable
+        model : SolverBackend (see solverBackend.py)
+        inspectors : dict of inspectors (or inspector classes)
         OD : origin-destination matrix
-        shortest_paths : dict of edges and associated paths
+        path_store : PathStore with the paths of the OD pairs
+        M : dict of path index and M variable
+        x : decision variables of the inspector flows
+        y : aggregate coverage variables of the arcs (see
+            add_arc_coverage_vars), used instead of x if given
     """
 
     print('Adding [Minimum Constraint]...', end=" ")
     t1 = time.time()
 
-    # Create a dictionary of all Origin-Destinations
-    all_paths = {}
-    for source, sink in OD.keys():
-        if source != sink:
-            all_paths[(source, sink)] = shortest_paths[source][sink]
-
-    for (u, v), path in all_paths.items():
-        if not ("source_" in u + v or "sink_" in u + v):
-            indices = [M[u, v]] + [x[i, j, k]
-                                   for i, j in zip(path, path[1:]) for k in inspectors]
-            values = [1] + [-KAPPA * graph.edges[i,
-                                                 j]['travel_time'] / graph.edges[i,
-                                                                                 j]['num_passengers'] for i,
-                            j in zip(path,
-                                     path[1:]) for k in inspectors]
-
-            min_constr = LinExpr(values, indices)
-            model.addConstr(min_constr, GRB.LESS_EQUAL, 0,
-                            "minimum_constr_path_({},{})".format(u, v))
+    # share of the passengers of every arc inspected by one inspector, on
+    # the arcs of every path
+    passenger_graph = path_store.graph
+    inspected_share = KAPPA * passenger_graph.travel_time / passenger_graph.num_passengers
+    paths = path_store.incidence() @ diags(inspected_share)
+    arc_ids = passenger_arc_ids(arcs, path_store)
+
+    if y is None:
+        # column of every arc in paths, for the x variables on them
+        column_of = np.full(arcs.number_of_arcs(), -1)
+        column_of[arc_ids] = np.arange(len(arc_ids))
+        keys = [key for key in x if key[1] in inspectors]
+        columns = column_of[np.array([a for a, _ in keys], dtype=np.int64)]
+        used = np.flatnonzero(columns >= 0)
+        variables = [x[keys[i]] for i in used.tolist()]
+        coverage = paths @ coo_matrix(
+            (np.ones(len(used)), (columns[used], np.arange(len(used)))),
+            shape=(len(arc_ids), len(used)))
+    else:
+        covered = [j for j, a in enumerate(arc_ids.tolist()) if a in y]
+        variables = [y[arc_ids[j]] for j in covered]
+        coverage = paths[:, covered]
+
+    A = hstack([identity(len(path_store)), -coverage], format='csr')
+    model.add_constrs(A, [M[i] for i in range(len(path_store))] + variables,
+                      LESS_EQUAL, np.zeros(len(path_store)), 'minimum_constr_path')
 
     t2 = time.time()
     print("Finished! Took {:.5f} seconds".format(t2 - t1))
 
 
-def print_solution_paths(inspectors, x):
+def print_solution_paths(arcs, model, inspectors, x):
     """Print solutions
+
+    The values of all variables are fetched at once; every arc used points to
+    the arc of the same inspector leaving its head, which are chained from
+    the source of every inspector.
+
     Attributes:
+        arcs : InspectionArcs of the timetable
+        model : SolverBackend (see solverBackend.py)
         inspectors : dict of inspectors
-        x : list of binary decision variables
+        x : dict of binary decision variables
+    """
+    keys = list(x)
+    chosen = np.flatnonzero(model.get_values(list(x.values())) > 0.5)
+    arc_ids = np.array([keys[i][0] for i in chosen.tolist()], dtype=np.int64)
+    inspector_ids = [keys[i][1] for i in chosen.tolist()]
+    inspector_index = {k: i for i, k in enumerate(inspectors)}
+    inspector_idx = np.array([inspector_index.get(k, -1) for k in inspector_ids],
+                             dtype=np.int64)
+
+    # the arc leaving every (inspector, node), with the source and the sink
+    # numbered 1 and 0 before the events
+    num_nodes = arcs.event_graph.number_of_nodes() + 2
+    arc_keys = inspector_idx * num_nodes + arcs.tail[arc_ids] + 2
+    order = np.argsort(arc_keys, kind='stable')
+    sorted_keys = arc_keys[order]
+
+    def find_arcs(keys):
+        if not len(order):
+            return np.full(len(keys), -1)
+        pos = np.minimum(np.searchsorted(sorted_keys, keys), len(order) - 1)
+        return np.where(sorted_keys[pos] == keys, order[pos], -1)
+
+    next_arc = find_arcs(inspector_idx * num_nodes + arcs.head[arc_ids] + 2).tolist()
+    first_arc = find_arcs(np.arange(len(inspectors)) * num_nodes + SOURCE + 2).tolist()
+    is_sink = (arcs.head[arc_ids] == SINK).tolist()
+
+    rows = []
+
+    def follow_paths():
+        # the rows of the paths, in order, as the arcs are followed
+        for a in first_arc:
+            while a != -1:
+                k = inspector_ids[a]
+                rows.append(arcs.arc_names(arc_ids[a], k) + (k,))
+                yield rows[-1]
+                if is_sink[a]:
+                    break
+                a = next_arc[a]
+
+    write_schedule_csv(follow_paths(), "schedule_for_{}_inspectors.csv".format(len(inspectors)))
+    return schedule_frame(rows)
+
+
+def write_schedule_csv(rows, file_name):
+    """Write schedules to a CSV file row by row, in the layout of
+    DataFrame.to_csv of schedule_frame
+
+    Attributes:
+        rows : iterable of (start_station_and_time, end_station_and_time,
+               inspector_id) rows of the schedules
+        file_name : name of the CSV file
+    """
+    with open(file_name, 'w', newline='') as f:
+        writer = csv.writer(f, lineterminator='\n')
+        writer.writerow([''] + SCHEDULE_COLUMNS)
+        writer.writerows((i,) + tuple(row) for i, row in enumerate(rows))
+
+
+def schedule_frame(rows):
+    """DataFrame of schedules in the format of print_solution_paths, from a
+    list of (start_station_and_time, end_station_and_time, inspector_id)
+    rows"""
+    return pd.DataFrame(rows, columns=SCHEDULE_COLUMNS)
+
+
+def solution_to_start(arcs, solution, x, classes=None):
+    """Values of the flow variables for schedules in the format of
+    print_solution_paths, to be used as a start solution
+
+    Attributes:
+        arcs : InspectionArcs of the timetable
+        solution : DataFrame of schedules
+        x : dict of decision variables
+        classes : dict of inspector classes, if the variables are the flows
+                  of inspector classes
+    """
+    start = {col: 0 for col in x.values()}
+    class_of = dict()
+    if classes is not None:
+        class_of = {k: c for c, vals in classes.items() for k in vals['inspectors']}
+
+    for u, v, k in solution.itertuples(index=False):
+        key = (arcs.find_arc(u, v), class_of.get(k, k))
+        if key in x:
+            start[x[key]] += 1
+    return start
+
+
+def decompose_class_flows(arcs, model, classes, x):
+    """Decompose the integer flow of every inspector class into one path per
+    inspector, and return the paths in the same format as print_solution_paths
+
+    Each path goes to the sink as soon as it can. The class flows only bound
+    the total working time of each class, so a path may be longer than the
+    working hours of its inspector; the schedules are only written if no
+    path is.
+
+    Attributes:
+        arcs : InspectionArcs of the timetable
+        model : SolverBackend (see solverBackend.py)
+        classes : dict of inspector classes
+        x : dict of integer decision variables
+
+    Return the schedules and the list of the classes with a path longer
+    than their working hours
+    """
+    flow_values = model.get_values(x)
+    event_time = arcs.event_graph.time
+
+    # remaining flow on the arcs leaving every node, for every class
+    out_flows = {c: dict() for c in classes}
+    for (a, c), value in flow_values.items():
+        if value > 0.5:
+            out_flows[c].setdefault(arcs.tail[a], []).append([a, int(round(value))])
+
+    rows = []
+    overworked = []
+    for c, vals in classes.items():
+        out_flow = out_flows[c]
+
+        for k in vals['inspectors']:
+            if not any(flow for a, flow in out_flow.get(SOURCE, [])):
+                break  # no more inspectors of this class at work
+
+            node = SOURCE
+            path = []
+            while node != SINK:
+                flows = [flow for flow in out_flow[node] if flow[1] > 0]
+                flow = next((flow for flow in flows if arcs.is_sink_arc(flow[0])), flows[0])
+                flow[1] -= 1
+                path.append(flow[0])
+                node = arcs.head[flow[0]]
+
+            duration = event_time[arcs.tail[path[-1]]] - event_time[arcs.head[path[0]]]
+            if duration > vals['working_hours'] * HOUR_TO_MINUTES and not c in overworked:
+                print('Note: inspector {} works {} minutes, more than {} hours'.format(
+                    k, duration, vals['working_hours']))
+                overworked.append(c)
+
+            rows.extend(arcs.arc_names(a, k) + (k,) for a in path)
+
+    if not overworked:
+        write_schedule_csv(rows, "schedule_for_{}_inspectors.csv".format(
+            sum(vals['size'] for vals in classes.values())))
+    return schedule_frame(rows), overworked
+
+
+def group_vars_by_inspector(x):
+    """Dict of inspector_id and the list of the (arc id, k) keys of their
+    variables
     """
-    solution = pd.DataFrame(
-        columns=[
-            'start_station_and_time',
-            'end_station_and_time',
-            'inspector_id'])
-    for k in inspectors:
-        start = "source_{}".format(k)
-        while(start != "sink_{}".format(k)):
-            arcs = x.select(start, '*', k)
-            match = [x for x in arcs if x.getAttr("x") > 0.5]
-            if not match:
-                break
-            arc = match[0].getAttr("VarName").split(",")
-            arc[0] = arc[0].split("[")[1]
-            arc = arc[:-1]
-            start = arc[1]
-            solution = solution.append({'start_station_and_time': arc[0],
-                                        'end_station_and_time': arc[1],
-                                        'inspector_id': k}, ignore_index=True)
-    solution.to_csv("schedule_for_{}_inspectors.csv".format(len(inspectors)))
-    return solution
-
-
-def update_all_var_lists(unknown_vars, known_vars, depot_dict, prev_sols, x, delta=1):
+    res = dict()
+    for key in x:
+        res.setdefault(key[1], []).append(key)
+    return res
+
+
+def update_all_var_lists(model, unknown_vars, known_vars, depot_dict, prev_sols, x, delta=1):
     """Update the lists of variables
     """
+    # no solution before the first optimization
+    values = model.get_values(x) if model.has_solution() else dict()
+    vars_by_inspector = group_vars_by_inspector(x)
 
     for inspector_id in unknown_vars[:]:
-        # inspector involves in solution
-        if [z for z in x.select('source_{}'.format(inspector_id), '*', inspector_id)
-                if z.getAttr('x') >= .9]:
-            sol_arcs = x.select('*', '*', inspector_id)
-            prev_sols.update({arc: clean_up_sol(arc.getAttr('x'))
-                              for arc in sol_arcs})
+        keys = vars_by_inspector.get(inspector_id, [])
+        # inspector involves in solution (a flow leaves the source)
+        if [key for key in keys if values.get(key, 0) >= .9]:
+            prev_sols.update({x[key]: clean_up_sol(values[key])
+                              for key in keys})
             known_vars.append(inspector_id)
             unknown_vars.remove(inspector_id)
 
@@ -332,48 +639,115 @@ def update_all_var_lists(unknown_vars, known_vars, depot_dict, prev_sols, x, del
     return unknown_vars, uncare_vars
 
 
+def fix_known_vars(model, x, vars_by_inspector, unknown_vars, prev_sols):
+    """Fix the variables with known values (of the known and don't care
+    inspectors) through their bounds, and free the variables of the unknown
+    inspectors
+
+    Attributes:
+        model : SolverBackend (see solverBackend.py)
+        x : dict of binary decision variables
+        vars_by_inspector : dict of inspector_id and keys of their variables
+        unknown_vars : list of inspectors still to be scheduled
+        prev_sols : dict of variables and their known values
+    """
+    free = [x[key] for k in unknown_vars for key in vars_by_inspector.get(k, [])]
+    free_set = set(free)
+    fixed = [var for var in prev_sols if not var in free_set]
+    values = [prev_sols[var] for var in fixed]
+
+    model.set_bounds(fixed, values, values)
+    model.set_bounds(free, 0, 1)
+
+
 def clean_up_sol(x):
     return 1 if x >= 0.5 else 0
 
 
 def update_max_inspectors_constraint(model, new_max_inspectors):
     """ Update the max_num_inspectors in the model constraint named
-    'Max_Inspector_Constraint', and also write the lp model to a file
+    'Max_Inspector_Constraint' (the model is written by a ModelExporter,
+    see modelExport.py)
 
     Attributes:
-        model : Gurobi model
+        model : SolverBackend (see solverBackend.py)
         new_max_inspectors : new upper bound on maximum number of inspectors
     """
 
-    constr = model.getConstrByName("Max_Inspector_Constraint")
-    constr.setAttr(GRB.Attr.RHS, new_max_inspectors)
-    model.update()  # implement all pending changes
-    model.write("gurobi_model_{}.rlp".format(new_max_inspectors))
+    model.set_rhs("Max_Inspector_Constraint", new_max_inspectors)
 
 
-def add_vars_and_obj_function(model, flow_var_names, OD):
+def add_vars_and_obj_function(model, flow_var_names, OD, classes=None):
     """Adding variables and objective function to model
 
     Attributes:
-        model : Gurobi model
-        flow_var_names : list of binary variables
-        OD : origin-destination matrix
+        model : SolverBackend (see solverBackend.py)
+        flow_var_names : list of (arc id, inspector_id) keys of the variables
+        OD : origin-destination matrix, with one M variable for each of its
+             paths
+        classes : dict of inspector classes, if the variables are the integer
+                  flows of inspector classes instead of single inspectors
     """
     print("Adding variables...", end=" ")
 
     # adding variables
-    x = model.addVars(flow_var_names, ub=1, lb=0,
-                      obj=0, vtype=GRB.BINARY, name='x')
-    M = model.addVars(OD.keys(), lb=0, ub=1, obj=list(
-        OD.values()), vtype=GRB.CONTINUOUS, name='M')
+    if classes is None:
+        x = model.add_vars(flow_var_names, ub=1, lb=0,
+                           obj=0, vtype=BINARY, name='x')
+    else:
+        x = model.add_vars(flow_var_names,
+                           ub=[classes[k]['size'] for a, k in flow_var_names],
+                           lb=0, obj=0, vtype=INTEGER, name='x')
 
     # Adding the objective function coefficients
-    model.setObjective(M.prod(OD), GRB.MAXIMIZE)
+    M = model.add_vars(range(len(OD)), lb=0, ub=1, obj=OD.values(),
+                       vtype=CONTINUOUS, name='M')
+    model.set_maximize()
 
     print('Done')
     return x, M
 
 
+def build_inspection_model(event_graph, inspectors, OD, path_store,
+                           solver='gurobi', classes=None, pruning=True,
+                           aggregate_coverage=False):
+    """Build the flow model of the inspectors (or inspector classes), without
+    the maximum number of inspectors
+
+    Attributes:
+        event_graph : TimeExpandedGraph of the timetable
+        inspectors : dict of inspectors (or inspector classes)
+        OD : origin-destination matrix
+        path_store : PathStore with the paths of the OD pairs
+        solver : name of the MIP solver (see solverBackend.py)
+        classes : dict of inspector classes, if inspectors are classes
+        pruning : only give inspectors variables on the arcs they can reach
+                  (see find_reachable_arcs)
+        aggregate_coverage : write the path constraints over one coverage
+                             variable per arc (see add_arc_coverage_vars)
+
+    Return the InspectionArcs with the sources and sinks, the model and its x
+    and M variables
+    """
+    arcs = InspectionArcs(event_graph)
+    reachable_arcs = None
+    if pruning:
+        reachable_arcs = find_reachable_arcs(event_graph, inspectors)
+    flow_var_names = construct_variable_names(arcs, inspectors, reachable_arcs)
+
+    print("Start {}".format(BACKENDS[solver].solver_name))
+    model = create_backend(solver, "DB_INSPECTION_SCHEDULE")
+    x, M = add_vars_and_obj_function(model, flow_var_names, OD, classes)
+    add_mass_balance_constraint_matrix(arcs, model, inspectors, x)
+    add_sinks_and_source_constraint(arcs, model, inspectors, x)
+    add_time_flow_constraint(arcs, model, inspectors, x)
+    y = None
+    if aggregate_coverage:
+        y = add_arc_coverage_vars(arcs, model, inspectors, path_store, x)
+    minimization_constraint(arcs, model, inspectors, OD, path_store, M, x, y)
+    return arcs, model, x, M
+
+
 def main(argv):
     """main function"""
 
@@ -421,44 +795,19 @@ def main(argv):
     input_dir = 'mon_arcs.txt'
 
     graph, flow_var_names = construct_graph_from_file(input_dir, inspectors)
+    event_graph = time_expanded_graph_from_networkx(graph)
 
     # OD Estimation
-    shortest_paths, arc_paths = create_arc_paths(deepcopy(graph))
-    # T, OD = generate_OD_matrix(graph)
-
-    with open('../final/dict.txt', 'r') as f:
-        data = f.read()
-
-    OD = eval(data)
+    path_store = create_arc_paths(event_graph)
+    OD = generate_OD_matrix(event_graph, path_store)
     print("OD matrix loaded ...")
 
-    # adding sources/sinks nodes
-    add_sinks_and_sources_to_graph(graph, inspectors, flow_var_names)
-
-    # freeze graph to prevent further changes
-    graph = nx.freeze(graph)
-
-    # start Gurobi
-    print("Start Gurobi")
-    model = Model("DB_MIP")
-
-    # adding variables and objective functions
-    x, M = add_vars_and_obj_function(model, flow_var_names, OD)
-
-    # adding flow conservation constraints
-    add_mass_balance_constraint(graph, model, inspectors, x)
-
-    # adding sink/source constraints
-    add_sinks_and_source_constraint(graph, model, inspectors, x)
-
-    # add working_hours restriction constraints
-    add_time_flow_constraint(graph, model, inspectors, x)
-
-    # adding dummy variables to get rid of 'min' in objective function
-    minimization_constraint(graph, model, inspectors, OD, shortest_paths, M, x)
+    # the flow model of the inspectors, on every arc of the timetable
+    arcs, model, x, M = build_inspection_model(event_graph, inspectors, OD, path_store,
+                                               'gurobi', pruning=False)
 
     # adding a max number of inspectors constraint (set to 1 by default)
-    add_max_num_inspectors_constraint(graph, model, inspectors, 1, x)
+    add_max_num_inspectors_constraint(arcs, model, inspectors, 1, x)
 
     known_vars = []  # vars with known solutions
     # unknown_vars = []  # vars currently in the model
@@ -471,20 +820,13 @@ def main(argv):
 
     # important for saving constraints and variables
     model.write("Scheduling.rlp")
-    model.setParam('MIPGap', 0.05)
-    # model.setParam('MIPFocus', 1)
+    model.set_param('mip_gap', 0.05)
 
-    def mycallback(model, where):
-        if where == GRB.Callback.MIPNODE:
-            model.cbSetSolution(list(prev_sols.keys()),
-                                list(prev_sols.values()))
-            model.cbUseSolution()  # newly added
-            print("MODEL RUNTIME: {}".format(
-                model.cbGet(GRB.Callback.RUNTIME)))
+    vars_by_inspector = group_vars_by_inspector(x)
 
     # initial list fill
     unknown_vars, uncare_vars = update_all_var_lists(
-        [], known_vars, depot_dict, x, delta)
+        model, [], known_vars, depot_dict, prev_sols, x, delta)
 
     for i in range(1, max_num_inspectors + 1, delta):
 
@@ -494,19 +836,19 @@ def main(argv):
         print("Don't care Vars: ", uncare_vars)
 
         for uncare_inspector_id in uncare_vars:
-            # = x.select('*', '*', uncare_inspector_id)
             prev_sols.update(
-                {arc: 0 for arc in x.select('*', '*', uncare_inspector_id)})
+                {x[key]: 0 for key in vars_by_inspector[uncare_inspector_id]})
 
         update_max_inspectors_constraint(model, i)
 
-        model.optimize(mycallback)
+        model.set_start(prev_sols)
+        model.optimize()
 
         unknown_vars, uncare_vars = update_all_var_lists(
-            unknown_vars, known_vars, depot_dict, x, delta)
+            model, unknown_vars, known_vars, depot_dict, prev_sols, x, delta)
 
     # write Solution:
-    solution = print_solution_paths(known_vars, x)
+    solution = print_solution_paths(arcs, model, known_vars, x)
 
     with open("Gurobi_Solution.txt", "w") as f:
         f.write(solution.to_string())
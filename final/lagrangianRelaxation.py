@@ -0,0 +1,254 @@
+# Lagrangian relaxation of the inspection model: with the path constraints
+# and the maximum number of inspectors dualised, the model splits into one
+# longest path problem per inspector, which gives an upper bound on the number
+# of inspected passengers; schedules are repaired from the duties found
+
+import time
+import numpy as np
+from scipy.sparse import *
+
+from graph import *
+from readInspectorData import *
+from columnGeneration import *
+
+# step size factor of the subgradient method, and the number of iterations
+# without a better bound after which it is halved
+INITIAL_STEP_FACTOR = 2.0
+STEP_PATIENCE = 20
+MIN_STEP_FACTOR = 1e-4
+
+# weight of the last subgradient in the direction of the multiplier update
+# (the other part is the previous direction, as in the volume algorithm)
+AVERAGING_WEIGHT = 0.1
+
+# number of iterations between two repairs of the schedules
+REPAIR_INTERVAL = 25
+
+# smallest gain of a duty in the repair
+REPAIR_EPSILON = 1e-6
+
+
+def repair_schedules(duty_pool, classes, coverage, column_of, od_counts,
+                     max_num_inspectors, start=None):
+    """Choose schedules among the duties found so far, greedily by the
+    increase of the number of inspected passengers, within the class sizes
+    and the maximum number of inspectors
+
+    From start schedules, the duties whose removal costs least are dropped
+    while there are too many, before the greedy choice.
+
+    Attributes:
+        duty_pool : list of (class id, list of arc ids) of the duties
+        classes : dict of inspector classes
+        coverage : sparse coverage matrix (OD pairs x covered arcs)
+        column_of : dict of arc id and its column in the coverage matrix
+        od_counts : array with the number of passengers of every OD pair
+        max_num_inspectors : maximum number of inspectors at work
+        start : list of the indices of the duties of start schedules (within
+                the class sizes), or None
+
+    Return the list of the indices of the chosen duties in the pool and the
+    number of inspected passengers
+    """
+    if not duty_pool:
+        return [], 0.0
+
+    rows, cols = [], []
+    for j, (c, duty) in enumerate(duty_pool):
+        covered = [column_of[a] for a in duty if a in column_of]
+        rows.extend(covered)
+        cols.extend([j] * len(covered))
+    duty_arcs = csc_matrix((np.ones(len(rows)), (rows, cols)),
+                           shape=(coverage.shape[1], len(duty_pool)))
+    # inspected share of every OD pair by every duty
+    shares = (coverage @ duty_arcs).tocsc()
+    duty_class = [c for c, duty in duty_pool]
+    free = {c: vals['size'] for c, vals in classes.items()}
+    inspected = np.zeros(len(od_counts))
+
+    def gains():
+        """Increase of the inspected passengers by every duty"""
+        current = np.minimum(inspected[shares.indices], 1)
+        gain = shares.copy()
+        gain.data = od_counts[shares.indices] * (
+            np.minimum(inspected[shares.indices] + shares.data, 1) - current)
+        gain = gain.sum(axis=0).A1
+        gain[[free[c] == 0 for c in duty_class]] = 0
+        return gain
+
+    def inspect(j, sign):
+        """Add (sign 1) or remove (sign -1) duty j"""
+        lo, hi = shares.indptr[j], shares.indptr[j + 1]
+        inspected[shares.indices[lo:hi]] += sign * shares.data[lo:hi]
+        free[duty_class[j]] -= sign
+
+    chosen = []
+    for j in start or []:
+        chosen.append(j)
+        inspect(j, 1)
+    while len(chosen) > max_num_inspectors:
+        losses = []
+        for j in chosen:
+            inspect(j, -1)
+            losses.append(gains()[j])
+            inspect(j, 1)
+        j = chosen.pop(int(np.argmin(losses)))
+        inspect(j, -1)
+
+    while len(chosen) < max_num_inspectors:
+        gain = gains()
+        j = int(np.argmax(gain))
+        if gain[j] <= REPAIR_EPSILON:
+            break
+        chosen.append(j)
+        inspect(j, 1)
+
+    # replace every chosen duty by the best one given the others, until no
+    # replacement improves the schedules
+    improved = True
+    while improved:
+        improved = False
+        for p, j in enumerate(chosen):
+            inspect(j, -1)
+            gain = gains()
+            best = int(np.argmax(gain))
+            if gain[best] > gain[j] + REPAIR_EPSILON:
+                chosen[p] = j = best
+                improved = True
+            inspect(j, 1)
+
+    objective = (od_counts * np.minimum(inspected, 1)).sum()
+    return chosen, objective
+
+
+def solve_by_lagrangian_relaxation(event_graph, path_store, OD, inspectors,
+                                   max_num_inspectors, max_iterations=300):
+    """Find an upper bound on the number of inspected passengers and
+    schedules, by relaxing the path constraints (M_od <= inspected share of
+    the path of od) and the maximum number of inspectors with Lagrange
+    multipliers, updated by the subgradient method with Polyak steps
+
+    The multipliers move along an exponential average of the subgradients,
+    as the plain subgradients zigzag between covering an OD pair fully and
+    not at all. The multiplier of an OD pair is at most its number of
+    passengers, beyond which it only overweights the arcs of its path.
+
+    For given multipliers, the inspectors are independent: the best duty of
+    every class of inspectors with the same base and working hours is a
+    longest path with the multipliers of the paths through every arc as arc
+    weights (see price_duties). Every REPAIR_INTERVAL iterations, schedules
+    are chosen among all duties found so far by repair_schedules.
+
+    Attributes:
+        event_graph : TimeExpandedGraph of the timetable
+        path_store : PathStore of the OD pairs (on the passenger arcs of the
+                     event_graph)
+        OD : origin-destination matrix
+        inspectors : dict of inspectors
+        max_num_inspectors : maximum number of inspectors at work
+        max_iterations : maximum number of subgradient iterations
+
+    Return the schedules in the same format as print_solution_paths
+    """
+    print("Lagrangian relaxation ...")
+    t1 = time.time()
+
+    classes = create_inspector_classes(inspectors)
+    od_pairs, od_counts, coverage, covered_arcs = create_od_coverage(
+        event_graph, path_store, OD)
+    od_counts = np.array(od_counts)
+    column_of = {a: j for j, a in enumerate(covered_arcs.tolist())}
+    adjacency = (event_graph.time.tolist(), event_graph.head.tolist(),
+                 event_graph.out_ptr.tolist(), event_graph.out_arcs.tolist())
+
+    # multipliers of the path constraints and of the maximum number of
+    # inspectors
+    path_mult = od_counts.astype(float)
+    max_mult = 0.0
+
+    duty_pool = []
+    known_duties = set()
+    best_bound = np.inf
+    best_objective = 0.0
+    best_schedules = []
+    step_factor = INITIAL_STEP_FACTOR
+    no_improvement = 0
+    for iteration in range(1, max_iterations + 1):
+        arc_weights = np.zeros(event_graph.number_of_arcs())
+        arc_weights[covered_arcs] = coverage.T @ path_mult
+        arc_weights = arc_weights.tolist()
+
+        # best duty of every class, worked by all its inspectors if it is
+        # worth more than the multiplier of the maximum number of inspectors
+        bound = (np.maximum(od_counts - path_mult, 0)).sum() + \
+            max_mult * max_num_inspectors
+        num_duties = np.zeros(coverage.shape[1])
+        num_inspectors = 0
+        for c, vals in classes.items():
+            duties = price_duties(event_graph, adjacency, vals['base'],
+                                  vals['working_hours'], arc_weights, 1)
+            if not duties:
+                continue
+            weight, duty = duties[0]
+            if not (c, tuple(duty)) in known_duties:
+                known_duties.add((c, tuple(duty)))
+                duty_pool.append((c, duty))
+            if weight > max_mult:
+                bound += vals['size'] * (weight - max_mult)
+                num_duties[[column_of[a] for a in duty if a in column_of]] += vals['size']
+                num_inspectors += vals['size']
+
+        if bound < best_bound - 1e-9:
+            best_bound = bound
+            no_improvement = 0
+        else:
+            no_improvement += 1
+            if no_improvement >= STEP_PATIENCE:
+                step_factor /= 2
+                no_improvement = 0
+
+        if iteration % REPAIR_INTERVAL == 1 or iteration == max_iterations:
+            schedules, objective = repair_schedules(
+                duty_pool, classes, coverage, column_of, od_counts,
+                max_num_inspectors)
+            if objective > best_objective:
+                best_objective, best_schedules = objective, schedules
+
+        print('Iteration {}: Lagrangian bound {:.3f}, best schedules {:.3f}'.format(
+            iteration, bound, best_objective))
+
+        # subgradients (the slacks of the relaxed constraints), averaged
+        path_grad = coverage @ num_duties - (od_counts > path_mult)
+        max_grad = max_num_inspectors - num_inspectors
+        if iteration > 1:
+            path_grad = AVERAGING_WEIGHT * path_grad + \
+                (1 - AVERAGING_WEIGHT) * path_dir
+            max_grad = AVERAGING_WEIGHT * max_grad + \
+                (1 - AVERAGING_WEIGHT) * max_dir
+        path_dir, max_dir = path_grad, max_grad
+
+        norm = (path_grad ** 2).sum() + max_grad ** 2
+        if norm == 0 or step_factor < MIN_STEP_FACTOR or \
+                best_bound - best_objective <= 1e-6 * max(best_bound, 1):
+            break
+        step = step_factor * (bound - best_objective) / norm
+        path_mult = np.clip(path_mult - step * path_grad, 0, od_counts)
+        max_mult = max(max_mult - step * max_grad, 0)
+
+    # schedules from the last duties found
+    schedules, objective = repair_schedules(
+        duty_pool, classes, coverage, column_of, od_counts, max_num_inspectors)
+    if objective > best_objective:
+        best_objective, best_schedules = objective, schedules
+
+    # assign the inspectors of each class to its chosen duties
+    rows = assign_inspectors(event_graph, classes, [duty_pool[j] for j in best_schedules])
+
+    write_schedule_csv(rows, "schedule_for_{}_inspectors.csv".format(len(inspectors)))
+
+    t2 = time.time()
+    print('Lagrangian relaxation finished. Took {:.5f} seconds'.format(t2 - t1))
+    print('Upper bound {:.3f}, schedules inspect {:.3f} passengers (gap {:.2f}%)'.format(
+        best_bound, best_objective,
+        100 * (best_bound - best_objective) / max(best_bound, 1)))
+    return schedule_frame(rows)
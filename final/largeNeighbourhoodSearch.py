@@ -0,0 +1,160 @@
+# Large neighbourhood search: improve the schedules of a solved model by
+# re-optimising a few inspectors at a time, with all the others fixed
+
+import time
+import numpy as np
+
+from eventTime import *
+from solverBackend import *
+from gurobi import *
+
+# kinds of neighbourhoods, used in turn
+NEIGHBOURHOODS = ['depot', 'time window', 'coverage']
+
+# number of working inspectors freed in every iteration
+LNS_NEIGHBOURHOOD_SIZE = 3
+
+# time limit (in seconds) of the re-optimisation of one neighbourhood
+LNS_ITERATION_TIME_LIMIT = 30
+
+# smallest improvement of the objective to accept a new solution
+IMPROVEMENT_EPSILON = 1e-6
+
+
+def inspector_duties(arcs, incumbent, x, vars_by_inspector):
+    """Duties of the working inspectors in a solution
+
+    Attributes:
+        arcs : InspectionArcs of the timetable
+        incumbent : dict of column index and (0 or 1) value
+        x : dict of binary decision variables
+        vars_by_inspector : dict of inspector_id and keys of their variables
+
+    Return a dict of inspector_id and the list of the ids of the arcs of the
+    timetable they use (besides the arcs from the source and to the sink)
+    """
+    duties = dict()
+    for k, keys in vars_by_inspector.items():
+        used = [a for a, _ in keys if incumbent[x[a, k]] >= .5]
+        if used:
+            duties[k] = [a for a in used if arcs.is_event_arc(a)]
+    return duties
+
+
+def duty_start(event_graph, duty):
+    """Time (in minutes) of the first event of a duty"""
+    return int(event_graph.time[event_graph.tail[duty]].min())
+
+
+def duty_footprint(event_graph, duty):
+    """Set of (station, hour) visited on a duty"""
+    tails = event_graph.tail[duty]
+    return set(zip(event_graph.station[tails].tolist(),
+                   (event_graph.time[tails] // MINUTES_PER_HOUR).tolist()))
+
+
+def choose_neighbourhood(kind, event_graph, inspectors, duties, size, rng):
+    """Choose the working inspectors to re-optimise, and add the idle
+    inspectors of their depots
+
+    Attributes:
+        kind : 'depot' (inspectors of the same depot), 'time window'
+               (inspectors starting close in time) or 'coverage' (inspectors
+               visiting the same stations at the same time)
+        event_graph : TimeExpandedGraph of the timetable
+        inspectors : dict of inspectors (or inspector classes)
+        duties : dict of inspector_id and duty of the working inspectors
+        size : number of working inspectors to choose
+        rng : numpy random generator
+
+    Return the list of inspector_id
+    """
+    working = sorted(duties)
+    k = working[rng.integers(len(working))]
+    if kind == 'depot':
+        chosen = [j for j in working if inspectors[j]['base'] == inspectors[k]['base']]
+        rng.shuffle(chosen)
+    elif kind == 'time window':
+        start = duty_start(event_graph, duties[k])
+        chosen = sorted(working, key=lambda j: abs(
+            duty_start(event_graph, duties[j]) - start))
+    else:
+        footprint = duty_footprint(event_graph, duties[k])
+        chosen = sorted(working, key=lambda j: -len(
+            footprint & duty_footprint(event_graph, duties[j])))
+    chosen = [k] + [j for j in chosen if j != k][:size - 1]
+
+    bases = {inspectors[j]['base'] for j in chosen}
+    return chosen + [j for j in inspectors
+                     if not j in duties and inspectors[j]['base'] in bases]
+
+
+def improve_by_lns(arcs, model, inspectors, x, max_num_inspectors, time_budget,
+                   size=LNS_NEIGHBOURHOOD_SIZE, seed=0):
+    """Improve the solution of a solved model by large neighbourhood search:
+    free the variables of a few inspectors (chosen in turn by depot, time
+    window and overlapping coverage), fix all the others to the incumbent
+    through their bounds, and re-optimise from the incumbent, until the time
+    budget is used
+
+    The best solution is kept, and it is the solution of the model on return.
+
+    Attributes:
+        arcs : InspectionArcs of the timetable
+        model : SolverBackend (see solverBackend.py) with a solution
+        inspectors : dict of inspectors (or inspector classes)
+        x : dict of binary decision variables
+        max_num_inspectors : maximum number of inspectors at work
+        time_budget : time (in seconds) for the search
+        size : number of working inspectors freed in every iteration
+        seed : seed of the random choice of the neighbourhoods
+
+    Return the list of the working inspectors in the best solution
+    """
+    print("Large neighbourhood search ...")
+    t1 = time.time()
+
+    rng = np.random.default_rng(seed)
+    vars_by_inspector = group_vars_by_inspector(x)
+    time_limit = model.params.get('time_limit', float('inf'))
+    model.set_rhs("Max_Inspector_Constraint", max_num_inspectors)
+
+    incumbent = {x[key]: clean_up_sol(value)
+                 for key, value in model.get_values(x).items()}
+    best = model.objective
+    start_objective = best
+
+    iteration = 0
+    while time.time() - t1 < time_budget:
+        duties = inspector_duties(arcs, incumbent, x, vars_by_inspector)
+        if not duties:
+            break
+        kind = NEIGHBOURHOODS[iteration % len(NEIGHBOURHOODS)]
+        iteration += 1
+        free_inspectors = choose_neighbourhood(
+            kind, arcs.event_graph, inspectors, duties, size, rng)
+
+        fix_known_vars(model, x, vars_by_inspector, free_inspectors, incumbent)
+        model.set_start(incumbent)
+        model.set_param('time_limit', max(min(
+            LNS_ITERATION_TIME_LIMIT, time_budget - (time.time() - t1)), 1))
+        model.optimize()
+
+        if model.has_solution() and model.objective > best + IMPROVEMENT_EPSILON:
+            best = model.objective
+            incumbent = {x[key]: clean_up_sol(value)
+                         for key, value in model.get_values(x).items()}
+        print('LNS iteration {} ({}, {} inspectors): best objective {:.3f}'.format(
+            iteration, kind, len(free_inspectors), best))
+
+    # solve once more with all variables fixed to the incumbent
+    model.set_param('time_limit', time_limit)
+    fix_known_vars(model, x, vars_by_inspector, [], incumbent)
+    model.set_start(incumbent)
+    model.optimize()
+    model.set_bounds(list(incumbent), 0, 1)
+
+    t2 = time.time()
+    print('LNS improved the objective from {:.3f} to {:.3f} in {} iterations. Took {:.5f} seconds'.format(
+        start_objective, best, iteration, t2 - t1))
+    return sorted(inspector_duties(arcs, incumbent, x, vars_by_inspector))
@@ -14,6 +14,24 @@ MIPGAP -- a floating point between 0 and 1 (e.g., 0.1 (~10%), 0.05 (~5%), etc)
 
 [options] -- options to load od matrix from a file (--load-od)
           -- use the heuristic solver for large scale problem (--heuristic)
+          -- read the timetable one train at a time for large files (--stream)
+          -- always re-extract arcs instead of using the timetable cache (--no-cache)
+          -- update all arcs at once when estimating the OD matrix (--jacobi-od)
+          -- only consider passenger journeys of at most MIN minutes (--od-horizon=MIN)
+          -- merge inspectors with the same depot and hours into classes (--depot-classes)
+          -- write the path constraints over one coverage variable per arc (--aggregate-coverage)
+          -- give inspectors variables on all arcs, even unreachable ones (--no-pruning)
+          -- MIP solver to use, gurobi (default) or highs (--solver=NAME)
+          -- schedule complete duties by column generation (--column-generation)
+          -- schedule duties greedily, without a MIP solver (--greedy)
+          -- solve N regions of depots in parallel and combine them (--decompose=N)
+          -- bound and schedule by Lagrangian relaxation, without a MIP solver (--lagrangian)
+          -- schedule duties window by window, in windows of H hours (--rolling-horizon=H)
+          -- start the MIP solver from the greedy schedules (--greedy-start)
+          -- start each heuristic iteration from the previous schedules (--heuristic-start)
+          -- improve the schedules by large neighbourhood search for SEC seconds (--lns=SEC)
+          -- write the model off, final (default), every-N iterations or async (--export=POLICY)
+          -- write the model as compressed .mps.gz files (--export-mps)
 
 EXAMPLE:
 $ python3 main.py EN_GRIPS2019_401.xml Mon inspectors.csv 30 5 0.10 schedule.txt [--load-od]
@@ -28,11 +46,23 @@ import pandas as pd
 
 from exceptions import *
 from xmlParser import *
+from edgeCache import *
+from solverBackend import *
+from modelExport import *
 from gurobi import *
+from columnGeneration import *
+from dutyHeuristic import *
+from depotDecomposition import *
+from largeNeighbourhoodSearch import *
+from lagrangianRelaxation import *
+from rollingHorizon import *
 from odMatrix import *
 from readInspectorData import *
 from graph import *
 
+# file where the estimated OD matrix is saved (see --load-od)
+OD_FILE = 'savedODMatrix.npz'
+
 
 def main(argv):
     try:
@@ -55,8 +85,26 @@ def main(argv):
         if not chosen_day in DAYS:
             raise DayNotFound('ERROR: Day not found')
 
-        edges, all_stations = extract_edges_from_timetable(
-            timetable_file, chosen_day)
+        solver = 'gurobi'
+        for arg in argv:
+            if arg.startswith('--solver='):
+                solver = arg.split('=')[1]
+        if not solver in BACKENDS:
+            raise CLArgumentsNotMatch(
+                'ERROR: Unknown solver {}'.format(solver))
+
+        export_policy = FINAL
+        for arg in argv:
+            if arg.startswith('--export='):
+                export_policy = arg.split('=')[1]
+        exporter = ModelExporter(export_policy, '--export-mps' in argv)
+
+        if '--no-cache' in argv:
+            edges, all_stations = extract_edges_from_timetable(
+                timetable_file, chosen_day, streaming='--stream' in argv)
+        else:
+            edges, all_stations = extract_edges_with_cache(
+                timetable_file, chosen_day, streaming='--stream' in argv)
 
         print('There are {} stations involved in train timetable'.format(len(all_stations)))
 
@@ -76,52 +124,139 @@ def main(argv):
         for depot, ids in depot_dict.items():
             print('{} \t: {}'.format(depot, ids))
 
-        graph = construct_graph_from_edges(edges)
-        flow_var_names = construct_variable_names(edges, inspectors)
+        # inspectors (or classes of interchangeable inspectors) in the model
+        classes = None
+        model_inspectors = inspectors
+        if '--depot-classes' in argv:
+            if '--heuristic' in argv:
+                print('Note: --depot-classes is not used by the heuristic solver.')
+            else:
+                classes = create_inspector_classes(inspectors)
+                model_inspectors = classes
+                print('{} inspectors in {} classes'.format(
+                    len(inspectors), len(classes)))
+
+        event_graph = construct_time_expanded_graph(edges, chosen_day)
         #input_dir = 'mon_arcs.txt'
         #graph, flow_var_names = construct_graph_from_file(
         #    input_dir, inspectors)
-        graph_copy = deepcopy(graph)
-        shortest_paths, arc_paths = create_arc_paths(graph_copy)
-
+        od_horizon = None
+        od_file = OD_FILE
+        for arg in argv:
+            if arg.startswith('--od-horizon='):
+                od_horizon = int(arg.split('=')[1])
+                od_file = '{}_{}min.npz'.format(OD_FILE[:-4], od_horizon)
+
+        # the saved OD matrix comes with its paths, which are only found
+        # again if it cannot be used
+        OD = None
         if '--load-od' in argv:
             print('Loading the OD matrix from file ...', end=' ')
-            with open('savedODMatrix.txt', 'r') as f:
-                data = f.read()
-            OD = eval(data)
-            print("Done")
-        else:
-            OD = generate_OD_matrix(graph_copy)
-
-        add_sinks_and_sources_to_graph(graph, inspectors, flow_var_names)
-        graph = nx.freeze(graph)  # freeze graph to prevent further changes
-
-        print("Start Gurobi")
-        model = Model("DB_INSPECTION_SCHEDULE")
-        x, M = add_vars_and_obj_function(model, flow_var_names, OD)
-        add_mass_balance_constraint(graph, model, inspectors, x)
-        add_sinks_and_source_constraint(graph, model, inspectors, x)
-        add_time_flow_constraint(graph, model, inspectors, x)
-        minimization_constraint(graph, model, inspectors,
-                                OD, shortest_paths, M, x)
+            try:
+                OD = load_od(od_file, event_graph, od_horizon)
+                print("Done")
+            except (FileNotFoundError, ODMatrixMismatch) as error:
+                print(error)
+
+        if OD is None:
+            path_store = create_arc_paths(event_graph, od_horizon)
+            OD = generate_OD_matrix(
+                event_graph, path_store, jacobi='--jacobi-od' in argv)
+            save_od(OD, event_graph, od_file, od_horizon)
+        path_store = OD.path_store
+
+        num_regions = None
+        window_hours = None
+        for arg in argv:
+            if arg.startswith('--decompose='):
+                num_regions = int(arg.split('=')[1])
+            if arg.startswith('--rolling-horizon='):
+                window_hours = float(arg.split('=')[1])
+
+        if '--column-generation' in argv or '--greedy' in argv or \
+                '--lagrangian' in argv or num_regions or window_hours:
+            if num_regions:
+                solution = solve_by_decomposition(
+                    event_graph, path_store, OD, inspectors, max_num_inspectors,
+                    num_regions, solver, mip_gap)
+            elif window_hours:
+                solution = solve_by_rolling_horizon(
+                    event_graph, path_store, OD, inspectors, max_num_inspectors,
+                    window_hours, solver, mip_gap)
+            elif '--lagrangian' in argv:
+                solution = solve_by_lagrangian_relaxation(
+                    event_graph, path_store, OD, inspectors, max_num_inspectors)
+            elif '--column-generation' in argv:
+                solution = solve_by_column_generation(
+                    event_graph, path_store, OD, inspectors, max_num_inspectors,
+                    solver, mip_gap)
+            else:
+                solution = greedy_duty_schedules(
+                    event_graph, path_store, OD, inspectors, max_num_inspectors)
+            with open(outputFile, 'w') as f:
+                f.write(solution.to_string())
+            return
+
+        arcs, model, x, M = build_inspection_model(
+            event_graph, model_inspectors, OD, path_store,
+            solver, classes, not '--no-pruning' in argv,
+            '--aggregate-coverage' in argv)
 
         # important for saving constraints and variables
-        model.setParam('MIPGap', mip_gap)
-        model.setParam('NumericFocus', 0)
+        model.set_param('mip_gap', mip_gap)
+
+        lns_time = None
+        for arg in argv:
+            if arg.startswith('--lns='):
+                lns_time = float(arg.split('=')[1])
+        if lns_time and classes is not None:
+            print('Note: --lns is not used with --depot-classes.')
+            lns_time = None
 
         if not '--heuristic' in argv:  # not to use heuristic
             print('No heuristic')
             add_max_num_inspectors_constraint(
-                graph, model, inspectors, max_num_inspectors, x)
-            model.write("Scheduling.rlp")
+                arcs, model, model_inspectors, max_num_inspectors, x)
+            start = None
+            if '--greedy-start' in argv:
+                start = greedy_duty_schedules(
+                    event_graph, path_store, OD, inspectors, max_num_inspectors)
+                model.set_start(solution_to_start(arcs, start, x, classes))
             model.optimize()
-            solution = print_solution_paths(inspectors, x)
+
+            # the class flows only bound the total working time of every
+            # class, so the classes with an inspector working too long are
+            # split into single inspectors and the model is solved again
+            while classes is not None:
+                solution, overworked = decompose_class_flows(arcs, model, classes, x)
+                if not overworked:
+                    break
+                print('Note: solving again with {} classes split into single inspectors.'.format(
+                    len(overworked)))
+                classes = split_inspector_classes(classes, overworked)
+                arcs, model, x, M = build_inspection_model(
+                    event_graph, classes, OD, path_store,
+                    solver, classes, not '--no-pruning' in argv,
+                    '--aggregate-coverage' in argv)
+                model.set_param('mip_gap', mip_gap)
+                add_max_num_inspectors_constraint(
+                    arcs, model, classes, max_num_inspectors, x)
+                if start is not None:
+                    model.set_start(solution_to_start(arcs, start, x, classes))
+                model.optimize()
+
+            exporter.export_final(model, "Scheduling")
+            if lns_time and model.has_solution():
+                improve_by_lns(arcs, model, inspectors, x,
+                               max_num_inspectors, lns_time)
+            if classes is None:
+                solution = print_solution_paths(arcs, model, inspectors, x)
 
         else:  # use heuristic solver
             print('Use heuristic')
 
             # adding a max number of inspectors constraint (set to 1 by default)
-            add_max_num_inspectors_constraint(graph, model, inspectors, 1, x)
+            add_max_num_inspectors_constraint(arcs, model, inspectors, 1, x)
 
             known_vars = []  # vars with known solutions
             # unknown_vars = []  # vars currently in the model
@@ -133,21 +268,13 @@ def main(argv):
 
             prev_sols = {}
 
-            # important for saving constraints and variables
-            model.write("Scheduling.rlp")
             # model.setParam('MIPFocus', 1)
 
-            def mycallback(model, where):
-                if where == GRB.Callback.MIPNODE:
-                    model.cbSetSolution(list(prev_sols.keys()),
-                                        list(prev_sols.values()))
-                    model.cbUseSolution()  # newly added
-                    print("MODEL RUNTIME: {}".format(
-                        model.cbGet(GRB.Callback.RUNTIME)))
+            vars_by_inspector = group_vars_by_inspector(x)
 
             # initial list fill
             unknown_vars, uncare_vars = update_all_var_lists(
-                [], known_vars, depot_dict, prev_sols, x)
+                model, [], known_vars, depot_dict, prev_sols, x)
 
             iteration = 0  # iteration counting
 
@@ -176,13 +303,19 @@ def main(argv):
                 print("Don't care Vars: ", uncare_vars)
 
                 for uncare_inspector_id in uncare_vars:
-                    arcs = x.select('*', '*', uncare_inspector_id)
-                    prev_sols.update({arc: 0 for arc in arcs})
+                    keys = vars_by_inspector.get(uncare_inspector_id, [])
+                    prev_sols.update({x[key]: 0 for key in keys})
 
                 update_max_inspectors_constraint(model, i)
-                model.optimize(mycallback)
+                fix_known_vars(model, x, vars_by_inspector,
+                               unknown_vars, prev_sols)
+                exporter.export(model, "gurobi_model_{}".format(i), iteration)
+                if '--heuristic-start' in argv:
+                    # previous solutions as a start solution
+                    model.set_start(prev_sols)
+                model.optimize()
                 unknown_vars, uncare_vars = update_all_var_lists(
-                    unknown_vars, known_vars, depot_dict, prev_sols, x)
+                    model, unknown_vars, known_vars, depot_dict, prev_sols, x)
 
                 if len(known_vars) >= max_num_inspectors:  # termination
                     break
@@ -212,16 +345,23 @@ def main(argv):
                     unknown_vars, known_vars, depot_dict, prev_sols, x)
             """
 
+            exporter.export_final(model, "Scheduling")
+
             print('==================== FINAL SOLUTION =====================')
             print('Known Vars: ', known_vars)
             print('Unknown Vars: ', unknown_vars)
             print("Don't care Vars: ", uncare_vars)
 
+            if lns_time and model.has_solution():
+                known_vars = improve_by_lns(arcs, model, inspectors, x,
+                                            max_num_inspectors, lns_time)
+
             # write Solution:
-            solution = print_solution_paths(known_vars, x)
+            solution = print_solution_paths(arcs, model, known_vars, x)
 
         with open(outputFile, 'w') as f:
             f.write(solution.to_string())
+        exporter.close()
 
     except CLArgumentsNotMatch as error:
         print(error)
@@ -240,6 +380,24 @@ $ python3 main.py timetable chosenDay inspectorFile maxInspectors delta MIPGAP o
 
     [options] -- options to load od matrix from a file (--load-od)
               -- use the heuristic solver for large scale problem (--heuristic)
+              -- read the timetable one train at a time for large files (--stream)
+              -- always re-extract arcs instead of using the timetable cache (--no-cache)
+              -- update all arcs at once when estimating the OD matrix (--jacobi-od)
+              -- only consider passenger journeys of at most MIN minutes (--od-horizon=MIN)
+              -- merge inspectors with the same depot and hours into classes (--depot-classes)
+              -- write the path constraints over one coverage variable per arc (--aggregate-coverage)
+              -- give inspectors variables on all arcs, even unreachable ones (--no-pruning)
+              -- MIP solver to use, gurobi (default) or highs (--solver=NAME)
+              -- schedule complete duties by column generation (--column-generation)
+              -- schedule duties greedily, without a MIP solver (--greedy)
+              -- solve N regions of depots in parallel and combine them (--decompose=N)
+              -- bound and schedule by Lagrangian relaxation, without a MIP solver (--lagrangian)
+              -- schedule duties window by window, in windows of H hours (--rolling-horizon=H)
+              -- start the MIP solver from the greedy schedules (--greedy-start)
+              -- start each heuristic iteration from the previous schedules (--heuristic-start)
+              -- improve the schedules by large neighbourhood search for SEC seconds (--lns=SEC)
+              -- write the model off, final (default), every-N iterations or async (--export=POLICY)
+              -- write the model as compressed .mps.gz files (--export-mps)
 
 EXAMPLE:
 $ python3 main.py EN_GRIPS2019_401.xml Mon inspectors.csv 30 5 0.10 schedule.txt [--load-od]\n"""
@@ -0,0 +1,92 @@
+# When and how the scheduling model is written to files, so that writing
+# large models does not hold up the solve loop of the heuristic
+
+from concurrent.futures import ThreadPoolExecutor
+
+from exceptions import *
+from solverBackend import *
+
+# export policies
+OFF = 'off'
+FINAL = 'final'
+EVERY = 'every'
+ASYNC = 'async'
+
+
+class ModelExporter:
+    """Write the model to files according to a policy:
+    off (never), final (only the final model), every-N (every N-th
+    iteration of the heuristic and the final model) or async (every
+    iteration and the final model, written in a background thread)
+
+    Asynchronous exports write a snapshot of the model with write_mps, so
+    the model may change while it is written: only the bounds and right
+    hand sides are copied in the solve loop (see begin_snapshot), the
+    constraint matrix is copied by the background thread. An iteration is
+    not exported while the previous one is still being written. The solver
+    cannot write .rlp files from a snapshot, so they are written as .mps
+    files.
+
+    Attributes:
+        policy : OFF, FINAL, EVERY or ASYNC
+        every : number of iterations between two exports (for EVERY)
+        extension : file extension, .mps.gz for compressed MPS files and .rlp
+                    otherwise (.mps for ASYNC)
+        writer : background thread writing the files (for ASYNC)
+        pending : the export being written in the background, or None
+    """
+
+    def __init__(self, policy=FINAL, compressed=False):
+        self.every = 1
+        if policy.startswith(EVERY + '-'):
+            self.every = int(policy[len(EVERY) + 1:])
+            policy = EVERY
+        if not policy in (OFF, FINAL, EVERY, ASYNC) or self.every < 1:
+            raise CLArgumentsNotMatch(
+                'ERROR: Unknown export policy {}'.format(policy))
+        self.policy = policy
+        self.extension = '.mps.gz' if compressed else '.rlp'
+        if policy == ASYNC and not compressed:
+            print('Note: the model is exported as .mps files, not .rlp, with --export=async.')
+            self.extension = '.mps'
+        self.writer = None
+        self.pending = None
+
+    def export(self, model, name, iteration):
+        """Write the model of an iteration of the heuristic, if the policy
+        says so
+
+        Attributes:
+            model : SolverBackend (see solverBackend.py)
+            name : file name, without extension
+            iteration : number of the iteration
+        """
+        if self.policy == EVERY and iteration % self.every == 0:
+            model.write(name + self.extension)
+        elif self.policy == ASYNC:
+            self._write_in_background(model, name)
+
+    def export_final(self, model, name):
+        """Write the final model, unless the policy is off"""
+        if self.policy == ASYNC:
+            self.close()  # the final model is always written
+            self._write_in_background(model, name)
+        elif self.policy != OFF:
+            model.write(name + self.extension)
+
+    def close(self):
+        """Wait until the background exports are written"""
+        if self.pending is not None:
+            self.pending.result()
+            self.pending = None
+
+    def _write_in_background(self, model, name):
+        if self.pending is not None and not self.pending.done():
+            print('Note: {} is not exported, the previous export is still being written.'.format(
+                name + self.extension))
+            return
+        if self.writer is None:
+            self.writer = ThreadPoolExecutor(1)
+        state = model.begin_snapshot()
+        self.pending = self.writer.submit(
+            lambda: write_mps(name + self.extension, model.complete_snapshot(state)))
@@ -1,90 +1,244 @@
 # Implementation of Multiproportional algorithm for OD matrix estimation
 # @author: Ruby Abrams, Hai Nguyen, Nate May
 
+import hashlib
+import struct
+import zipfile
+from array import array
+from collections.abc import Mapping
+from heapq import heappush, heappop
 import numpy as np
 import networkx as nx
 from scipy.sparse import *
 from scipy import *
 import time
 
+from exceptions import *
+from graph import *
+
 # relative error
 EPSILON = 0.02
 
 
-def create_arc_paths(G):
-    # remove edges without any passenger from our graph
-    waiting_edges = []
-    for u, v in G.edges():
-        if G.edges[u, v]['num_passengers'] == 0:
-            waiting_edges.append((u, v))
-    G.remove_edges_from(waiting_edges)
+class PathStore:
+    """Shortest paths between all pairs of distinct nodes of a graph, kept as
+    integer arc ids in one shared CSR buffer rather than as lists of node names
 
-    arc_paths = {}
+    Paths from the same source are stored consecutively, sorted by sink.
 
-    for (u, v, c) in G.edges.data('num_passengers'):
-        arc_paths[u + '-->' + v] = [c]
+    Attributes:
+        graph : TimeExpandedGraph whose node and arc ids the paths refer to
+        sources : array with the source node id of every path
+        sinks : array with the sink node id of every path
+        indptr : the arcs of path i are arc_ids[indptr[i]:indptr[i + 1]]
+        arc_ids : array with the arc ids of all paths
+    """
 
-    paths = dict(nx.all_pairs_shortest_path(G))
+    def __init__(self, graph, sources, sinks, indptr, arc_ids):
+        self.graph = graph
+        self.sources = sources
+        self.sinks = sinks
+        self.indptr = indptr
+        self.arc_ids = arc_ids
 
-    # compute proportions by finding shortest paths
-    for source in paths:
-        for sink in paths[source]:
-            if source == sink:
-                continue
-            for u, v in zip(paths[source][sink], paths[source][sink][1:]):
-                # excluding paths from nodes to themselves
-                # if source != sink:
-                arc_paths[u + '-->' + v].append(paths[source][sink])
-    return paths, arc_paths
+        # paths from source s are source_ptr[s]:source_ptr[s + 1]
+        self.source_ptr = np.searchsorted(
+            sources, np.arange(graph.number_of_nodes() + 1))
 
+    def __len__(self):
+        return len(self.sources)
 
-def multiproportional(arc_paths):
-    '''
-    will read through the dictionary of the following structure
-    arc_paths = {arc: [weight, ['node1','node2',...,'noden'],...,['node1',...,'nodem']]}
-    and output a vector X which will be used to determine
-    entries of OD matrix
+    def od_pairs(self):
+        """Iterate over the (source, sink) names of all paths"""
+        names = self.graph.names
+        for s, t in zip(self.sources.tolist(), self.sinks.tolist()):
+            yield names[s], names[t]
+
+    def path_index(self, source, sink):
+        """Index of the path from source to sink"""
+        s = self.graph.node_idx[source]
+        t = self.graph.node_idx[sink]
+        lo, hi = self.source_ptr[s], self.source_ptr[s + 1]
+        i = lo + np.searchsorted(self.sinks[lo:hi], t)
+        if i == hi or self.sinks[i] != t:
+            raise KeyError((source, sink))
+        return i
+
+    def path_arc_ids(self, source, sink):
+        """Array with the ids of the arcs on the path from source to sink"""
+        i = self.path_index(source, sink)
+        return self.arc_ids[self.indptr[i]:self.indptr[i + 1]]
+
+    def path_arcs(self, source, sink):
+        """List of arcs (u, v) on the path from source to sink"""
+        return [self.graph.arc_names(a)
+                for a in self.path_arc_ids(source, sink).tolist()]
+
+    def incidence(self):
+        """Sparse path-arc incidence matrix, with one row for every path and
+        one column for every arc"""
+        return csr_matrix((np.ones(len(self.arc_ids)), self.arc_ids, self.indptr),
+                          shape=(len(self), self.graph.number_of_arcs()))
+
+
+class ODMatrix(Mapping):
+    """Number of passengers of every OD pair, kept as one array aligned with
+    the paths of a PathStore
+
+    It reads like a dict of (source, sink) node names and counts; the names
+    are only looked up when it is used as one.
+
+    Attributes:
+        path_store : PathStore with the path of every OD pair
+        counts : array with the number of passengers of every path
+    """
+
+    def __init__(self, path_store, counts):
+        self.path_store = path_store
+        self.counts = counts
+
+    def __len__(self):
+        return len(self.counts)
+
+    def __iter__(self):
+        return self.path_store.od_pairs()
+
+    def __getitem__(self, od):
+        return float(self.counts[self.path_store.path_index(*od)])
+
+    def values(self):
+        return self.counts.tolist()
+
+    def items(self):
+        return zip(self.path_store.od_pairs(), self.counts.tolist())
+
+
+def create_arc_paths(graph, max_travel_time=None):
+    """ Find a shortest path (fewest arcs) between every pair of nodes of the
+    graph of passenger arcs, and return them as a PathStore
+
+    The graph is time-expanded, hence acyclic, so the nodes reachable from a
+    source are swept once in topological (time) order; a node's shortest path
+    is final once it is reached in the sweep. Among paths with equally few
+    arcs, the one through the earliest predecessor in that order is kept.
+
+    Attributes:
+        graph : TimeExpandedGraph (a networkx graph is converted first)
+        max_travel_time : longest passenger journey (in minutes) to consider,
+                          or None for no limit (single arcs are always kept)
+    """
+    if not isinstance(graph, TimeExpandedGraph):
+        graph = time_expanded_graph_from_networkx(graph)
+
+    # leave out edges without any passenger; node ids are in topological order
+    passenger_graph = graph.passenger_graph()
+
+    event_times = passenger_graph.time.tolist()
+    arc_tail = passenger_graph.tail.tolist()
+    arc_head = passenger_graph.head.tolist()
+    out_ptr = passenger_graph.out_ptr.tolist()
+    out_arcs = passenger_graph.out_arcs.tolist()
+
+    sources = array('i')
+    sinks = array('i')
+    indptr = array('q', [0])
+    arc_ids = array('i')
+
+    for s in range(passenger_graph.number_of_nodes()):
+        if max_travel_time is None:
+            latest = float('inf')
+        else:
+            latest = event_times[s] + max_travel_time
+
+        # sweep of the nodes reachable from s, keeping the number of arcs of
+        # the shortest path to each node and its last arc
+        num_arcs = {s: 0}
+        parent_arc = {s: -1}
+        heap = [s]
+        while heap:
+            v = heappop(heap)
+            for a in out_arcs[out_ptr[v]:out_ptr[v + 1]]:
+                w = arc_head[a]
+                if v != s and event_times[w] > latest:
+                    continue
+                if w not in num_arcs:
+                    num_arcs[w] = num_arcs[v] + 1
+                    parent_arc[w] = a
+                    heappush(heap, w)
+                elif num_arcs[v] + 1 < num_arcs[w]:
+                    num_arcs[w] = num_arcs[v] + 1
+                    parent_arc[w] = a
+
+        # excluding paths from nodes to themselves
+        del parent_arc[s]
+        for t in sorted(parent_arc):
+            path = []
+            v = t
+            while v != s:
+                path.append(parent_arc[v])
+                v = arc_tail[parent_arc[v]]
+            arc_ids.extend(reversed(path))
+            sources.append(s)
+            sinks.append(t)
+            indptr.append(len(arc_ids))
+
+    return PathStore(passenger_graph,
+                     np.frombuffer(sources, dtype=np.int32),
+                     np.frombuffer(sinks, dtype=np.int32),
+                     np.frombuffer(indptr, dtype=np.int64),
+                     np.frombuffer(arc_ids, dtype=np.int32))
+
+
+def multiproportional(incidence, V_hat, jacobi=False):
     '''
-    # will create a dictionary refering to the index of each arc
-    arc_idx = {arc: i for i, arc in enumerate(arc_paths)}
+    will take the sparse path-arc incidence matrix (paths x arcs) and the
+    true weight of every arc, and output a vector X which will be used to
+    determine entries of OD matrix (the product of X_a's along a path)
 
+    The products of X_a's over all paths are computed at once in log-space,
+    as incidence * log(X). By default the arcs are updated one after the
+    other within a sweep, each update seeing the previous ones. With
+    jacobi=True, all arcs are updated simultaneously from the previous sweep
+    with two sparse products per sweep. The simultaneous update is damped to
+    the power 1/(longest path length), as in generalised iterative scaling,
+    since the undamped one oscillates; it needs more, but much cheaper, sweeps.
+    '''
     # local variables
     n = 0  # iteration number
-    L = len(arc_paths)  # total number of links/arc_idx
-    X = np.ones(L)
+    L = incidence.shape[1]  # total number of links/arcs
+    log_X = np.zeros(L)
     V = np.ones(L)  # storage for converging weights
-    V_hat = np.ones(L)  # true weights
 
-    # collect all true weights for every arc
-    for arc, value in arc_paths.items():
-        V_hat[arc_idx[arc]] = value[0]
+    # paths running through each arc
+    arc_paths = incidence.tocsc()
+    # number of arcs on the longest path
+    max_path_length = max(np.diff(incidence.indptr).max(initial=0), 1)
 
     while not is_convergence(V_hat, V):
-        # for each arc a
-        for arc, value in arc_paths.items():
-            total = 0  # used to collect sums of products of X_a's
-            num_paths = len(value) - 1
-            # sum over all products of X_a's for each path running through this arc
-            for path_index in range(num_paths):
-                # this is one path through the arc
-                path = value[path_index + 1]
-                # iterate through each pair of nodes in the path
-                # and collect X_a values
-                X_temp = np.array([X[arc_idx[node1 + '-->' + node2]]
-                                   for node1, node2 in zip(path, path[1:])])
-                # for each path, compute the product of X_a's
-                # and add it to the running total for each arc
-                total += np.product(X_temp)
-
-            # intermediary step
-            Y_a = V_hat[arc_idx[arc]] / total
-            # update the arc X_a value
-            X[arc_idx[arc]] = X[arc_idx[arc]] * Y_a
-            # update converging values of V_a
-            V[arc_idx[arc]] = total
+        # for each path, the product of X_a's
+        path_products = np.exp(incidence @ log_X)
+
+        if jacobi:
+            # sum over all products of X_a's for each path running through
+            # every arc
+            V = incidence.T @ path_products
+            log_X += np.log(V_hat / V) / max_path_length
+        else:
+            for a in range(L):
+                paths = arc_paths.indices[arc_paths.indptr[a]:arc_paths.indptr[a + 1]]
+                total = path_products[paths].sum()
+
+                # intermediary step
+                Y_a = V_hat[a] / total
+                # update the arc X_a value and the products of the paths
+                # through it
+                log_X[a] += np.log(Y_a)
+                path_products[paths] *= Y_a
+                # update converging values of V_a
+                V[a] = total
         # update iteration number n
         n += 1
-    return X
+    return np.exp(log_X)
 
 
 def is_convergence(V_hat, V):
@@ -93,42 +247,132 @@ def is_convergence(V_hat, V):
     return (np.abs(V_hat - V) / np.abs(V_hat) < EPSILON).all()
 
 
-def generate_OD_matrix(graph):
+def generate_OD_matrix(graph, path_store=None, jacobi=False):
     '''
     This will generate a sparse matrix of the OD generate_OD_matrix.
-    Given the X vector and arc_paths, all non-zero entries will be returned in
-    a dictionary whose key is the arc and value is the number of passengers of
-    that kind.
+    Given the X vector and the paths, the number of passengers of every path
+    is returned as an ODMatrix, which reads like a dictionary whose key is the
+    (source, sink) pair and value is the number of passengers of that kind.
+
+    Attributes:
+        graph : TimeExpandedGraph or networkx graph
+        path_store : PathStore of the graph (found with create_arc_paths if not given)
+        jacobi : update all arcs at once in multiproportional
     '''
 
     print("Estimating OD Matrix ...", end=" ")
     t1 = time.time()
 
-    nodes = graph.nodes()
-    N = len(nodes)
-    nod_idx = {node: i for i, node in enumerate(nodes)}
-
-    shortest_paths, arc_paths = create_arc_paths(graph)
-
-    X = multiproportional(arc_paths)
-    T = dok_matrix((N, N))
-    arc_idx = {arc: i for i, arc in enumerate(arc_paths)}
-
-    # OD matrix dictionary
-    OD = {}
-    # iterate through all sources
-    for source, val in shortest_paths.items():
-        # for every sink
-        for sink, path in val.items():
-            # dont add include paths from a node to itself
-            if sink != source:
-                # collect the X_a values for all arcs in the path
-                X_a = np.product(np.array(
-                    [X[arc_idx[node1 + '-->' + node2]] for node1, node2 in zip(path, path[1:])]))
-                T[nod_idx[source], nod_idx[sink]] = np.round(X_a)
-                # populate a dictionary of the non-zero entries too
-                OD[(source, sink)] = np.round(X_a)
+    if path_store is None:
+        path_store = create_arc_paths(graph)
+
+    incidence = path_store.incidence()
+    X = multiproportional(
+        incidence, path_store.graph.num_passengers.astype(float), jacobi)
+
+    # the product of the X_a values of all arcs in each path
+    counts = np.round(np.exp(incidence @ np.log(X)))
+
+    OD = ODMatrix(path_store, counts)
 
     t2 = time.time()
     print('Finished! Took {:.5f} seconds'.format(t2 - t1))
     return OD
+
+
+def graph_hash(graph):
+    """SHA-1 hex digest identifying the graph: its node names and the ids and
+    data of its arcs, hashed as raw arrays (a networkx graph is converted
+    first)"""
+    if not isinstance(graph, TimeExpandedGraph):
+        graph = time_expanded_graph_from_networkx(graph)
+
+    sha = hashlib.sha1('\n'.join(graph.names).encode())
+    for data in (graph.tail, graph.head, graph.num_passengers, graph.travel_time):
+        sha.update(np.ascontiguousarray(data, dtype=np.int32).tobytes())
+    return sha.hexdigest()
+
+
+def save_od(OD, graph, file_name, max_travel_time=None):
+    """Save the OD matrix and its paths as an uncompressed .npz file of
+    integer arrays (the CSR arrays of the PathStore and the float32 counts),
+    tagged with the hash of the graph and the longest journey of the paths
+
+    Attributes:
+        OD : ODMatrix
+        graph : TimeExpandedGraph the OD matrix was estimated on
+        file_name : name of the .npz file
+        max_travel_time : longest passenger journey of the paths (see
+                          create_arc_paths), or None for no limit
+    """
+    path_store = OD.path_store
+    with open(file_name, 'wb') as f:
+        np.savez(f, graph_hash=np.array(graph_hash(graph)),
+                 max_travel_time=np.array(-1 if max_travel_time is None else max_travel_time),
+                 sources=path_store.sources, sinks=path_store.sinks,
+                 indptr=path_store.indptr, arc_ids=path_store.arc_ids,
+                 counts=np.asarray(OD.counts, dtype=np.float32))
+
+
+def load_od(file_name, graph, max_travel_time=None):
+    """Load an OD matrix and its paths saved by save_od; the arrays are
+    memory-mapped, not read
+
+    Attributes:
+        file_name : name of the .npz file
+        graph : TimeExpandedGraph the OD matrix is going to be used with
+        max_travel_time : longest passenger journey of the paths, or None
+
+    Return an ODMatrix, whose path_store has the paths.
+    Raise ODMatrixMismatch if the OD matrix was estimated on another graph
+    or with another longest journey
+    """
+    data = memmap_npz(file_name)
+    if str(data['graph_hash']) != graph_hash(graph):
+        raise ODMatrixMismatch(
+            'ERROR: {} was estimated on a different graph'.format(file_name))
+    if int(data['max_travel_time']) != (-1 if max_travel_time is None else max_travel_time):
+        raise ODMatrixMismatch(
+            'ERROR: {} was estimated with a different journey limit'.format(file_name))
+
+    path_store = PathStore(graph.passenger_graph(), data['sources'], data['sinks'],
+                           data['indptr'], data['arc_ids'])
+    return ODMatrix(path_store, data['counts'])
+
+
+def memmap_npz(file_name):
+    """Memory-map the arrays of an uncompressed .npz file (as written by
+    np.savez): the data of every array starts after the local header of its
+    zip member and the header of the .npy format
+
+    Return a dict of array names and arrays (compressed, empty and 0-d
+    arrays are read)
+    """
+    arrays = dict()
+    with zipfile.ZipFile(file_name) as archive, open(file_name, 'rb') as f:
+        for info in archive.infolist():
+            name = info.filename[:-len('.npy')]
+            if info.compress_type != zipfile.ZIP_STORED:
+                with archive.open(info) as member:
+                    arrays[name] = np.lib.format.read_array(member, allow_pickle=False)
+                continue
+
+            # local header: 30 bytes, then the file name and the extra field
+            f.seek(info.header_offset + 26)
+            name_length, extra_length = struct.unpack('<HH', f.read(4))
+            f.seek(info.header_offset + 30 + name_length + extra_length)
+            version = np.lib.format.read_magic(f)
+            if version == (1, 0):
+                shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(f)
+            else:
+                shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(f)
+
+            if dtype.hasobject:
+                raise ValueError('{} has an object array'.format(file_name))
+            if len(shape) == 0 or 0 in shape:
+                arrays[name] = np.fromfile(f, dtype=dtype, count=int(np.prod(shape))).reshape(
+                    shape, order='F' if fortran_order else 'C')
+            else:
+                arrays[name] = np.memmap(f, dtype=dtype, mode='r', offset=f.tell(), shape=shape,
+                                         order='F' if fortran_order else 'C')
+    return arrays
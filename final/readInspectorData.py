@@ -41,3 +41,50 @@ def create_depot_inspector_dict(inspector_dict):
     for val in res.values():
         val.sort(key=lambda x: x[1], reverse=True)
     return {k: [i[0] for i in val] for k, val in res.items()}
+
+
+def create_inspector_classes(inspector_dict):
+    """Group interchangeable inspectors (same depot and same max working
+    hours) into classes
+
+    Attributes:
+        inspectors : dict of inspectors
+
+    Return a dict with class ids as keys and dicts with the 'base',
+    'working_hours', 'size' and 'inspectors' (list of inspector_id) of the
+    class as values
+    """
+    classes = dict()
+    class_ids = dict()
+    for depot, ids in create_depot_inspector_dict(inspector_dict).items():
+        for inspector in ids:
+            working_hours = inspector_dict[inspector]['working_hours']
+            c = class_ids.setdefault((depot, working_hours), len(class_ids))
+            if c not in classes:
+                classes[c] = {"base": depot,
+                              "working_hours": working_hours,
+                              "size": 0,
+                              "inspectors": []}
+            classes[c]['size'] += 1
+            classes[c]['inspectors'].append(inspector)
+    return classes
+
+
+def split_inspector_classes(classes, class_ids):
+    """Replace the given classes by one class for every inspector in them,
+    with new class ids
+
+    Attributes:
+        classes : dict of inspector classes (see create_inspector_classes)
+        class_ids : list of the ids of the classes to split
+    """
+    res = {c: vals for c, vals in classes.items() if not c in class_ids}
+    next_id = max(classes) + 1
+    for c in class_ids:
+        for inspector in classes[c]['inspectors']:
+            res[next_id] = {"base": classes[c]['base'],
+                            "working_hours": classes[c]['working_hours'],
+                            "size": 1,
+                            "inspectors": [inspector]}
+            next_id += 1
+    return res
@@ -0,0 +1,158 @@
+# Rolling-horizon decomposition: the duties are chosen window by window along
+# the time axis, each window with the coverage of the earlier ones fixed
+
+import time
+import numpy as np
+from scipy.sparse import *
+
+from eventTime import *
+from graph import *
+from readInspectorData import *
+from columnGeneration import *
+
+
+def window_od_coverage(event_graph, od_coverage, inspected, first, last):
+    """Restrict the OD coverage to the arcs between first and last (in
+    minutes) and to the OD pairs using them that are not fully inspected
+
+    Attributes:
+        event_graph : TimeExpandedGraph of the timetable
+        od_coverage : result of create_od_coverage
+        inspected : array with the inspected share of every OD pair
+        first, last : time window of the arcs
+
+    Return the restricted od_coverage and the indices of its OD pairs
+    """
+    od_pairs, od_counts, coverage, covered_arcs = od_coverage
+    in_window = (event_graph.time[event_graph.tail[covered_arcs]] >= first) & \
+        (event_graph.time[event_graph.head[covered_arcs]] <= last)
+    window_coverage = coverage[:, in_window]
+    rows = np.flatnonzero((window_coverage.getnnz(axis=1) > 0) & (inspected < 1))
+    return (od_pairs[rows], od_counts[rows],
+            window_coverage[rows], covered_arcs[in_window]), rows
+
+
+def window_subgraph(event_graph, first, last):
+    """Sub-DAG of the arcs between first and last (in minutes), the only
+    arcs a duty of the window can use
+
+    Attributes:
+        event_graph : TimeExpandedGraph of the timetable
+        first, last : time window of the arcs
+
+    Return the TimeExpandedGraph with these arcs (and all the nodes) and the
+    array with the event_graph id of each of its arcs
+    """
+    in_window = (event_graph.time[event_graph.tail] >= first) & \
+        (event_graph.time[event_graph.head] <= last)
+    return event_graph.arc_subgraph(in_window), np.flatnonzero(in_window)
+
+
+def solve_by_rolling_horizon(event_graph, path_store, OD, inspectors,
+                             max_num_inspectors, window_hours=4, solver='gurobi',
+                             mip_gap=0, max_iterations=100, duties_per_class=5):
+    """Schedule the inspectors window by window: the duties starting in a
+    window and in the following half window (the look-ahead) are generated
+    by column generation and chosen by the integer master problem, with the
+    passengers inspected by the duties of the earlier windows fixed; only the
+    duties starting in the window itself are kept
+
+    A window model only has the arcs a duty starting in the window or its
+    look-ahead can reach, and the OD pairs using them; its duties are priced
+    on the sub-DAG of these arcs. Each window may use
+    its share of the remaining inspectors, in proportion to the passenger
+    minutes on its arcs among those of the rest of the day.
+
+    Attributes:
+        event_graph : TimeExpandedGraph of the timetable
+        path_store : PathStore of the OD pairs (on the passenger arcs of the
+                     event_graph)
+        OD : origin-destination matrix
+        inspectors : dict of inspectors
+        max_num_inspectors : maximum number of inspectors at work
+        window_hours : length of a window
+        solver : name of the MIP solver (see solverBackend.py)
+        mip_gap : relative MIP gap of the window problems
+        max_iterations : maximum number of column generation iterations
+        duties_per_class : maximum number of new duties per class and iteration
+
+    Return the schedules in the same format as print_solution_paths
+    """
+    print("Rolling horizon ...")
+    t1 = time.time()
+
+    classes = create_inspector_classes(inspectors)
+    od_coverage = create_od_coverage(event_graph, path_store, OD)
+    od_counts = np.array(od_coverage[1])
+    coverage = od_coverage[2]
+    column_of = {a: j for j, a in enumerate(od_coverage[3].tolist())}
+    max_hours = max(vals['working_hours'] for vals in classes.values())
+
+    # passenger minutes by the time of the tail of every arc
+    arc_times = event_graph.time[event_graph.tail]
+    passenger_minutes = event_graph.num_passengers * event_graph.travel_time
+
+    window = window_hours * MINUTES_PER_HOUR
+    look_ahead = window // 2
+    first_time, last_time = event_graph.time.min(), event_graph.time.max()
+
+    inspected = np.zeros(len(od_counts))
+    free = {c: vals['size'] for c, vals in classes.items()}
+    chosen = []
+    start = first_time
+    while start <= last_time and len(chosen) < max_num_inspectors:
+        end = start + window
+        window_classes = {c: dict(vals, size=free[c])
+                          for c, vals in classes.items() if free[c] > 0}
+        if not window_classes:
+            break
+
+        rest = passenger_minutes[arc_times >= start].sum()
+        share = passenger_minutes[(arc_times >= start) &
+                                  (arc_times < end + look_ahead)].sum()
+        if share == 0:
+            start = end
+            continue
+        budget = int(np.ceil((max_num_inspectors - len(chosen)) * share / rest))
+
+        horizon = end + look_ahead + max_hours * MINUTES_PER_HOUR
+        window_coverage, rows = window_od_coverage(
+            event_graph, od_coverage, inspected, start, horizon)
+
+        # the same coverage on the arc ids of the sub-DAG of the window
+        window_graph, window_arcs = window_subgraph(event_graph, start, horizon)
+        window_coverage = window_coverage[:3] + (
+            np.searchsorted(window_arcs, window_coverage[3]),)
+        duties = generate_duties(window_graph, path_store, OD, window_classes,
+                                 budget, solver, max_iterations, duties_per_class,
+                                 window_coverage, inspected[rows],
+                                 (start, end + look_ahead))
+        window_duties = choose_duties(window_classes, duties, budget,
+                                      window_coverage, solver, mip_gap,
+                                      inspected[rows])
+
+        # keep the duties starting in the window
+        kept = 0
+        for c, duty in window_duties:
+            duty = window_arcs[duty].tolist()
+            if event_graph.time[event_graph.tail[duty[0]]] >= end:
+                continue
+            chosen.append((c, duty))
+            free[c] -= 1
+            kept += 1
+            cols = [column_of[a] for a in duty if a in column_of]
+            inspected += coverage[:, cols].sum(axis=1).A1
+
+        print('Window {} - {}: {} OD pairs, {} duties, {} kept'.format(
+            to_timestamp(int(start)), to_timestamp(int(end)),
+            len(rows), len(duties), kept))
+        start = end
+
+    rows = assign_inspectors(event_graph, classes, chosen)
+    write_schedule_csv(rows, "schedule_for_{}_inspectors.csv".format(len(inspectors)))
+
+    t2 = time.time()
+    print('Rolling horizon finished. Took {:.5f} seconds'.format(t2 - t1))
+    print('Schedules for {} inspectors inspect {:.3f} passengers'.format(
+        len(chosen), (od_counts * np.minimum(inspected, 1)).sum()))
+    return schedule_frame(rows)
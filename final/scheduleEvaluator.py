@@ -0,0 +1,237 @@
+"""Number of passengers inspected by given schedules, without a MIP solver
+
+INVOCATION
+$ python3 scheduleEvaluator.py timetable chosenDay scheduleFile [--load-od] [--inspectors=FILE]
+
+timetable -- name of the XML file from which train timetable is extracted.
+chosenDay -- the day of the schedules (e.g., Mon, Tue, etc).
+scheduleFile -- CSV file with the schedules (e.g., schedule_for_30_inspectors.csv).
+
+[options] -- options to load od matrix from a file (--load-od)
+          -- only consider passenger journeys of at most MIN minutes (--od-horizon=MIN)
+          -- check the working hours and bases of the inspectors in FILE (--inspectors=FILE)
+
+EXAMPLE:
+$ python3 scheduleEvaluator.py EN_GRIPS2019_401.xml Mon schedule_for_30_inspectors.csv --load-od
+"""
+
+import sys
+import xml.etree.ElementTree as ET
+import numpy as np
+import pandas as pd
+
+from exceptions import *
+from edgeCache import *
+from graph import *
+from odMatrix import *
+from columnGeneration import *
+
+
+class ScheduleEvaluator:
+    """Expected number of inspected passengers of schedules: an inspector on
+    an arc inspects KAPPA passengers per minute, spread over the passengers
+    of the arc, and an OD pair counts as inspected up to all its passengers
+
+    The coverage matrix is found once, so that every evaluation is one
+    sparse product.
+
+    Attributes:
+        event_graph : TimeExpandedGraph of the timetable
+        od_counts : array with the number of passengers of every OD pair
+        coverage : sparse matrix with the share of the passengers of every OD
+                   pair (row) inspected by one inspector on every covered arc
+                   (column)
+        arc_column : array with the column of every arc of the event_graph
+                     in the coverage matrix (-1 for arcs without passengers)
+        arc_keys : sorted array of tail * number of nodes + head of the arcs
+        arc_order : arc id of every entry of arc_keys
+    """
+
+    def __init__(self, event_graph, path_store, OD):
+        self.event_graph = event_graph
+        od_pairs, od_counts, coverage, covered_arcs = create_od_coverage(
+            event_graph, path_store, OD)
+        self.od_counts = np.array(od_counts)
+        self.coverage = coverage.tocsr()
+        self.arc_column = np.full(event_graph.number_of_arcs(), -1)
+        self.arc_column[covered_arcs] = np.arange(len(covered_arcs))
+
+        keys = event_graph.tail.astype(np.int64) * event_graph.number_of_nodes() + \
+            event_graph.head
+        self.arc_order = np.argsort(keys, kind='stable')
+        self.arc_keys = keys[self.arc_order]
+
+    def total_passengers(self):
+        return self.od_counts.sum()
+
+    def schedule_arcs(self, schedule):
+        """Arc ids of the rows of the schedules between two events (the rows
+        from the sources and to the sinks are left out)
+
+        Attributes:
+            schedule : DataFrame with the columns 'start_station_and_time'
+                       and 'end_station_and_time'
+        """
+        node_idx = self.event_graph.node_idx
+        tails = np.array([node_idx.get(u, -1)
+                          for u in schedule['start_station_and_time'].tolist()])
+        heads = np.array([node_idx.get(v, -1)
+                          for v in schedule['end_station_and_time'].tolist()])
+        events = (tails >= 0) & (heads >= 0)
+        keys = tails[events] * self.event_graph.number_of_nodes() + heads[events]
+        if not len(keys) or not len(self.arc_keys):
+            if len(keys):
+                print('Note: {} arcs of the schedules are not in the timetable.'.format(
+                    len(keys)))
+            return np.array([], dtype=np.int64)
+
+        pos = np.minimum(np.searchsorted(self.arc_keys, keys), len(self.arc_keys) - 1)
+        found = self.arc_keys[pos] == keys
+        if not found.all():
+            print('Note: {} arcs of the schedules are not in the timetable.'.format(
+                (~found).sum()))
+        return self.arc_order[pos[found]]
+
+    def inspected_shares(self, arcs):
+        """Inspected share of the passengers of every OD pair, for the
+        inspectors on the given arcs (an arc id for every inspector on it)"""
+        columns = self.arc_column[arcs]
+        columns = columns[columns >= 0]
+        counts = np.bincount(columns, minlength=self.coverage.shape[1])
+        return self.coverage @ counts
+
+    def evaluate(self, schedule):
+        """Expected number of passengers inspected by the schedules"""
+        shares = self.inspected_shares(self.schedule_arcs(schedule))
+        return (self.od_counts * np.minimum(shares, 1)).sum()
+
+    def inspector_spans(self, schedule):
+        """Dict of inspector_id and the node ids of the first and the last
+        event of their schedule (the heads of the rows from their source and
+        the tails of the rows to their sink, -1 for unknown events)"""
+        node_idx = self.event_graph.node_idx
+        first, last = dict(), dict()
+        for u, v, k in zip(schedule['start_station_and_time'].tolist(),
+                           schedule['end_station_and_time'].tolist(),
+                           schedule['inspector_id'].tolist()):
+            if u.startswith('source_'):
+                first[k] = node_idx.get(v, -1)
+            if v.startswith('sink_'):
+                last[k] = node_idx.get(u, -1)
+        return {k: (first[k], last.get(k, -1)) for k in first}
+
+    def working_hours_violations(self, schedule, inspectors):
+        """Schedules longer than the working hours of their inspector, from
+        their first to their last event, as in add_time_flow_constraint
+
+        Attributes:
+            schedule : DataFrame of schedules (see read_schedule)
+            inspectors : dict of inspectors (see extract_inspectors_data)
+
+        Return a list of (inspector_id, minutes worked, working hours)
+        """
+        violations = []
+        for k, (first, last) in self.inspector_spans(schedule).items():
+            if not k in inspectors or first < 0 or last < 0:
+                continue
+            minutes = int(self.event_graph.time[last] - self.event_graph.time[first])
+            if minutes > inspectors[k]['working_hours'] * HOUR_TO_MINUTES:
+                violations.append((k, minutes, inspectors[k]['working_hours']))
+        return violations
+
+    def base_violations(self, schedule, inspectors):
+        """Schedules which do not start and end at the base of their inspector
+
+        Attributes:
+            schedule : DataFrame of schedules (see read_schedule)
+            inspectors : dict of inspectors (see extract_inspectors_data)
+
+        Return a list of (inspector_id, station, base), with the station of
+        the first or the last event that is not the base
+        """
+        stations = self.event_graph.stations
+        station = self.event_graph.station
+        violations = []
+        for k, (first, last) in self.inspector_spans(schedule).items():
+            if not k in inspectors:
+                continue
+            for node in (first, last):
+                if node >= 0 and stations[station[node]] != inspectors[k]['base']:
+                    violations.append((k, stations[station[node]], inspectors[k]['base']))
+                    break
+        return violations
+
+
+def read_schedule(file_name):
+    """Read schedules in the CSV layout of print_solution_paths"""
+    return pd.read_csv(file_name, index_col=0)
+
+
+def main(argv):
+    try:
+        if len(argv) < 3:
+            raise CLArgumentsNotMatch(
+                'ERROR: Command-line arguments do not match')
+
+        timetable_file = argv[0]
+        chosen_day = argv[1]
+        schedule_file = argv[2]
+
+        if not chosen_day in DAYS:
+            raise DayNotFound('ERROR: Day not found')
+
+        edges, all_stations = extract_edges_with_cache(timetable_file, chosen_day)
+        event_graph = construct_time_expanded_graph(edges, chosen_day)
+
+        od_horizon = None
+        od_file = 'savedODMatrix.npz'
+        for arg in argv:
+            if arg.startswith('--od-horizon='):
+                od_horizon = int(arg.split('=')[1])
+                od_file = '{}_{}min.npz'.format(od_file[:-4], od_horizon)
+
+        OD = None
+        if '--load-od' in argv:
+            print('Loading the OD matrix from file ...', end=' ')
+            try:
+                OD = load_od(od_file, event_graph, od_horizon)
+                print("Done")
+            except (FileNotFoundError, ODMatrixMismatch) as error:
+                print(error)
+        if OD is None:
+            OD = generate_OD_matrix(event_graph, create_arc_paths(event_graph, od_horizon))
+        path_store = OD.path_store
+
+        schedule = read_schedule(schedule_file)
+        evaluator = ScheduleEvaluator(event_graph, path_store, OD)
+        inspected = evaluator.evaluate(schedule)
+        total = evaluator.total_passengers()
+        print('{} inspectors inspect {:.3f} of {:.0f} passengers ({:.2f}%)'.format(
+            schedule['inspector_id'].nunique(), inspected, total,
+            100 * inspected / total if total else 0))
+
+        for arg in argv:
+            if arg.startswith('--inspectors='):
+                inspectors = extract_inspectors_data(arg.split('=', 1)[1], all_stations)
+                hours = evaluator.working_hours_violations(schedule, inspectors)
+                bases = evaluator.base_violations(schedule, inspectors)
+                for k, minutes, working_hours in hours:
+                    print('Inspector {} works {} minutes, more than {} hours'.format(
+                        k, minutes, working_hours))
+                for k, station, base in bases:
+                    print('Inspector {} starts or ends at {}, not at the base {}'.format(
+                        k, station, base))
+                if not hours and not bases:
+                    print('All schedules respect the working hours and bases of the inspectors')
+
+    except CLArgumentsNotMatch as error:
+        print(error)
+        sys.stderr.write(__doc__)
+        sys.exit(1)
+
+    except (ET.ParseError, DayNotFound, FileNotFoundError) as error:
+        print(error)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
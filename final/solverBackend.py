@@ -0,0 +1,613 @@
+# Solver-independent interface to the MIP solvers used for the inspection model
+#
+# The model is kept as arrays (columns and constraint rows in CSR form) and
+# handed over to the solver when it is optimized, so the same model building
+# code (see gurobi.py) runs with Gurobi and with the open-source HiGHS solver.
+
+import abc
+import gzip
+import time
+from array import array
+import numpy as np
+from scipy.sparse import csr_matrix
+
+from exceptions import *
+
+try:
+    import gurobipy
+except ImportError:
+    gurobipy = None
+
+try:
+    import highspy
+except ImportError:
+    highspy = None
+
+# variable types and constraint senses (the same characters as in Gurobi)
+BINARY = 'B'
+INTEGER = 'I'
+CONTINUOUS = 'C'
+
+EQUAL = '='
+LESS_EQUAL = '<'
+GREATER_EQUAL = '>'
+
+# solution statuses
+OPTIMAL = 'optimal'
+TIME_LIMIT = 'time_limit'
+INFEASIBLE = 'infeasible'
+
+
+class SolverBackend(abc.ABC):
+    """A MIP model, built solver-independently and solved by a subclass
+
+    Variables are referred to by their column index: add_vars returns a dict
+    of keys and column indices, which is passed wherever gurobipy would take
+    a tupledict of variables. Constraints are referred to by their name.
+
+    Attributes:
+        name : name of the model
+        lb, ub, obj, vtype, var_names : data of the columns
+        row_ptr, row_cols, row_vals : constraint matrix in CSR form
+        col_rows, col_cols, col_vals : coefficients of the columns added
+                                       with their columns (see add_vars)
+        sense, rhs, constr_names : data of the rows
+        maximize : True to maximize the objective
+        params : dict of solver parameters ('mip_gap', 'time_limit', 'threads',
+                 'output')
+        start : dict of column index and value of a (partial) start solution
+        status : status of the last optimization (e.g., OPTIMAL, TIME_LIMIT)
+        objective : objective value of the best solution found
+        values : array with the value of every column in the best solution
+        duals : array with the dual value of every row, for a model without
+                integer variables (the change of the objective per unit
+                increase of the right hand side)
+    """
+
+    solver_name = None
+
+    def __init__(self, name):
+        self.name = name
+        self.lb = array('d')
+        self.ub = array('d')
+        self.obj = array('d')
+        self.vtype = []
+        self.var_names = []
+        self.row_ptr = array('q', [0])
+        self.row_cols = array('i')
+        self.row_vals = array('d')
+        self.col_rows = array('i')
+        self.col_cols = array('i')
+        self.col_vals = array('d')
+        self.sense = []
+        self.rhs = array('d')
+        self.constr_names = []
+        self.constr_idx = dict()
+        self.maximize = False
+        self.params = dict()
+        self.start = dict()
+        self.status = None
+        self.objective = None
+        self.values = None
+        self.duals = None
+
+        # columns and rows already handed over to the solver
+        self.num_loaded_vars = 0
+        self.num_loaded_constrs = 0
+
+    def num_vars(self):
+        return len(self.lb)
+
+    def num_constrs(self):
+        return len(self.rhs)
+
+    def add_vars(self, keys, lb=0, ub=1, obj=0, vtype=BINARY, name='x', columns=None):
+        """Add one variable for every key and return a dict of keys and
+        column indices
+
+        Attributes:
+            keys : iterable of (tuple) keys of the variables
+            lb, ub, obj : bounds and objective coefficient of the variables,
+                          either a number or a list with one value per key
+            vtype : BINARY, INTEGER or CONTINUOUS
+            name : name of the variables, subscripted by their keys
+            columns : list with the (constraint names, coefficients) of every
+                      variable in the constraints added before, or None
+                      (e.g., for column generation; the coefficients are
+                      handed over to the solver only, not kept in the rows)
+        """
+        if columns is not None:
+            self._load()  # the constraints must be in the solver
+
+        keys = list(keys)
+        first = self.num_vars()
+        for values, data in ((lb, self.lb), (ub, self.ub), (obj, self.obj)):
+            if np.isscalar(values):
+                data.extend([values] * len(keys))
+            else:
+                data.extend(values)
+        self.vtype.extend([vtype] * len(keys))
+        self.var_names.extend(
+            '{}[{}]'.format(name, ','.join(map(str, key)) if isinstance(key, tuple) else key)
+            for key in keys)
+
+        if columns is not None:
+            columns = [([self.constr_idx[name] for name in names], list(vals))
+                       for names, vals in columns]
+            for col, (rows, vals) in enumerate(columns, first):
+                self.col_rows.extend(rows)
+                self.col_cols.extend([col] * len(rows))
+                self.col_vals.extend(vals)
+            self._load_vars(first, self.num_vars(), columns)
+            self.num_loaded_vars = self.num_vars()
+        return dict(zip(keys, range(first, first + len(keys))))
+
+    def add_constr(self, cols, vals, sense, rhs, name):
+        """Add the constraint sum(vals[i] * x[cols[i]]) (sense) rhs
+
+        Attributes:
+            cols : list of column indices
+            vals : list of coefficients
+            sense : EQUAL, LESS_EQUAL or GREATER_EQUAL
+            rhs : right hand side
+            name : name of the constraint
+        """
+        self.row_cols.extend(cols)
+        self.row_vals.extend(vals)
+        self.row_ptr.append(len(self.row_cols))
+        self.sense.append(sense)
+        self.rhs.append(rhs)
+        self.constr_idx[name] = len(self.constr_names)
+        self.constr_names.append(name)
+
+    def add_constrs(self, A, cols, sense, rhs, name):
+        """Add the constraints A * x[cols] (sense) rhs, one for every row of
+        the sparse matrix A, named name[0], name[1], ...
+
+        Attributes:
+            A : sparse matrix
+            cols : list of the column indices of the columns of A
+            sense : EQUAL, LESS_EQUAL or GREATER_EQUAL
+            rhs : array with one right hand side for every row of A
+            name : name of the constraints
+        """
+        A = csr_matrix(A)
+        first = self.num_constrs()
+        self.row_cols.frombytes(
+            np.asarray(cols, dtype=np.int32)[A.indices].tobytes())
+        self.row_vals.frombytes(A.data.astype(np.float64).tobytes())
+        self.row_ptr.frombytes(
+            (A.indptr[1:] + self.row_ptr[-1]).astype(np.int64).tobytes())
+        self.sense.extend([sense] * A.shape[0])
+        self.rhs.frombytes(np.asarray(rhs, dtype=np.float64).tobytes())
+        for i in range(A.shape[0]):
+            self.constr_idx['{}[{}]'.format(name, i)] = first + i
+            self.constr_names.append('{}[{}]'.format(name, i))
+
+    def set_maximize(self, maximize=True):
+        self.maximize = maximize
+
+    def set_param(self, name, value):
+        """Set a solver parameter: 'mip_gap', 'time_limit' (in seconds),
+        'threads' or 'output' (0 to turn off the solver log)"""
+        self.params[name] = value
+
+    def set_rhs(self, name, rhs):
+        """Change the right hand side of the constraint with the given name"""
+        row = self.constr_idx[name]
+        self.rhs[row] = rhs
+        if row < self.num_loaded_constrs:
+            self._change_rhs(row, rhs)
+
+    def set_bounds(self, cols, lb, ub):
+        """Change the bounds of the given columns (lb and ub are numbers or
+        lists with one value per column)"""
+        cols = list(cols)
+        lb = [lb] * len(cols) if np.isscalar(lb) else list(lb)
+        ub = [ub] * len(cols) if np.isscalar(ub) else list(ub)
+        for col, l, u in zip(cols, lb, ub):
+            self.lb[col] = l
+            self.ub[col] = u
+        loaded = [i for i, col in enumerate(cols) if col < self.num_loaded_vars]
+        if loaded:
+            self._change_bounds([cols[i] for i in loaded],
+                                [lb[i] for i in loaded], [ub[i] for i in loaded])
+
+    def set_start(self, start):
+        """Set a start solution for the next optimization
+
+        Attributes:
+            start : dict of column index and value (columns left out are
+                    left to the solver)
+        """
+        self.start = dict(start)
+
+    def optimize(self):
+        """Solve the model; the best solution is kept in self.values"""
+        self._load()
+
+        t1 = time.time()
+        self._optimize()
+        t2 = time.time()
+        print('{} finished with status {} and objective {}. Took {:.5f} seconds'.format(
+            self.solver_name, self.status, self.objective, t2 - t1))
+
+    def has_solution(self):
+        return self.values is not None
+
+    def get_values(self, variables):
+        """Values of the variables in the best solution: a dict with the same
+        keys for a dict of column indices, or an array for a list of them"""
+        if isinstance(variables, dict):
+            return dict(zip(variables.keys(),
+                            self.values[list(variables.values())].tolist()))
+        return self.values[list(variables)]
+
+    def get_duals(self, names):
+        """Array with the dual values of the named constraints"""
+        return self.duals[[self.constr_idx[name] for name in names]]
+
+    def snapshot(self):
+        """Copy of the current model data, which later changes of the model
+        leave unchanged (e.g., to write it with write_mps)"""
+        return self.complete_snapshot(self.begin_snapshot())
+
+    def begin_snapshot(self):
+        """Copy the model data that is changed in place (the bounds, right
+        hand sides and objective sense) and the sizes of the data that only
+        grows, without touching the constraint matrix; complete_snapshot
+        turns it into a snapshot, e.g. in a background thread while the
+        model is solved"""
+        return {'name': self.name,
+                'maximize': self.maximize,
+                'lb': self.lb[:], 'ub': self.ub[:], 'rhs': self.rhs[:],
+                'num_vars': self.num_vars(), 'num_constrs': self.num_constrs(),
+                'num_row_nonzeros': len(self.row_cols),
+                'num_col_nonzeros': len(self.col_vals)}
+
+    def complete_snapshot(self, state):
+        """Snapshot of the model (see snapshot) from the state taken by
+        begin_snapshot: the columns and rows added since are left out, and
+        the appended arrays are copied by slicing, each in one step"""
+        num_vars, num_constrs = state['num_vars'], state['num_constrs']
+        nnz, col_nnz = state['num_row_nonzeros'], state['num_col_nonzeros']
+        row_ptr = np.frombuffer(self.row_ptr[:num_constrs + 1], dtype=np.int64)
+        A = csr_matrix((np.frombuffer(self.row_vals[:nnz], dtype=np.float64),
+                        np.frombuffer(self.row_cols[:nnz], dtype=np.int32), row_ptr),
+                       shape=(num_constrs, num_vars))
+        if col_nnz:
+            A = A + csr_matrix((np.frombuffer(self.col_vals[:col_nnz], dtype=np.float64),
+                                (np.frombuffer(self.col_rows[:col_nnz], dtype=np.int32),
+                                 np.frombuffer(self.col_cols[:col_nnz], dtype=np.int32))),
+                               shape=(num_constrs, num_vars))
+        return {'name': state['name'],
+                'maximize': state['maximize'],
+                'lb': np.frombuffer(state['lb'], dtype=np.float64),
+                'ub': np.frombuffer(state['ub'], dtype=np.float64),
+                'obj': np.frombuffer(self.obj[:num_vars], dtype=np.float64),
+                'vtype': self.vtype[:num_vars], 'var_names': self.var_names[:num_vars],
+                'A': A.tocsc(copy=True),
+                'sense': self.sense[:num_constrs],
+                'rhs': np.frombuffer(state['rhs'], dtype=np.float64),
+                'constr_names': self.constr_names[:num_constrs]}
+
+    def write(self, file_name):
+        """Write the model to a file, in the format given by its extension
+        (.mps and .mps.gz files are written by write_mps, the other formats by
+        the solver)"""
+        if file_name.endswith('.mps') or file_name.endswith('.mps.gz'):
+            write_mps(file_name, self.snapshot())
+        else:
+            self._load()
+            self._write(file_name)
+
+    def _load(self):
+        """Hand the columns and rows added since the last call over to the
+        solver"""
+        self._load_vars(self.num_loaded_vars, self.num_vars())
+        self.num_loaded_vars = self.num_vars()
+        self._load_constrs(self.num_loaded_constrs, self.num_constrs())
+        self.num_loaded_constrs = self.num_constrs()
+
+    def _column_data(self, first, last):
+        """Arrays with the lb, ub and obj of the columns first:last"""
+        return tuple(np.frombuffer(data, dtype=np.float64)[first:last]
+                     for data in (self.lb, self.ub, self.obj))
+
+    def _rows(self, first, last):
+        """CSR matrix of the rows first:last"""
+        ptr = np.frombuffer(self.row_ptr, dtype=np.int64)[first:last + 1]
+        cols = np.frombuffer(self.row_cols, dtype=np.int32)[ptr[0]:ptr[-1]]
+        vals = np.frombuffer(self.row_vals, dtype=np.float64)[ptr[0]:ptr[-1]]
+        return csr_matrix((vals, cols, ptr - ptr[0]),
+                          shape=(last - first, self.num_vars()))
+
+    @abc.abstractmethod
+    def _load_vars(self, first, last, columns=None):
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def _load_constrs(self, first, last):
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def _change_rhs(self, row, rhs):
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def _change_bounds(self, cols, lb, ub):
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def _optimize(self):
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def _write(self, file_name):
+        raise NotImplementedError
+
+
+class GurobiBackend(SolverBackend):
+    """SolverBackend solving with Gurobi (gurobipy)
+
+    Attributes:
+        model : gurobipy Model
+        vars : list of the gurobipy variables of the columns
+        constrs : list of the gurobipy constraints of the rows
+    """
+
+    solver_name = 'Gurobi'
+
+    def __init__(self, name):
+        if gurobipy is None:
+            raise SolverNotAvailable('ERROR: gurobipy is not installed')
+        super().__init__(name)
+        self.model = gurobipy.Model(name)
+        self.vars = []
+        self.constrs = []
+
+    def _load_vars(self, first, last, columns=None):
+        if first == last:
+            return
+        lb, ub, obj = self._column_data(first, last)
+        if columns is not None:
+            for i, (rows, vals) in enumerate(columns):
+                self.vars.append(self.model.addVar(
+                    lb=lb[i], ub=ub[i], obj=obj[i], vtype=self.vtype[first + i],
+                    name=self.var_names[first + i],
+                    column=gurobipy.Column(vals, [self.constrs[row] for row in rows])))
+            return
+        new_vars = self.model.addVars(
+            last - first, lb=lb.tolist(), ub=ub.tolist(), obj=obj.tolist(),
+            vtype=self.vtype[first:last], name=self.var_names[first:last])
+        self.vars.extend(new_vars.values())
+
+    def _load_constrs(self, first, last):
+        if first == last:
+            return
+        new_constrs = self.model.addMConstr(
+            self._rows(first, last), self.vars, np.array(self.sense[first:last]),
+            np.frombuffer(self.rhs, dtype=np.float64)[first:last]).tolist()
+        self.model.update()
+        self.model.setAttr('ConstrName', new_constrs,
+                           self.constr_names[first:last])
+        self.constrs.extend(new_constrs)
+
+    def _change_rhs(self, row, rhs):
+        self.constrs[row].RHS = rhs
+
+    def _change_bounds(self, cols, lb, ub):
+        variables = [self.vars[col] for col in cols]
+        self.model.setAttr('LB', variables, lb)
+        self.model.setAttr('UB', variables, ub)
+
+    def _optimize(self):
+        self.model.ModelSense = -1 if self.maximize else 1
+        for name, param in (('mip_gap', 'MIPGap'), ('time_limit', 'TimeLimit'),
+                            ('threads', 'Threads'), ('output', 'OutputFlag')):
+            if name in self.params:
+                self.model.setParam(param, self.params[name])
+
+        # clear the previous start, then set the new one
+        self.model.setAttr('Start', self.vars, [gurobipy.GRB.UNDEFINED] * len(self.vars))
+        if self.start:
+            self.model.setAttr('Start', [self.vars[col] for col in self.start],
+                               list(self.start.values()))
+
+        self.model.optimize()
+
+        statuses = {gurobipy.GRB.OPTIMAL: OPTIMAL,
+                    gurobipy.GRB.TIME_LIMIT: TIME_LIMIT,
+                    gurobipy.GRB.INFEASIBLE: INFEASIBLE}
+        self.status = statuses.get(self.model.Status, str(self.model.Status))
+        if self.model.SolCount > 0:
+            self.objective = self.model.ObjVal
+            self.values = np.array(self.model.getAttr('X', self.vars))
+        else:
+            self.objective = None
+            self.values = None
+        if not self.model.IsMIP and self.status == OPTIMAL:
+            self.duals = np.array(self.model.getAttr('Pi', self.constrs))
+        else:
+            self.duals = None
+
+    def _write(self, file_name):
+        self.model.write(file_name)
+
+
+class HighsBackend(SolverBackend):
+    """SolverBackend solving with the open-source solver HiGHS (highspy)
+
+    Attributes:
+        model : highspy Highs instance
+    """
+
+    solver_name = 'HiGHS'
+
+    def __init__(self, name):
+        if highspy is None:
+            raise SolverNotAvailable('ERROR: highspy is not installed')
+        super().__init__(name)
+        self.model = highspy.Highs()
+
+    def _load_vars(self, first, last, columns=None):
+        if first == last:
+            return
+        num = last - first
+        lb, ub, obj = self._column_data(first, last)
+        if columns is None:
+            columns = [([], [])] * num
+        starts = np.cumsum([0] + [len(rows) for rows, vals in columns[:-1]])
+        rows = np.array([row for rows, vals in columns for row in rows], dtype=np.int32)
+        vals = np.array([val for rows, vals in columns for val in vals], dtype=float)
+        self.model.addCols(num, obj, lb, ub, len(rows), starts.astype(np.int32),
+                           rows, vals)
+        # 0 for continuous and 1 for integer columns
+        integrality = np.array([vtype != CONTINUOUS
+                                for vtype in self.vtype[first:last]], dtype=np.uint8)
+        self.model.changeColsIntegrality(
+            num, np.arange(first, last, dtype=np.int32), integrality)
+        for col in range(first, last):
+            self.model.passColName(col, self.var_names[col])
+
+    def _load_constrs(self, first, last):
+        if first == last:
+            return
+        rows = self._rows(first, last)
+        rhs = np.frombuffer(self.rhs, dtype=np.float64)[first:last]
+        sense = np.array(self.sense[first:last])
+        inf = highspy.kHighsInf
+        lower = np.where(sense == LESS_EQUAL, -inf, rhs)
+        upper = np.where(sense == GREATER_EQUAL, inf, rhs)
+        self.model.addRows(last - first, lower, upper, rows.nnz,
+                           rows.indptr[:-1].astype(np.int32),
+                           rows.indices.astype(np.int32), rows.data)
+        for row in range(first, last):
+            self.model.passRowName(row, self.constr_names[row])
+
+    def _change_rhs(self, row, rhs):
+        inf = highspy.kHighsInf
+        lower = -inf if self.sense[row] == LESS_EQUAL else rhs
+        upper = inf if self.sense[row] == GREATER_EQUAL else rhs
+        self.model.changeRowBounds(row, lower, upper)
+
+    def _change_bounds(self, cols, lb, ub):
+        self.model.changeColsBounds(len(cols), np.array(cols, dtype=np.int32),
+                                    np.array(lb, dtype=float),
+                                    np.array(ub, dtype=float))
+
+    def _optimize(self):
+        self.model.changeObjectiveSense(
+            highspy.ObjSense.kMaximize if self.maximize else highspy.ObjSense.kMinimize)
+        for name, option in (('mip_gap', 'mip_rel_gap'), ('time_limit', 'time_limit'),
+                             ('threads', 'threads')):
+            if name in self.params:
+                self.model.setOptionValue(option, self.params[name])
+        if 'output' in self.params:
+            self.model.setOptionValue('output_flag', bool(self.params['output']))
+
+        if self.start:
+            self.model.setSolution(len(self.start),
+                                   np.fromiter(self.start.keys(), dtype=np.int32),
+                                   np.fromiter(self.start.values(), dtype=float))
+
+        self.model.run()
+
+        model_status = self.model.getModelStatus()
+        statuses = {highspy.HighsModelStatus.kOptimal: OPTIMAL,
+                    highspy.HighsModelStatus.kTimeLimit: TIME_LIMIT,
+                    highspy.HighsModelStatus.kInfeasible: INFEASIBLE}
+        self.status = statuses.get(
+            model_status, self.model.modelStatusToString(model_status))
+        info = self.model.getInfo()
+        if info.primal_solution_status == highspy.SolutionStatus.kSolutionStatusFeasible:
+            self.objective = info.objective_function_value
+            self.values = np.array(self.model.getSolution().col_value)
+        else:
+            self.objective = None
+            self.values = None
+        if (not any(vtype != CONTINUOUS for vtype in self.vtype)
+                and info.dual_solution_status == highspy.SolutionStatus.kSolutionStatusFeasible):
+            self.duals = np.array(self.model.getSolution().row_dual)
+        else:
+            self.duals = None
+
+    def _write(self, file_name):
+        if file_name.endswith('.rlp'):  # Gurobi only
+            file_name = file_name[:-len('.rlp')] + '.lp'
+        self.model.writeModel(file_name)
+
+
+def write_mps(file_name, snapshot):
+    """Write a model in free MPS format, compressed with gzip if the file
+    name ends with .gz
+
+    Attributes:
+        file_name : name of the file
+        snapshot : model data (see SolverBackend.snapshot)
+    """
+    var_names = [name.replace(' ', '_') for name in snapshot['var_names']]
+    constr_names = [name.replace(' ', '_') for name in snapshot['constr_names']]
+    A = snapshot['A']
+    row_types = {EQUAL: 'E', LESS_EQUAL: 'L', GREATER_EQUAL: 'G'}
+
+    lines = ['NAME {}'.format(snapshot['name'])]
+    if snapshot['maximize']:
+        lines.extend(['OBJSENSE', '    MAX'])
+    lines.append('ROWS')
+    lines.append(' N obj')
+    lines.extend(' {} {}'.format(row_types[sense], name)
+                 for sense, name in zip(snapshot['sense'], constr_names))
+
+    lines.append('COLUMNS')
+    integer = False
+    indptr, indices, data = A.indptr.tolist(), A.indices.tolist(), A.data.tolist()
+    for j, (name, obj, vtype) in enumerate(zip(var_names, snapshot['obj'].tolist(),
+                                               snapshot['vtype'])):
+        if (vtype != CONTINUOUS) != integer:
+            integer = not integer
+            lines.append("    MARKER 'MARKER' '{}'".format(
+                'INTORG' if integer else 'INTEND'))
+        if obj:
+            lines.append('    {} obj {!r}'.format(name, obj))
+        lines.extend('    {} {} {!r}'.format(name, constr_names[i], val)
+                     for i, val in zip(indices[indptr[j]:indptr[j + 1]],
+                                       data[indptr[j]:indptr[j + 1]]))
+    if integer:
+        lines.append("    MARKER 'MARKER' 'INTEND'")
+
+    lines.append('RHS')
+    lines.extend('    RHS {} {!r}'.format(name, rhs)
+                 for name, rhs in zip(constr_names, snapshot['rhs'].tolist()) if rhs)
+
+    lines.append('BOUNDS')
+    for name, lb, ub in zip(var_names, snapshot['lb'].tolist(), snapshot['ub'].tolist()):
+        if lb == ub:
+            lines.append(' FX BND {} {!r}'.format(name, lb))
+            continue
+        if lb == -np.inf:
+            lines.append(' MI BND {}'.format(name))
+        else:
+            lines.append(' LO BND {} {!r}'.format(name, lb))
+        if ub == np.inf:
+            lines.append(' PL BND {}'.format(name))
+        else:
+            lines.append(' UP BND {} {!r}'.format(name, ub))
+    lines.append('ENDATA\n')
+
+    open_file = gzip.open if file_name.endswith('.gz') else open
+    with open_file(file_name, 'wt') as f:
+        f.write('\n'.join(lines))
+
+
+BACKENDS = {'gurobi': GurobiBackend, 'highs': HighsBackend}
+
+
+def create_backend(solver, name):
+    """Create an empty model for the chosen solver
+
+    Attributes:
+        solver : name of the solver, one of BACKENDS (e.g., gurobi, highs)
+        name : name of the model
+    """
+    return BACKENDS[solver](name)
@@ -0,0 +1,11 @@
+# The modules of final/ import each other by name, as when main.py is run
+# from final/
+
+import os
+import sys
+
+FINAL_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+
+if FINAL_DIR not in sys.path:
+    sys.path.insert(0, FINAL_DIR)
@@ -0,0 +1,52 @@
+import os
+
+import pytest
+
+from conftest import DATA_DIR
+from columnGeneration import *
+from xmlParser import *
+
+TIMETABLE = os.path.join(DATA_DIR, 'dw30.xml')
+
+
+@pytest.fixture(scope='module')
+def event_graph():
+    edges, all_stations = extract_edges_from_timetable(TIMETABLE, 'Mon')
+    return construct_time_expanded_graph(edges, 'Mon')
+
+
+def price(event_graph, start_window=None):
+    adjacency = (event_graph.time.tolist(), event_graph.head.tolist(),
+                 event_graph.out_ptr.tolist(), event_graph.out_arcs.tolist())
+    return price_duties(event_graph, adjacency, 'RW', 8,
+                        event_graph.travel_time.astype(float).tolist(),
+                        max_duties=100, start_window=start_window)
+
+
+def duty_times(event_graph, duty):
+    return (int(event_graph.time[event_graph.tail[duty[0]]]),
+            int(event_graph.time[event_graph.head[duty[-1]]]))
+
+
+def test_duties_return_to_the_base_within_the_working_hours(event_graph):
+    rw = event_graph.stations.index('RW')
+    duties = price(event_graph)
+    assert duties
+    for weight, duty in duties:
+        start, end = duty_times(event_graph, duty)
+        assert event_graph.station[event_graph.tail[duty[0]]] == rw
+        assert event_graph.station[event_graph.head[duty[-1]]] == rw
+        assert end - start <= 8 * HOUR_TO_MINUTES
+
+
+@pytest.mark.parametrize('start_window', [(431, 491), (491, 551)])
+def test_start_window_only_restricts_the_start_events(event_graph, start_window):
+    duties = price(event_graph, start_window)
+    assert duties
+    for weight, duty in duties:
+        start, end = duty_times(event_graph, duty)
+        assert start_window[0] <= start < start_window[1]
+
+    # the duties are not cut to the one hour of the window
+    assert max(end - start for start, end in (
+        duty_times(event_graph, duty) for weight, duty in duties)) > 60
@@ -0,0 +1,62 @@
+import os
+import shutil
+
+import edgeCache
+from conftest import DATA_DIR
+from edgeCache import *
+
+TIMETABLE = os.path.join(DATA_DIR, 'dw30.xml')
+
+
+def test_saved_edges_load_back(tmp_path):
+    all_edges, stations = extract_edges_from_timetable(TIMETABLE, 'Mon')
+    file_name = str(tmp_path / 'edges.npz')
+    save_edges(file_name, all_edges, stations)
+    assert load_edges(file_name) == (all_edges, list(stations))
+    assert not os.path.exists(file_name + '.tmp')
+
+
+def test_no_edges_load_back(tmp_path):
+    file_name = str(tmp_path / 'edges.npz')
+    save_edges(file_name, [], [])
+    assert load_edges(file_name) == ([], [])
+
+
+def test_second_extraction_is_read_from_cache(tmp_path, capsys):
+    cache_dir = str(tmp_path / 'cache')
+    extracted = extract_edges_with_cache(TIMETABLE, 'Mon', cache_dir)
+    assert 'from cache' not in capsys.readouterr().out
+    assert os.path.isfile(cache_file_name(TIMETABLE, 'Mon', cache_dir))
+
+    cached = extract_edges_with_cache(TIMETABLE, 'Mon', cache_dir)
+    assert 'from cache' in capsys.readouterr().out
+    assert cached == (extracted[0], list(extracted[1]))
+
+    extract_edges_with_cache(TIMETABLE, 'Tue', cache_dir)
+    assert 'from cache' not in capsys.readouterr().out
+
+
+def test_changed_timetable_is_extracted_again(tmp_path, capsys):
+    cache_dir = str(tmp_path / 'cache')
+    timetable = str(tmp_path / 'timetable.xml')
+    shutil.copy(TIMETABLE, timetable)
+    extract_edges_with_cache(timetable, 'Mon', cache_dir)
+
+    with open(timetable) as f:
+        content = f.read()
+    with open(timetable, 'w') as f:
+        f.write(content.replace('Passagiere="', 'Passagiere="1', 1))
+    capsys.readouterr()
+    extract_edges_with_cache(timetable, 'Mon', cache_dir)
+    assert 'from cache' not in capsys.readouterr().out
+    assert len(os.listdir(cache_dir)) == 2
+
+
+def test_new_parser_version_is_extracted_again(tmp_path, capsys, monkeypatch):
+    cache_dir = str(tmp_path / 'cache')
+    extract_edges_with_cache(TIMETABLE, 'Mon', cache_dir)
+    monkeypatch.setattr(edgeCache, 'PARSER_VERSION', edgeCache.PARSER_VERSION + 1)
+    capsys.readouterr()
+    extract_edges_with_cache(TIMETABLE, 'Mon', cache_dir)
+    assert 'from cache' not in capsys.readouterr().out
+    assert len(os.listdir(cache_dir)) == 2
@@ -0,0 +1,32 @@
+from conftest import DATA_DIR
+from eventTime import *
+
+
+def test_to_minutes_counts_from_monday():
+    assert to_minutes('Mon00:00:00') == 0
+    assert to_minutes('Mon19:53:00') == 19 * 60 + 53
+    assert to_minutes('Tue00:00:00') == MINUTES_PER_DAY
+    assert to_minutes('Sun23:59:00') == MINUTES_PER_WEEK - 1
+
+
+def test_to_minutes_wraps_days_before_first_day():
+    assert to_minutes('Sun23:50:00', 'Sun') == 6 * MINUTES_PER_DAY + 23 * 60 + 50
+    assert to_minutes('Mon00:20:00', 'Sun') == MINUTES_PER_WEEK + 20
+    assert to_minutes('Sat10:00:00', 'Sun') == MINUTES_PER_WEEK + 5 * MINUTES_PER_DAY + 600
+    assert to_minutes('Mon00:20:00', 'Sun') > to_minutes('Sun23:50:00', 'Sun')
+    assert to_minutes('Wed08:00:00', 'Wed') == to_minutes('Wed08:00:00')
+
+
+def test_day_of_wraps_the_week():
+    assert day_of(0) == 'Mon'
+    assert day_of(MINUTES_PER_DAY - 1) == 'Mon'
+    assert day_of(6 * MINUTES_PER_DAY) == 'Sun'
+    assert day_of(MINUTES_PER_WEEK + 20) == 'Mon'
+
+
+def test_to_timestamp_inverts_to_minutes():
+    for day in DAYS:
+        for clock in ('00:00:00', '07:05:00', '23:59:00'):
+            timestamp = day + clock
+            assert to_timestamp(to_minutes(timestamp)) == timestamp
+            assert to_timestamp(to_minutes(timestamp, 'Sun')) == timestamp
@@ -0,0 +1,75 @@
+import highspy
+import pytest
+
+from modelExport import *
+
+
+@pytest.fixture
+def model():
+    # max x + y with x + y <= 1 and x <= y
+    model = HighsBackend("EXPORT")
+    x = model.add_vars(['x', 'y'], lb=0, ub=1, obj=1, vtype=BINARY, name='x')
+    model.add_constr([x['x'], x['y']], [1, 1], LESS_EQUAL, 1, 'capacity')
+    model.add_constr([x['x'], x['y']], [1, -1], LESS_EQUAL, 0, 'order')
+    model.set_maximize()
+    return model
+
+
+def read_model(file_name):
+    """Row upper bounds and number of columns of a model file read by HiGHS"""
+    highs = highspy.Highs()
+    highs.setOptionValue('output_flag', False)
+    assert highs.readModel(str(file_name)) == highspy.HighsStatus.kOk
+    lp = highs.getLp()
+    return list(lp.row_upper_), lp.num_col_
+
+
+def export_iterations(exporter, model, iterations):
+    for iteration in range(1, iterations + 1):
+        exporter.export(model, "gurobi_model_{}".format(iteration), iteration)
+    exporter.export_final(model, "Scheduling")
+    exporter.close()
+
+
+def test_off_writes_nothing(tmp_path, monkeypatch, model):
+    monkeypatch.chdir(tmp_path)
+    export_iterations(ModelExporter(OFF), model, 3)
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_final_only_writes_the_final_model(tmp_path, monkeypatch, model):
+    monkeypatch.chdir(tmp_path)
+    export_iterations(ModelExporter(FINAL, compressed=True), model, 3)
+    assert sorted(f.name for f in tmp_path.iterdir()) == ['Scheduling.mps.gz']
+    assert read_model(tmp_path / 'Scheduling.mps.gz') == ([1, 0], 2)
+
+
+def test_every_n_writes_every_nth_iteration(tmp_path, monkeypatch, model):
+    monkeypatch.chdir(tmp_path)
+    export_iterations(ModelExporter('every-2', compressed=True), model, 5)
+    assert sorted(f.name for f in tmp_path.iterdir()) == [
+        'Scheduling.mps.gz', 'gurobi_model_2.mps.gz', 'gurobi_model_4.mps.gz']
+
+
+def test_async_writes_the_model_as_it_was_exported(tmp_path, monkeypatch, capsys, model):
+    monkeypatch.chdir(tmp_path)
+    exporter = ModelExporter(ASYNC)
+    assert exporter.extension == '.mps'
+    assert 'exported as .mps files' in capsys.readouterr().out
+
+    exporter.export(model, "gurobi_model_1", 1)
+    # the model changes while (or before) the snapshot is written
+    model.set_rhs('capacity', 2)
+    model.add_vars(['z'], lb=0, ub=1, obj=1, vtype=BINARY, name='x')
+    exporter.close()
+    assert read_model(tmp_path / 'gurobi_model_1.mps') == ([1, 0], 2)
+
+    exporter.export_final(model, "Scheduling")
+    exporter.close()
+    assert read_model(tmp_path / 'Scheduling.mps') == ([2, 0], 3)
+
+
+def test_unknown_policy_is_rejected():
+    for policy in ('sometimes', 'every-0'):
+        with pytest.raises(CLArgumentsNotMatch):
+            ModelExporter(policy)
@@ -0,0 +1,77 @@
+import os
+
+import numpy as np
+import pytest
+
+from conftest import DATA_DIR
+from xmlParser import *
+from graph import *
+from odMatrix import *
+
+TIMETABLE = os.path.join(DATA_DIR, 'dw30.xml')
+
+
+def event_graph_of(day):
+    edges, all_stations = extract_edges_from_timetable(TIMETABLE, day)
+    return construct_time_expanded_graph(edges, day)
+
+
+@pytest.fixture(scope='module')
+def estimated():
+    event_graph = event_graph_of('Mon')
+    return event_graph, generate_OD_matrix(event_graph, create_arc_paths(event_graph))
+
+
+def test_memmap_npz_matches_np_load(tmp_path):
+    arrays = {'ints': np.arange(10, dtype=np.int32),
+              'matrix': np.asfortranarray(np.arange(12.0).reshape(3, 4)),
+              'scalar': np.array(7),
+              'text': np.array('a8f3'),
+              'empty': np.zeros(0, dtype=np.int64)}
+    for save in (np.savez, np.savez_compressed):
+        file_name = str(tmp_path / 'arrays.npz')
+        save(file_name, **arrays)
+        data = memmap_npz(file_name)
+        assert sorted(data) == sorted(arrays)
+        for name, array in arrays.items():
+            assert data[name].dtype == array.dtype
+            assert data[name].shape == array.shape
+            assert (data[name] == array).all()
+        if save is np.savez:
+            assert isinstance(data['ints'], np.memmap)
+
+
+def test_saved_od_loads_back(tmp_path, estimated):
+    event_graph, OD = estimated
+    file_name = str(tmp_path / 'od.npz')
+    save_od(OD, event_graph, file_name)
+    loaded = load_od(file_name, event_graph)
+
+    for name in ('sources', 'sinks', 'indptr', 'arc_ids'):
+        assert (getattr(loaded.path_store, name) == getattr(OD.path_store, name)).all()
+    assert isinstance(loaded.counts, np.memmap)
+    assert len(loaded) == len(OD)
+    assert list(loaded) == list(OD)
+    for od, count in OD.items():
+        assert loaded[od] == pytest.approx(count, rel=1e-6)
+
+
+def test_od_of_another_graph_is_rejected(tmp_path, estimated):
+    event_graph, OD = estimated
+    file_name = str(tmp_path / 'od.npz')
+    save_od(OD, event_graph, file_name)
+    with pytest.raises(ODMatrixMismatch):
+        load_od(file_name, event_graph_of('Sat'))
+
+
+def test_od_with_another_journey_limit_is_rejected(tmp_path, estimated):
+    event_graph, OD = estimated
+    file_name = str(tmp_path / 'od.npz')
+    save_od(OD, event_graph, file_name)
+    with pytest.raises(ODMatrixMismatch):
+        load_od(file_name, event_graph, 60)
+
+    save_od(OD, event_graph, file_name, 60)
+    assert len(load_od(file_name, event_graph, 60)) == len(OD)
+    with pytest.raises(ODMatrixMismatch):
+        load_od(file_name, event_graph)
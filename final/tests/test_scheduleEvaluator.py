@@ -0,0 +1,66 @@
+import os
+
+import pytest
+
+from conftest import DATA_DIR
+from scheduleEvaluator import *
+from dutyHeuristic import *
+
+TIMETABLE = os.path.join(DATA_DIR, 'dw30.xml')
+INSPECTORS = os.path.join(DATA_DIR, 'insp6.csv')
+
+
+@pytest.fixture(scope='module')
+def timetable():
+    edges, all_stations = extract_edges_from_timetable(TIMETABLE, 'Mon')
+    event_graph = construct_time_expanded_graph(edges, 'Mon')
+    OD = generate_OD_matrix(event_graph, create_arc_paths(event_graph))
+    return event_graph, OD, all_stations
+
+
+@pytest.fixture
+def schedule(timetable, tmp_path, monkeypatch):
+    event_graph, OD, all_stations = timetable
+    monkeypatch.chdir(tmp_path)
+    inspectors = extract_inspectors_data(INSPECTORS, all_stations)
+    greedy_duty_schedules(event_graph, OD.path_store, OD, inspectors, 4)
+    return read_schedule(tmp_path / 'schedule_for_6_inspectors.csv')
+
+
+def test_evaluate_read_schedule(timetable, schedule):
+    event_graph, OD, all_stations = timetable
+    evaluator = ScheduleEvaluator(event_graph, OD.path_store, OD)
+    assert 0 < evaluator.evaluate(schedule) <= evaluator.total_passengers()
+
+
+def test_empty_schedule_inspects_nobody(timetable):
+    event_graph, OD, all_stations = timetable
+    evaluator = ScheduleEvaluator(event_graph, OD.path_store, OD)
+    assert evaluator.evaluate(pd.DataFrame(columns=SCHEDULE_COLUMNS)) == 0
+
+
+def test_working_hours_violations_are_reported(timetable, schedule):
+    event_graph, OD, all_stations = timetable
+    evaluator = ScheduleEvaluator(event_graph, OD.path_store, OD)
+    inspectors = extract_inspectors_data(INSPECTORS, all_stations)
+    assert evaluator.working_hours_violations(schedule, inspectors) == []
+
+    for vals in inspectors.values():
+        vals['working_hours'] = 1
+    violations = evaluator.working_hours_violations(schedule, inspectors)
+    assert sorted(k for k, minutes, hours in violations) == \
+        sorted(schedule['inspector_id'].unique())
+    assert all(minutes > 60 for k, minutes, hours in violations)
+
+
+def test_base_violations_are_reported(timetable, schedule):
+    event_graph, OD, all_stations = timetable
+    evaluator = ScheduleEvaluator(event_graph, OD.path_store, OD)
+    inspectors = extract_inspectors_data(INSPECTORS, all_stations)
+    assert evaluator.base_violations(schedule, inspectors) == []
+
+    k = schedule['inspector_id'].iloc[0]
+    base = inspectors[k]['base']
+    inspectors[k]['base'] = next(s for s in all_stations if s != base)
+    assert evaluator.base_violations(schedule, inspectors) == \
+        [(k, base, inspectors[k]['base'])]
@@ -0,0 +1,114 @@
+import os
+import re
+
+import pytest
+
+from conftest import DATA_DIR
+from scheduleEvaluator import *
+import main  # after the star import, which has a main function too
+
+TIMETABLE = os.path.join(DATA_DIR, 'dw30.xml')
+INSPECTORS = os.path.join(DATA_DIR, 'insp6.csv')
+
+# objectives are printed with 3 decimals
+TOLERANCE = 1e-3
+
+
+@pytest.fixture(scope='module')
+def evaluator():
+    edges, all_stations = extract_edges_from_timetable(TIMETABLE, 'Mon')
+    event_graph = construct_time_expanded_graph(edges, 'Mon')
+    OD = generate_OD_matrix(event_graph, create_arc_paths(event_graph))
+    return ScheduleEvaluator(event_graph, OD.path_store, OD), all_stations
+
+
+def run_main(tmp_path, monkeypatch, capsys, max_num_inspectors, *options,
+             schedule_file='schedule_for_6_inspectors.csv'):
+    """Run main.py with HiGHS in tmp_path, and return its output and the
+    schedules it wrote"""
+    monkeypatch.chdir(tmp_path)
+    main.main([TIMETABLE, 'Mon', INSPECTORS, str(max_num_inspectors), '1', '0',
+               str(tmp_path / 'schedule.txt'), '--solver=highs', '--export=off'] +
+              list(options))
+    output = capsys.readouterr().out
+    return output, read_schedule(tmp_path / schedule_file)
+
+
+def printed_objective(output, pattern):
+    return float(re.findall(pattern, output)[-1])
+
+
+MIP_OBJECTIVE = r'HiGHS finished with status \w+ and objective ([-\d.e+]*\d)'
+SCHEDULES_OBJECTIVE = r'inspect ([\d.]+) passengers'
+LNS_OBJECTIVE = r'LNS improved the objective from [\d.]+ to ([\d.]+)'
+
+
+@pytest.mark.parametrize('max_num_inspectors, options, pattern', [
+    (4, [], MIP_OBJECTIVE),
+    (4, ['--depot-classes'], MIP_OBJECTIVE),
+    (6, ['--depot-classes'], MIP_OBJECTIVE),
+    (4, ['--column-generation'], SCHEDULES_OBJECTIVE),
+    (4, ['--greedy'], SCHEDULES_OBJECTIVE),
+    (4, ['--lagrangian'], SCHEDULES_OBJECTIVE),
+    (4, ['--rolling-horizon=4'], SCHEDULES_OBJECTIVE),
+    (4, ['--decompose=2'], SCHEDULES_OBJECTIVE),
+    (4, ['--greedy-start', '--lns=1'], LNS_OBJECTIVE),
+])
+def test_objective_matches_evaluator(tmp_path, monkeypatch, capsys, evaluator,
+                                     max_num_inspectors, options, pattern):
+    output, schedule = run_main(tmp_path, monkeypatch, capsys,
+                                max_num_inspectors, *options)
+    assert evaluator[0].evaluate(schedule) == pytest.approx(
+        printed_objective(output, pattern), abs=TOLERANCE)
+
+
+@pytest.mark.parametrize('max_num_inspectors, options', [
+    (4, []),
+    (4, ['--depot-classes']),
+    (6, ['--depot-classes']),
+    (4, ['--column-generation']),
+    (4, ['--greedy']),
+    (4, ['--lagrangian']),
+    (4, ['--rolling-horizon=4']),
+    (4, ['--decompose=2']),
+])
+def test_schedules_respect_working_hours(tmp_path, monkeypatch, capsys, evaluator,
+                                         max_num_inspectors, options):
+    output, schedule = run_main(tmp_path, monkeypatch, capsys,
+                                max_num_inspectors, *options)
+    schedule_evaluator, all_stations = evaluator
+    inspectors = extract_inspectors_data(INSPECTORS, all_stations)
+    assert schedule['inspector_id'].nunique() <= max_num_inspectors
+    assert schedule_evaluator.working_hours_violations(schedule, inspectors) == []
+    assert schedule_evaluator.base_violations(schedule, inspectors) == []
+
+
+def test_lagrangian_bound_is_an_upper_bound(tmp_path, monkeypatch, capsys):
+    output, schedule = run_main(tmp_path, monkeypatch, capsys, 4)
+    optimum = printed_objective(output, MIP_OBJECTIVE)
+
+    output, schedule = run_main(tmp_path, monkeypatch, capsys, 4, '--lagrangian')
+    bound, incumbent = map(float, re.findall(
+        r'Upper bound ([\d.]+), schedules inspect ([\d.]+) passengers', output)[-1])
+    assert bound >= optimum - TOLERANCE
+    assert optimum >= incumbent - TOLERANCE
+
+
+@pytest.mark.parametrize('options', [[], ['--heuristic-start']])
+def test_heuristic_fixes_the_known_inspectors(tmp_path, monkeypatch, capsys, evaluator,
+                                              options):
+    # the heuristic adds one inspector per iteration, with the schedules of
+    # the inspectors found before fixed through their bounds
+    output, schedule = run_main(tmp_path, monkeypatch, capsys, 4, '--heuristic',
+                                *options, schedule_file='schedule_for_4_inspectors.csv')
+    objectives = [float(objective) for objective in re.findall(MIP_OBJECTIVE, output)]
+    assert len(objectives) == 4
+    assert objectives == sorted(objectives)
+
+    schedule_evaluator, all_stations = evaluator
+    inspectors = extract_inspectors_data(INSPECTORS, all_stations)
+    assert schedule['inspector_id'].nunique() == 4
+    assert schedule_evaluator.evaluate(schedule) == pytest.approx(
+        objectives[-1], abs=TOLERANCE)
+    assert schedule_evaluator.working_hours_violations(schedule, inspectors) == []
+    assert schedule_evaluator.base_violations(schedule, inspectors) == []
@@ -0,0 +1,79 @@
+import os
+import xml.etree.ElementTree as ET
+
+from conftest import DATA_DIR
+from xmlParser import *
+from graph import *
+
+TIMETABLE = os.path.join(DATA_DIR, 'dw30.xml')
+
+
+def test_streamed_driving_edges_match_parsed_tree():
+    for day in DAYS:
+        parsed = []
+        create_driving_edges(ET.parse(TIMETABLE).getroot(), day, parsed)
+        assert list(stream_driving_edges(TIMETABLE, day)) == parsed
+
+
+def test_streamed_timetable_edges_match_parsed_tree():
+    for day in DAYS:
+        assert extract_edges_from_timetable(TIMETABLE, day, streaming=True) == \
+            extract_edges_from_timetable(TIMETABLE, day)
+
+
+OVERNIGHT_TIMETABLE = """<?xml version="1.0"?>
+<ROTOR><Trains>
+<Train TrainID_="1"><Trips>
+<Trip><Validity BitString="0000001"/><Stops>
+<Stop StationID="A" ArrivalTime="23:30:00" DepartureTime="23:40:00" Passagiere="100"/>
+<Stop StationID="B" ArrivalTime="23:55:00" DepartureTime="23:58:00" Passagiere="80"/>
+<Stop StationID="C" ArrivalTime="00:20:00" DepartureTime="00:21:00" Passagiere="60"/>
+</Stops></Trip>
+</Trips></Train>
+</Trains></ROTOR>
+"""
+
+
+def test_overnight_legs_arrive_on_the_following_day(tmp_path):
+    timetable = tmp_path / 'overnight.xml'
+    timetable.write_text(OVERNIGHT_TIMETABLE)
+    root = ET.parse(str(timetable)).getroot()
+
+    edges = []
+    create_driving_edges(root, 'Sun', edges)
+    assert edges == [('A', 'Sun23:40:00', 'B', 'Sun23:55:00', 100, 15),
+                     ('B', 'Sun23:58:00', 'C', 'Mon00:20:00', 80, 22)]
+
+    edges = []
+    create_driving_edges(root, 'Mon', edges)
+    assert edges == []  # the trip only starts on Sundays
+
+
+def test_overnight_events_keep_their_order(tmp_path):
+    timetable = tmp_path / 'overnight.xml'
+    timetable.write_text(OVERNIGHT_TIMETABLE)
+    edges, stations = extract_edges_from_timetable(str(timetable), 'Sun')
+    event_graph = construct_time_expanded_graph(edges, 'Sun')
+    times = {name: t for name, t in zip(event_graph.names, event_graph.time.tolist())}
+    assert times['C@Mon00:20:00'] == MINUTES_PER_WEEK + 20
+    assert times['C@Mon00:20:00'] > times['B@Sun23:58:00']
+    assert (event_graph.time[event_graph.head] > event_graph.time[event_graph.tail]).all()
+
+
+def test_edges_for_days_match_one_extraction_per_day():
+    for streaming in (False, True):
+        edges_for_days = extract_edges_for_days(TIMETABLE, DAYS, streaming)
+        assert list(edges_for_days) == DAYS
+        for day in DAYS:
+            edges, stations = edges_for_days[day]
+            single_edges, single_stations = extract_edges_from_timetable(TIMETABLE, day)
+            assert sorted(edges) == sorted(single_edges)
+            assert sorted(stations) == sorted(single_stations)
+
+
+def test_edges_for_days_keep_overnight_legs_of_each_day(tmp_path):
+    timetable = tmp_path / 'overnight.xml'
+    timetable.write_text(OVERNIGHT_TIMETABLE.replace('0000001', '1000001'))
+    edges_for_days = extract_edges_for_days(str(timetable), ['Mon', 'Sun'])
+    assert ('B', 'Mon23:58:00', 'C', 'Tue00:20:00', 80, 22) in edges_for_days['Mon'][0]
+    assert ('B', 'Sun23:58:00', 'C', 'Mon00:20:00', 80, 22) in edges_for_days['Sun'][0]
@@ -2,19 +2,17 @@
 # @author: Hai Nguyen
 
 import xml.etree.ElementTree as ET
-import datetime
 import sys
 import os
-import time
 
-from dateutil.parser import parse
-from datetime import datetime, timedelta
 from exceptions import *
-
-DAYS = ["Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun"]
+from eventTime import *
 
 FOLLOWING_DAY = dict(zip(DAYS, DAYS[1:] + DAYS[:1]))
 
+# bump whenever a change to the parser changes the extracted edges
+PARSER_VERSION = 1
+
 
 def create_driving_edges(xml_root, day, driving_edges):
     """ Generating all driving edges for the selected day
@@ -26,56 +24,128 @@ def create_driving_edges(xml_root, day, driving_edges):
         ice :  ice fleet
     """
     for train in xml_root.iter('Train'):
-        train_id = int(train.get('TrainID_'))
+        create_train_driving_edges(train, day, driving_edges)
+
+
+def create_train_driving_edges(train, day, driving_edges):
+    """ Generating the driving edges of a single train for the selected day
+
+    Attributes:
+        train           : 'Train' element of the xml tree
+        day             : a specific day of the week (Mon, Tue,...)
+        driving_edges   : list of driving edges
+    """
+    create_train_driving_edges_for_days(train, [day], {day: driving_edges})
+
+
+def create_train_driving_edges_for_days(train, days, driving_edges):
+    """ Generating the driving edges of a single train for several days,
+    reading each trip only once
 
-        for trip in train.iter('Trip'):
-            trip_validity = trip.find('Validity').get('BitString')
+    Attributes:
+        train           : 'Train' element of the xml tree
+        days            : list of days of the week (Mon, Tue,...)
+        driving_edges   : dictionary with days as keys and lists of driving edges as values
+    """
+    train_id = int(train.get('TrainID_'))
+
+    for trip in train.iter('Trip'):
+        trip_validity = trip.find('Validity').get('BitString')
 
-            if trip_validity[DAYS.index(day)] is not '1':
-                continue
+        trip_days = [day for day in days
+                     if trip_validity[DAYS.index(day)] == '1']
+        if not trip_days:
+            continue
 
-            is_next_day = False  # overnight or not?
+        # legs of the trip, with times in minutes from the start of its day
+        legs = []
+        day_start = 0  # moves to the next day once overnight
 
-            stop_list = list(trip.iter('Stop'))
+        stop_list = list(trip.iter('Stop'))
 
-            for i in range(1, len(stop_list)):
+        for i in range(1, len(stop_list)):
 
-                from_station = stop_list[i -
-                                         1].get('StationID').replace(" ", "")
-                departure_time = stop_list[i - 1].get('DepartureTime')
+            from_station = stop_list[i -
+                                     1].get('StationID').replace(" ", "")
+            departure_clock = stop_list[i - 1].get('DepartureTime')
 
-                to_station = stop_list[i].get('StationID').replace(" ", "")
-                arrival_time = stop_list[i].get('ArrivalTime')
+            to_station = stop_list[i].get('StationID').replace(" ", "")
+            arrival_clock = stop_list[i].get('ArrivalTime')
 
-                passenger_number = int(stop_list[i - 1].get('Passagiere'))
+            passenger_number = int(stop_list[i - 1].get('Passagiere'))
 
-                if departure_time > arrival_time:  # overnight
-                    is_next_day = True
-                    departure_time = day + departure_time
-                    arrival_time = FOLLOWING_DAY[day] + arrival_time
-                elif not is_next_day:
-                    departure_time = day + departure_time
-                    arrival_time = day + arrival_time
-                elif is_next_day:
-                    departure_time = FOLLOWING_DAY[day] + departure_time
-                    arrival_time = FOLLOWING_DAY[day] + arrival_time
+            departure = day_start + clock_to_minutes(departure_clock)
+            if departure_clock > arrival_clock:  # overnight
+                day_start += MINUTES_PER_DAY
+            arrival = day_start + clock_to_minutes(arrival_clock)
 
-                # calculating the travelling time (in minutes)
-                travel_time_seconds = (
-                    parse(arrival_time) - parse(departure_time)).seconds
-                travel_time_minutes = (travel_time_seconds % 3600) // 60
+            # calculating the travelling time (in minutes)
+            travel_time_minutes = (arrival - departure) % MINUTES_PER_HOUR
+
+            legs.append((from_station, departure, departure_clock, to_station,
+                         arrival, arrival_clock, passenger_number, travel_time_minutes))
+
+        for day in trip_days:
+            offset = DAY_OFFSETS[day]
+            for (from_station, departure, departure_clock, to_station,
+                 arrival, arrival_clock, passenger_number, travel_time_minutes) in legs:
+                departure_time = day_of(offset + departure) + departure_clock
+                arrival_time = day_of(offset + arrival) + arrival_clock
 
                 new_edge = tuple((from_station, departure_time, to_station,
                                   arrival_time, passenger_number, travel_time_minutes))
-                driving_edges.append(new_edge)
+                driving_edges[day].append(new_edge)
+
+
+def iter_trains(timetable):
+    """ Stream the 'Train' elements of the xml timetable one at a time
+
+    Each train is yielded once its closing tag has been read, and is cleared
+    and detached from its parent afterwards, so only one train is held in
+    memory at any time.
+
+    Attributes:
+        timetable : the xml timetable file
+    """
+    ancestors = []  # currently open elements, innermost last
+
+    for event, elem in ET.iterparse(timetable, events=('start', 'end')):
+        if event == 'start':
+            ancestors.append(elem)
+            continue
+
+        ancestors.pop()
+        if elem.tag != 'Train':
+            continue
+
+        yield elem
+
+        elem.clear()
+        if ancestors:
+            ancestors[-1].remove(elem)
+
+
+def stream_driving_edges(timetable, day):
+    """ Generate the driving edges for the selected day, one train at a time,
+    without loading the whole xml tree into memory
+
+    Attributes:
+        timetable : the xml timetable file
+        day       : a specific day of the week (Mon, Tue,...)
+    """
+    for train in iter_trains(timetable):
+        train_edges = []
+        create_train_driving_edges(train, day, train_edges)
+        yield from train_edges
 
 
-def create_list_of_events(driving_edges, events):
+def create_list_of_events(driving_edges, events, first_day='Mon'):
     """ Create list of events
 
     Attributes:
         driving_edges   : list of driving edges
         events          : dictionary with stations as keys and list of timestamps as values
+        first_day       : day the timestamps are ordered from (e.g., Mon, Tue, etc)
     """
     for edge in driving_edges:
         for indx in [0, 2]:
@@ -88,12 +158,12 @@ def create_list_of_events(driving_edges, events):
     for station in events:
         unduplicate_timestamps = list(set(events[station]))
         events[station] = sorted(
-            unduplicate_timestamps, key=timestamp_to_seconds)
+            unduplicate_timestamps, key=lambda t: to_minutes(t, first_day))
 
 
 def timestamp_to_seconds(timestamp):
-    """Convert timestamp into seconds"""
-    return time.mktime(parse(timestamp).timetuple())
+    """Convert timestamp into seconds (since Monday 00:00)"""
+    return to_minutes(timestamp) * 60
 
 
 def create_waiting_edges(waiting_edges, events):
@@ -105,48 +175,75 @@ def create_waiting_edges(waiting_edges, events):
     """
     for station, timestamps in events.items():
         for i in range(len(timestamps) - 1):
-            travel_time_seconds = (
-                parse(timestamps[i + 1]) - parse(timestamps[i])).seconds
-            travel_time_minutes = (travel_time_seconds % 3600) // 60
+            travel_time_minutes = (to_minutes(
+                timestamps[i + 1]) - to_minutes(timestamps[i])) % MINUTES_PER_HOUR
             new_edge = tuple(
                 (station, timestamps[i], station, timestamps[i + 1], 0, travel_time_minutes))
             waiting_edges.add(new_edge)
 
 
-def extract_edges_from_timetable(timetable, chosen_day):
+def extract_edges_from_timetable(timetable, chosen_day, streaming=False):
     """Create list of driving and waiting arcs from the xml timetable file
     to construct the time-extended graph
 
     Attributes:
         timetable : the xml timetable file
         chosen_day : day chosen to produce inspection shedule (e.g., Mon, Tue, etc)
+        streaming : read the timetable one train at a time (for large files)
 
     Return a list of 6-tuples
         (from_station, departure_time, to_station, arrival_time, passenger_number, travel_time)
     """
+    return extract_edges_for_days(timetable, [chosen_day], streaming)[chosen_day]
+
+
+def extract_edges_for_days(timetable, days, streaming=False):
+    """Create lists of driving and waiting arcs for several days from a single
+    read of the xml timetable file
+
+    Attributes:
+        timetable : the xml timetable file
+        days : days to produce inspection shedules for (e.g., ['Mon', 'Tue'])
+        streaming : read the timetable one train at a time (for large files)
+
+    Return a dictionary with days as keys and (all_edges, stations) as values,
+    where all_edges is the list of 6-tuples for that day
+    """
     try:
         print('Extracting waiting and driving arcs from timetable...', end=' ')
 
-        driving_edges = list()
-        waiting_edges = set()  # to avoid duplicate
+        driving_edges = {day: list() for day in days}
+
+        if streaming:
+            trains = iter_trains(timetable)
+        else:
+            tree = ET.parse(timetable)
+            trains = tree.getroot().iter('Train')
+
+        for train in trains:
+            create_train_driving_edges_for_days(train, days, driving_edges)
+
+        edges_for_days = dict()
+
+        for day in days:
+            waiting_edges = set()  # to avoid duplicate
 
-        # dictionary with station as keys and list of timestamps as values
-        events = dict()
+            # dictionary with station as keys and list of timestamps as values
+            events = dict()
 
-        tree = ET.parse(timetable)
-        root = tree.getroot()
+            create_list_of_events(driving_edges[day], events, day)
+            create_waiting_edges(waiting_edges, events)
 
-        create_driving_edges(root, chosen_day, driving_edges)
-        create_list_of_events(driving_edges, events)
-        create_waiting_edges(waiting_edges, events)
+            print('{}: {} driving arcs and {} waiting arcs'.format(
+                day, len(driving_edges[day]), len(waiting_edges)), end='; ')
 
-        print('{} driving arcs and {} waiting arcs'.format(
-            len(driving_edges), len(waiting_edges)))
+            all_edges = driving_edges[day] + list(waiting_edges)
+            stations = events.keys()
 
-        all_edges = driving_edges + list(waiting_edges)
-        stations = events.keys()
+            edges_for_days[day] = all_edges, stations
 
-        return all_edges, stations
+        print('Done')
+        return edges_for_days
 
     except ET.ParseError as error:
         print(error)
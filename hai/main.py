@@ -120,7 +120,7 @@ def main(argv):
 
         solution = print_solution_paths(inspectors, x)
         obj_val = float(model.objVal)
-        denominator = float(sum(OD.values())(OD))
+        denominator = float(sum(OD.values()))
         print("Approximate number of people in the system: {}".format(denominator))
         percentage = obj_val/denominator*100
         print("Approximate percentage of people inspected today: {}%".format(percentage))
@@ -188,7 +188,7 @@ def heuristic_solver(timetable_file, chosen_day, inspectors_file, schedule_file_
     # write Solution:
     solution = print_solution_paths(inspectors, x)
     obj_val = float(model.objVal)
-    denominator = float(sum(OD.values())(OD))
+    denominator = float(sum(OD.values()))
     print("Approximate number of people in the system: {}".format(denominator))
     percentage = obj_val/denominator*100
     print("Approximate percentage of people inspected today: {}%".format(percentage))